@@ -0,0 +1,123 @@
+"""Throughput of per-item vs bulk car availability and rental status updates.
+
+Runs car-service and rental-service in-process over ``httpx.ASGITransport`` on
+throwaway databases (the same setup as ``harness.py --backends local``). Each
+operation first touches ``--items`` UIDs one request per UID with
+``--concurrency`` requests in flight, then again through the bulk endpoint
+with ``--batch`` UIDs per request. The operations are reserve and release on
+car-service, and finish on rental-service. Output is JSON with the seconds,
+items per second and speedup for each operation.
+
+    PYTHONPATH=src python benchmarks/bench_bulk_updates.py \\
+        --dsn-base postgresql://postgres@localhost:5432 --items 2000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+
+import httpx
+
+from harness import SRC, ThrowawayDatabases, git_commit, load_service
+
+USERNAME = "bench"
+
+
+async def per_item(client: httpx.AsyncClient, method: str, paths: list, concurrency: int) -> float:
+    remaining = iter(paths)
+
+    async def worker():
+        for path in remaining:
+            response = await client.request(method, path)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def bulk(client: httpx.AsyncClient, method: str, path: str, key: str, uids: list, batch: int) -> float:
+    started = time.perf_counter()
+    for i in range(0, len(uids), batch):
+        response = await client.request(method, path, json={key: uids[i:i + batch]})
+        response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def summarize(items: int, per_item_seconds: float, bulk_seconds: float) -> dict:
+    return {
+        "perItem": {"seconds": round(per_item_seconds, 3), "itemsPerSecond": round(items / per_item_seconds, 1)},
+        "bulk": {"seconds": round(bulk_seconds, 3), "itemsPerSecond": round(items / bulk_seconds, 1)},
+        "speedup": round(per_item_seconds / bulk_seconds, 2),
+    }
+
+
+async def run(args) -> dict:
+    from auth_service.auth import get_current_user
+    from database.migrations import migrate
+
+    async with ThrowawayDatabases(args.dsn_base, args.items) as urls:
+        cars = load_service("car-service", "bench_cars", urls["cars"])
+        rentals = load_service("rental-service", "bench_rentals", urls["rentals"])
+        for service in (cars, rentals):
+            service.app.dependency_overrides[get_current_user] = lambda: USERNAME
+            await migrate(service.db_pool, service.MIGRATIONS_DIR)
+        try:
+            car_uids = [str(r[0]) for r in await cars.db_pool.fetch("SELECT car_uid FROM cars ORDER BY id")]
+            rental_uids = [uuid.uuid4() for _ in car_uids]
+            await rentals.db_pool.execute("""
+                INSERT INTO rental (rental_uid, username, payment_uid, car_uid, date_from, date_to, status)
+                SELECT rental_uid, $2, rental_uid, car_uid, DATE '2024-01-01', DATE '2024-01-03', 'IN_PROGRESS'
+                FROM unnest($1::uuid[], $3::uuid[]) AS u(rental_uid, car_uid)
+            """, rental_uids, USERNAME, car_uids)
+            rental_uids = [str(u) for u in rental_uids]
+
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=cars.app), base_url="http://cars") as c, \
+                    httpx.AsyncClient(transport=httpx.ASGITransport(app=rentals.app), base_url="http://rental") as r:
+                result = {}
+                for action in ("reserve", "release"):
+                    single = await per_item(c, "PUT", [f"/api/v1/cars/{u}/{action}" for u in car_uids],
+                                            args.concurrency)
+                    # Undo the per-item pass so the bulk pass does the same work
+                    await cars.db_pool.execute("UPDATE cars SET availability = $1", action == "reserve")
+                    batched = await bulk(c, "PUT", f"/api/v1/cars/{action}", "carUids", car_uids, args.batch)
+                    result[action] = summarize(len(car_uids), single, batched)
+
+                single = await per_item(r, "POST", [f"/api/v1/rental/{u}/finish" for u in rental_uids],
+                                        args.concurrency)
+                await rentals.db_pool.execute("UPDATE rental SET status = 'IN_PROGRESS'")
+                await rentals.db_pool.execute("DELETE FROM rental_outbox")
+                batched = await bulk(r, "POST", "/api/v1/rental/finish", "rentalUids", rental_uids, args.batch)
+                result["finish"] = summarize(len(rental_uids), single, batched)
+                result["outboxRows"] = await rentals.db_pool.fetchval("SELECT count(*) FROM rental_outbox")
+        finally:
+            for service in (cars, rentals):
+                await service.db_pool.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn-base", help="superuser DSN without a database name; pgserver is used if omitted")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=500, help="UIDs per bulk request (services cap this at 500)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--out", help="also write the JSON result to this file")
+    args = parser.parse_args()
+    sys.path.insert(0, SRC)
+
+    result = {
+        "meta": {"commit": git_commit(), "items": args.items, "batch": args.batch, "concurrency": args.concurrency},
+        **asyncio.run(run(args)),
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Latency of GET /api/v1/rental aggregation as a function of rental count.
+
+Compares the old serial loop (1 + 2N upstream round trips) with the batched
+fan-out in gateway ``aggregate_rentals``. Upstreams are in-process stubs with a
+fixed per-call latency, so the numbers isolate the round-trip structure.
+
+    PYTHONPATH=src:src/gateway python benchmarks/bench_rental_fanout.py
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+import main as gateway
+from upstream import Upstream, UpstreamConfig
+
+AUTH = {"Authorization": "Bearer bench"}
+
+
+def make_stub(latency: float, cars: dict, payments: dict):
+    calls = {"count": 0}
+
+    async def handler(request: httpx.Request):
+        calls["count"] += 1
+        await asyncio.sleep(latency)
+        path = request.url.path
+        uids = request.url.params.get("uids")
+        if path == "/api/v1/cars" and uids is not None:
+            items = [cars[u] for u in uids.split(",") if u in cars]
+            return httpx.Response(200, json={"page": 1, "pageSize": len(items), "totalElements": len(items), "items": items})
+        if path.startswith("/api/v1/cars/"):
+            return httpx.Response(200, json=cars[path.rsplit("/", 1)[1]])
+        if path == "/api/v1/payment":
+            return httpx.Response(200, json=[payments[u] for u in uids.split(",") if u in payments])
+        if path.startswith("/api/v1/payment/"):
+            return httpx.Response(200, json=payments[path.rsplit("/", 1)[1]])
+        return httpx.Response(404, json={"message": "not found"})
+
+    return handler, calls
+
+
+def make_rentals(n: int):
+    cars, payments, rentals = {}, {}, []
+    for _ in range(n):
+        car_uid, payment_uid = str(uuid.uuid4()), str(uuid.uuid4())
+        cars[car_uid] = {"carUid": car_uid, "brand": "Mercedes Benz", "model": "GLA 250",
+                         "registrationNumber": "ЛО777Х799", "power": 249, "price": 3500,
+                         "type": "SEDAN", "available": False}
+        payments[payment_uid] = {"paymentUid": payment_uid, "status": "PAID", "price": 3500}
+        rentals.append({"rentalUid": str(uuid.uuid4()), "carUid": car_uid, "paymentUid": payment_uid,
+                        "dateFrom": "2024-01-01", "dateTo": "2024-01-02", "status": "IN_PROGRESS"})
+    return rentals, cars, payments
+
+
+async def serial_aggregate(rentals: list, auth: dict):
+    aggregated = []
+    for rental in rentals:
+        car = await gateway.call_get_car(rental["carUid"], auth)
+        payment = await gateway.call_get_payment(rental["paymentUid"], auth)
+        aggregated.append({"rental": rental, "car": car, "payment": payment})
+    return aggregated
+
+
+def install_stubs(handler):
+    transport = httpx.MockTransport(handler)
+    gateway.cars_upstream = Upstream(UpstreamConfig("cars", "http://cars.bench"), transport=transport)
+    gateway.payment_upstream = Upstream(UpstreamConfig("payment", "http://payment.bench"), transport=transport)
+
+
+async def measure(fn, rentals, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        gateway.car_cache.clear()
+        started = time.perf_counter()
+        await fn(rentals, AUTH)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+async def run(sizes, latency: float, repeat: int):
+    results = []
+    for n in sizes:
+        rentals, cars, payments = make_rentals(n)
+        handler, calls = make_stub(latency, cars, payments)
+        install_stubs(handler)
+        row = {"rentals": n}
+        for label, fn in (("serial", serial_aggregate), ("fanout", gateway.aggregate_rentals)):
+            calls["count"] = 0
+            row[f"{label}_p50_ms"] = round(await measure(fn, rentals, repeat), 2)
+            row[f"{label}_upstream_calls"] = calls["count"] // repeat
+        results.append(row)
+        await gateway.cars_upstream.aclose()
+        await gateway.payment_upstream.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,5,10,25,50,100")
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print machine-readable output")
+    args = parser.parse_args()
+    sizes = [int(n) for n in args.sizes.split(",")]
+    results = asyncio.run(run(sizes, args.latency_ms / 1000, args.repeat))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'N':>5} {'serial ms':>10} {'calls':>6} {'fanout ms':>10} {'calls':>6}")
+    for row in results:
+        print(f"{row['rentals']:>5} {row['serial_p50_ms']:>10} {row['serial_upstream_calls']:>6} "
+              f"{row['fanout_p50_ms']:>10} {row['fanout_upstream_calls']:>6}")
+
+
+if __name__ == "__main__":
+    main()
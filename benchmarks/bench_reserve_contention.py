@@ -0,0 +1,124 @@
+"""Wasted work when many clients book the same car at once.
+
+Fires ``--clients`` concurrent POST /api/v1/rental requests for one car at the
+gateway and counts payment/rental inserts and compensations. ``reserve-last``
+replays the old order (payment -> rental -> reserve) against a car-service
+that already has the compare-and-set reserve, so losers are only caught at
+the end; ``reserve-first`` is the current ``create_rental`` saga. Upstreams
+are in-process stubs with a fixed per-call latency.
+
+    PYTHONPATH=src:src/gateway python benchmarks/bench_reserve_contention.py
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+import main as gateway
+from auth_service.auth import get_current_user
+from saga_store import MemorySagaStore
+from upstream import Upstream, UpstreamConfig
+
+CAR_UID = str(uuid.uuid4())
+AUTH = {"Authorization": "Bearer bench"}
+BODY = {"carUid": CAR_UID, "dateFrom": "2024-01-01", "dateTo": "2024-01-03"}
+
+
+def make_stub(latency: float):
+    state = {"available": True}
+    calls = Counter()
+
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(latency)
+        path, method = request.url.path, request.method
+        if path.endswith("/reserve"):
+            calls["reserve"] += 1
+            if not state["available"]:
+                return httpx.Response(409, json={"detail": "Car is already reserved"})
+            state["available"] = False
+            return httpx.Response(200, json={"status": "reserved"})
+        if path.endswith("/release"):
+            calls["release"] += 1
+            state["available"] = True
+            return httpx.Response(200, json={"status": "released"})
+        if path.startswith("/api/v1/cars/"):
+            return httpx.Response(200, json={"carUid": CAR_UID, "brand": "Mercedes Benz", "model": "GLA 250",
+                                             "registrationNumber": "ЛО777Х799", "price": 3500})
+        if path == "/api/v1/payment" and method == "POST":
+            calls["payment_insert"] += 1
+            return httpx.Response(200, json={"paymentUid": str(uuid.uuid4()), "status": "PAID", "price": 7000})
+        if path == "/api/v1/rental" and method == "POST":
+            calls["rental_insert"] += 1
+            return httpx.Response(200, json={"rentalUid": str(uuid.uuid4())})
+        if method == "DELETE":
+            calls["payment_cancel" if "/payment/" in path else "rental_cancel"] += 1
+            return httpx.Response(200, json={})
+        return httpx.Response(404, json={"message": "not found"})
+
+    return handler, calls
+
+
+def install(handler):
+    transport = httpx.MockTransport(handler)
+    for name in ("cars_upstream", "rental_upstream", "payment_upstream"):
+        setattr(gateway, name, Upstream(UpstreamConfig(name, f"http://{name}.bench"), transport=transport))
+    gateway.saga_store = MemorySagaStore()
+    gateway.car_cache.clear()
+
+
+async def reserve_last(client: httpx.AsyncClient):
+    payment = await gateway.call_create_payment(7000, AUTH)
+    rental = await gateway.call_create_rental({**BODY, "paymentUid": payment["paymentUid"]}, AUTH)
+    try:
+        await gateway.call_reserve_car(CAR_UID, AUTH)
+    except httpx.HTTPStatusError:
+        await asyncio.gather(
+            gateway.call_cancel_rental(rental["rentalUid"], AUTH),
+            gateway.call_cancel_payment(payment["paymentUid"], AUTH)
+        )
+        return 409
+    return 200
+
+
+async def reserve_first(client: httpx.AsyncClient):
+    response = await client.post("/api/v1/rental", json=BODY, headers={"X-Request-ID": str(uuid.uuid4())})
+    return response.status_code
+
+
+async def run_variant(fn, clients: int, latency: float):
+    handler, calls = make_stub(latency)
+    install(handler)
+    gateway.app.dependency_overrides[get_current_user] = lambda: "bench"
+    async with httpx.AsyncClient(app=gateway.app, base_url="http://gateway.bench") as client:
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(fn(client) for _ in range(clients)), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+    gateway.app.dependency_overrides.clear()
+    return {
+        "statuses": dict(Counter(s if isinstance(s, int) else type(s).__name__ for s in statuses)),
+        "wall_ms": round(elapsed * 1000, 2),
+        **{k: calls[k] for k in ("reserve", "payment_insert", "rental_insert", "payment_cancel", "rental_cancel", "release")},
+    }
+
+
+async def run(clients: int, latency: float):
+    return {
+        "reserve-last": await run_variant(reserve_last, clients, latency),
+        "reserve-first": await run_variant(reserve_first, clients, latency),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.clients, args.latency_ms / 1000)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
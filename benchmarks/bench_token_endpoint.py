@@ -0,0 +1,102 @@
+"""Token endpoint throughput and event-loop stalls against a stub Keycloak.
+
+A threaded stub Keycloak on localhost answers every token request after
+``--latency-ms``. ``blocking`` is the old handler body (``requests.post``
+inside ``async def``); ``async`` is auth-service ``exchange_token`` with the
+pooled client, bounded concurrency and coalescing. ``loop_stall_ms`` is the
+worst delay seen by a 1 ms ticker running on the same loop.
+
+    PYTHONPATH=src/auth-service python benchmarks/bench_token_endpoint.py
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import main as auth_service
+
+
+def start_stub_keycloak(latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            body = json.dumps({"access_token": "stub", "refresh_token": "stub", "expires_in": 300}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/token"
+
+
+async def blocking_exchange(data: dict):
+    response = requests.post(auth_service.KEYCLOAK_TOKEN_URL, data=data, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+async def measure(exchange, requests_total: int, distinct_users: int):
+    stall = {"max": 0.0, "running": True}
+
+    async def ticker():
+        while stall["running"]:
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall["max"] = max(stall["max"], time.perf_counter() - before - 0.001)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        exchange({"client_id": "lab5-client", "grant_type": "password",
+                  "username": f"user{i % distinct_users}", "password": "secret"})
+        for i in range(requests_total)
+    ))
+    elapsed = time.perf_counter() - started
+    stall["running"] = False
+    await ticker_task
+    return {"wall_ms": round(elapsed * 1000, 1), "rps": round(requests_total / elapsed, 1),
+            "loop_stall_ms": round(stall["max"] * 1000, 1)}
+
+
+async def run(args):
+    server, url = start_stub_keycloak(args.latency_ms / 1000)
+    auth_service.KEYCLOAK_TOKEN_URL = url
+    try:
+        results = {}
+        for label, distinct in (("distinct_users", args.requests), ("same_user", 1)):
+            blocking = await measure(blocking_exchange, args.requests, distinct)
+            calls_before = auth_service.token_stats["keycloakCallsTotal"]
+            pooled = await measure(auth_service.exchange_token, args.requests, distinct)
+            pooled["keycloak_calls"] = auth_service.token_stats["keycloakCallsTotal"] - calls_before
+            results[label] = {"blocking": blocking, "async": pooled}
+        return results
+    finally:
+        await auth_service.shutdown()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,609 @@
+"""Load-test harness for the gateway with stub or local backends.
+
+Starts the gateway in-process with a stub JWKS issuer (real RS256 tokens,
+served over HTTP so the normal JWKS path is exercised) and one of two
+backend setups:
+
+* ``stub``: stateful in-memory car/rental/payment stubs behind
+  ``httpx.MockTransport`` with a fixed per-call latency. Measures the gateway
+  alone.
+* ``local``: the real car, rental and payment services in-process over
+  ``httpx.ASGITransport``, each on its own throwaway database. The databases
+  are created from ``postgres/postgres-configmap.yaml`` on ``--dsn-base`` (a
+  superuser DSN without a database name) and dropped afterwards. Without
+  ``--dsn-base`` a temporary server is started with ``pgserver`` if it is
+  installed.
+
+Closed-loop workers then drive a weighted mix of get_cars, get_rentals,
+create_rental, finish_rental and cancel_rental for ``--duration`` seconds after
+``--warmup``. Output is JSON with RPS, latency percentiles, status counts and
+error rates per operation. ``--baseline`` compares against an earlier result
+file, and ``--max-regression`` turns a regression into a non-zero exit code.
+
+    PYTHONPATH=src python benchmarks/harness.py --backends stub --out head.json
+    PYTHONPATH=src python benchmarks/harness.py --backends local \\
+        --dsn-base postgresql://postgres@localhost:5432 --baseline base.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import asyncpg
+import httpx
+from jose import jwk as jose_jwk
+from jose import jwt as jose_jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+CONFIGMAP = os.path.join(ROOT, "postgres", "postgres-configmap.yaml")
+
+OPS = ("get_cars", "get_rentals", "create_rental", "finish_rental", "cancel_rental")
+DEFAULT_MIX = "get_cars=40,get_rentals=30,create_rental=14,finish_rental=8,cancel_rental=8"
+ISSUER = "http://issuer.bench/realms/bench"
+AUDIENCE = "bench-client"
+BACKENDS = (
+    ("car-service", "cars", "cars_upstream", "cars"),
+    ("rental-service", "rentals", "rental_upstream", "rental"),
+    ("payment-service", "payments", "payment_upstream", "payment"),
+)
+
+
+class StubIssuer:
+    def __init__(self, kid: str = "bench"):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = kid
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        public = jose_jwk.construct(self.private_pem, algorithm="RS256").public_key().to_dict()
+        self.jwks = json.dumps({"keys": [{**public, "kid": kid, "use": "sig"}]}).encode()
+        self.server = None
+        self.fetches = 0
+
+    def start(self) -> str:
+        issuer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                issuer.fetches += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(issuer.jwks)))
+                self.end_headers()
+                self.wfile.write(issuer.jwks)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}/certs"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def token(self, username: str, ttl: int = 3600) -> str:
+        now = int(time.time())
+        claims = {"sub": username, "preferred_username": username, "iss": ISSUER, "aud": AUDIENCE,
+                  "iat": now, "exp": now + ttl}
+        return jose_jwt.encode(claims, self.private_pem, algorithm="RS256", headers={"kid": self.kid})
+
+
+class StubBackends:
+    def __init__(self, cars: int, latency: float):
+        self.latency = latency
+        self.cars = {}
+        for i in range(cars):
+            car_uid = str(uuid.uuid4())
+            self.cars[car_uid] = {"carUid": car_uid, "brand": "Bench", "model": f"Model {i}",
+                                  "registrationNumber": f"B{i:05d}", "power": 150, "price": 2000,
+                                  "type": "SEDAN", "available": True}
+        self.order = list(self.cars)
+        self.rentals = {}
+        self.payments = {}
+
+    @staticmethod
+    def _user(request: httpx.Request):
+        from auth_service.auth import INTERNAL_IDENTITY_HEADER, verify_identity
+
+        username = verify_identity(request.headers.get(INTERNAL_IDENTITY_HEADER, ""))
+        if username is None:
+            token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+            username = jose_jwt.get_unverified_claims(token).get("preferred_username")
+        return username
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        method, path, params = request.method, request.url.path, request.url.params
+        parts = path.strip("/").split("/")[2:]
+        body = json.loads(request.content) if request.content else {}
+        resource, rest = parts[0], parts[1:]
+        if resource == "cars":
+            return self._cars(method, rest, params)
+        if resource == "payment":
+            return self._payment(method, rest, params, body)
+        if resource == "rental":
+            return self._rental(method, rest, body, self._user(request))
+        return httpx.Response(404, json={"message": "not found"})
+
+    def _cars(self, method, rest, params):
+        if not rest:
+            if "uids" in params:
+                uids = params["uids"].split(",")
+                return httpx.Response(200, json={"items": [self.cars[u] for u in uids if u in self.cars]})
+            page, size = int(params.get("page", 1)), int(params.get("size", 10))
+            show_all = params.get("showAll") == "true"
+            cars = [self.cars[u] for u in self.order if show_all or self.cars[u]["available"]]
+            items = cars[(page - 1) * size:page * size]
+            return httpx.Response(200, json={"page": page, "pageSize": size, "totalElements": len(cars),
+                                             "items": items, "nextCursor": None})
+        car = self.cars.get(rest[0])
+        if car is None:
+            return httpx.Response(404, json={"message": "Car not found"})
+        if len(rest) == 1:
+            return httpx.Response(200, json=car)
+        if rest[1] == "reserve":
+            if not car["available"]:
+                return httpx.Response(409, json={"detail": "Car is already reserved"})
+            car["available"] = False
+            return httpx.Response(200, json={"status": "reserved"})
+        car["available"] = True
+        return httpx.Response(200, json={"status": "released"})
+
+    def _payment(self, method, rest, params, body):
+        if method == "POST":
+            payment = {"paymentUid": str(uuid.uuid4()), "status": "PAID", "price": body["price"]}
+            self.payments[payment["paymentUid"]] = payment
+            return httpx.Response(200, json=payment)
+        if not rest:
+            uids = params.get("uids", "").split(",")
+            return httpx.Response(200, json=[self.payments[u] for u in uids if u in self.payments])
+        payment = self.payments.get(rest[0])
+        if payment is None:
+            return httpx.Response(404, json={"message": "Payment not found"})
+        if method == "DELETE":
+            payment["status"] = "CANCELED"
+            return httpx.Response(200, json={"status": "CANCELED"})
+        return httpx.Response(200, json=payment)
+
+    def _rental(self, method, rest, body, username):
+        if not rest:
+            if method == "POST":
+                rental_uid = str(uuid.uuid4())
+                self.rentals[rental_uid] = {"rentalUid": rental_uid, "username": username, "status": "IN_PROGRESS",
+                                            **{k: body[k] for k in ("paymentUid", "carUid", "dateFrom", "dateTo")}}
+                return httpx.Response(200, json={"rentalUid": rental_uid})
+            rentals = [
+                {k: v for k, v in r.items() if k != "username"}
+                for r in self.rentals.values() if r["username"] == username
+            ]
+            return httpx.Response(200, json=rentals)
+        rental = self.rentals.get(rest[0])
+        if rental is None or rental["username"] != username:
+            return httpx.Response(404, json={"message": "Rental not found"})
+        if method == "GET":
+            return httpx.Response(200, json={k: v for k, v in rental.items() if k != "username"})
+        if rental["status"] == "IN_PROGRESS":
+            # Stands in for the rental outbox relay giving the car back
+            self.cars[rental["carUid"]]["available"] = True
+        rental["status"] = "FINISHED" if method == "POST" else "CANCELED"
+        return httpx.Response(200, json={"status": rental["status"]})
+
+    def stats(self) -> dict:
+        return {"cars": len(self.cars), "rentals": len(self.rentals), "payments": len(self.payments)}
+
+
+def load_service(directory: str, module_name: str, database_url: str = None):
+    path = os.path.join(SRC, directory)
+    if database_url:
+        os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, path)
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(path, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    finally:
+        os.environ.pop("DATABASE_URL", None)
+    return module
+
+
+def read_schema() -> str:
+    with open(CONFIGMAP, encoding="utf-8") as f:
+        text = f.read()
+    match = re.search(r'^  "schema-[\w.-]+\.sql": \|\n((?:    .*\n|\n)+)', text, re.M)
+    if match is None:
+        raise RuntimeError(f"No schema found in {CONFIGMAP}")
+    return textwrap.dedent(match.group(1))
+
+
+async def apply_schema(conn, schema: str):
+    try:
+        await conn.execute(schema)
+    except asyncpg.FeatureNotSupportedError:
+        # Minimal builds (pgserver) ship without contrib; gen_random_uuid is built in since 13.
+        await conn.execute("CREATE FUNCTION uuid_generate_v4() RETURNS uuid AS 'SELECT gen_random_uuid()' LANGUAGE sql")
+        await conn.execute(re.sub(r"CREATE EXTENSION[^;]*;", "", schema))
+
+
+def database_dsn(dsn_base: str, database: str) -> str:
+    # Only the path changes, so a socket DSN keeps its ?host= parameter
+    return urlsplit(dsn_base)._replace(path=f"/{database}").geturl()
+
+
+class ThrowawayDatabases:
+    def __init__(self, dsn_base: str, cars: int, keep: bool = False):
+        self.dsn_base = dsn_base
+        self.cars = cars
+        self.keep = keep
+        self.prefix = f"bench_{uuid.uuid4().hex[:8]}"
+        self.server = None
+        self.created = []
+
+    async def __aenter__(self) -> dict:
+        try:
+            return await self._create()
+        except BaseException:
+            await self.__aexit__()
+            raise
+
+    async def _create(self) -> dict:
+        if self.dsn_base is None:
+            try:
+                import pgserver
+            except ImportError:
+                raise SystemExit("--backends local needs --dsn-base or the pgserver package")
+            self.server = pgserver.get_server(tempfile.mkdtemp(prefix="bench-pg-"), cleanup_mode="delete")
+            self.dsn_base = self.server.get_uri()
+        admin = await asyncpg.connect(database_dsn(self.dsn_base, "postgres"))
+        try:
+            for _, database, _, _ in BACKENDS:
+                name = f"{self.prefix}_{database}"
+                await admin.execute(f'CREATE DATABASE "{name}"')
+                self.created.append(name)
+        finally:
+            await admin.close()
+        schema = read_schema()
+        urls = {}
+        for _, database, _, _ in BACKENDS:
+            urls[database] = database_dsn(self.dsn_base, f"{self.prefix}_{database}")
+            conn = await asyncpg.connect(urls[database])
+            try:
+                await apply_schema(conn, schema)
+                if database == "cars":
+                    await conn.execute("""
+                        INSERT INTO cars (brand, model, registration_number, power, price, type, availability)
+                        SELECT 'Bench', 'Model ' || g, 'B' || g, 150, 2000, 'SEDAN', true
+                        FROM generate_series(1, $1) g
+                    """, self.cars)
+            finally:
+                await conn.close()
+        return urls
+
+    async def __aexit__(self, *exc):
+        if not self.keep and self.created:
+            admin = await asyncpg.connect(database_dsn(self.dsn_base, "postgres"))
+            try:
+                for name in self.created:
+                    await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+            finally:
+                await admin.close()
+        if self.server is not None:
+            self.server.cleanup()
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, tokens: list, car_uids: list, mix: dict, seed: int):
+        self.client = client
+        self.tokens = tokens
+        self.free_cars = list(car_uids)
+        self.active = defaultdict(list)
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.rng = random.Random(seed)
+        self.recording = False
+        self.samples = defaultdict(list)
+        self.substituted = defaultdict(int)
+
+    def headers(self, user: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[user]}"}
+
+    async def step(self):
+        op = self.rng.choices(self.names, self.weights)[0]
+        user = self.rng.randrange(len(self.tokens))
+        if op in ("finish_rental", "cancel_rental") and not self.active[user]:
+            self.substituted[op] += 1
+            op = "create_rental"
+        if op == "create_rental" and not self.free_cars:
+            self.substituted[op] += 1
+            op = "get_cars"
+        started = time.perf_counter()
+        try:
+            status = await getattr(self, op)(user)
+        except Exception as e:
+            status = type(e).__name__
+        if self.recording:
+            self.samples[op].append((time.perf_counter() - started, status))
+
+    async def get_cars(self, user: int):
+        page = self.rng.randint(1, 5)
+        response = await self.client.get("/api/v1/cars", params={"page": page, "size": 10}, headers=self.headers(user))
+        return response.status_code
+
+    async def get_rentals(self, user: int):
+        response = await self.client.get("/api/v1/rental", headers=self.headers(user))
+        return response.status_code
+
+    async def create_rental(self, user: int):
+        car_uid = self.free_cars.pop(self.rng.randrange(len(self.free_cars)))
+        body = {"carUid": car_uid, "dateFrom": "2024-01-01", "dateTo": "2024-01-03"}
+        headers = {**self.headers(user), "X-Request-ID": str(uuid.uuid4())}
+        try:
+            response = await self.client.post("/api/v1/rental", json=body, headers=headers)
+        except Exception:
+            self.free_cars.append(car_uid)
+            raise
+        if response.status_code == 200:
+            self.active[user].append((response.json()["rentalUid"], car_uid))
+        elif response.status_code != 409:
+            self.free_cars.append(car_uid)
+        return response.status_code
+
+    async def finish_rental(self, user: int):
+        return await self._close_rental(user, "POST", "/finish")
+
+    async def cancel_rental(self, user: int):
+        return await self._close_rental(user, "DELETE", "")
+
+    async def _close_rental(self, user: int, method: str, suffix: str):
+        rental_uid, car_uid = self.active[user].pop(self.rng.randrange(len(self.active[user])))
+        response = await self.client.request(method, f"/api/v1/rental/{rental_uid}{suffix}", headers=self.headers(user))
+        if response.status_code == 204:
+            self.free_cars.append(car_uid)
+        return response.status_code
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: list, seconds: float) -> dict:
+    latencies = sorted(s[0] * 1000 for s in samples)
+    statuses = defaultdict(int)
+    for _, status in samples:
+        statuses[str(status)] += 1
+    conflicts = statuses.get("409", 0)
+    ok = sum(n for s, n in statuses.items() if s.isdigit() and 200 <= int(s) < 300)
+    errors = len(samples) - ok - conflicts
+    return {
+        "requests": len(samples),
+        "rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+        "p50Ms": round(percentile(latencies, 50), 3),
+        "p95Ms": round(percentile(latencies, 95), 3),
+        "p99Ms": round(percentile(latencies, 99), 3),
+        "maxMs": round(latencies[-1], 3) if latencies else 0.0,
+        "meanMs": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "errors": errors,
+        "errorRate": round(errors / len(samples), 4) if samples else 0.0,
+        "conflicts": conflicts,
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+def compare(baseline: dict, result: dict, max_regression: float = None) -> dict:
+    comparison = {}
+    regressions = []
+    for name, head in result["ops"].items():
+        base = baseline.get("ops", {}).get(name)
+        if not base:
+            continue
+        entry = {}
+        for metric, worse_if_higher in (("rps", False), ("p50Ms", True), ("p95Ms", True), ("p99Ms", True), ("errorRate", True)):
+            before, after = base[metric], head[metric]
+            change = round((after - before) / before * 100, 2) if before else None
+            entry[metric] = {"baseline": before, "current": after, "changePct": change}
+            if max_regression is not None and change is not None and metric != "errorRate":
+                if (change if worse_if_higher else -change) > max_regression:
+                    regressions.append(f"{name}.{metric} {change:+.2f}%")
+        if max_regression is not None and head["errorRate"] > base["errorRate"] + 0.01:
+            regressions.append(f"{name}.errorRate {base['errorRate']} -> {head['errorRate']}")
+        comparison[name] = entry
+    return {"baselineCommit": baseline.get("meta", {}).get("commit"), "ops": comparison, "regressions": regressions}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPS:
+            raise SystemExit(f"Unknown operation {name!r} in --mix, expected {', '.join(OPS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def configure_env(jwks_uri: str, overrides: list):
+    os.environ.update({
+        "KEYCLOAK_ISSUER": ISSUER,
+        "KEYCLOAK_CLIENT_ID": AUDIENCE,
+        "KEYCLOAK_JWKS_URI": jwks_uri,
+        "INTERNAL_AUTH_SECRET": uuid.uuid4().hex,
+        "TRUST_INTERNAL_IDENTITY": "true",
+        "SAGA_STORE": "memory",
+        "SAGA_RECOVERY_INTERVAL": "3600",
+    })
+    for item in overrides:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+
+async def drive(gateway, args, car_uids: list, tokens: list) -> dict:
+    async with httpx.AsyncClient(app=gateway.app, base_url="http://gateway.bench", timeout=30) as client:
+        workload = Workload(client, tokens, car_uids, parse_mix(args.mix), args.seed)
+        warmup_end = time.perf_counter() + args.warmup
+        stop_at = warmup_end + args.duration
+        measured = {}
+
+        async def worker():
+            while time.perf_counter() < stop_at:
+                if not workload.recording and time.perf_counter() >= warmup_end:
+                    workload.recording = True
+                    measured["start"] = time.perf_counter()
+                await workload.step()
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        seconds = time.perf_counter() - measured.get("start", time.perf_counter())
+    everything = [s for samples in workload.samples.values() for s in samples]
+    return {
+        "seconds": round(seconds, 3),
+        "total": summarize(everything, seconds),
+        "ops": {name: summarize(workload.samples[name], seconds) for name in OPS if workload.samples[name]},
+        "substituted": dict(workload.substituted),
+    }
+
+
+async def run(args) -> dict:
+    issuer = StubIssuer()
+    configure_env(issuer.start(), args.env)
+    sys.path.insert(0, SRC)
+    sys.path.insert(0, os.path.join(SRC, "gateway"))
+    try:
+        gateway = load_service("gateway", "bench_gateway")
+        from upstream import Upstream, UpstreamConfig, UpstreamRegistry
+
+        tokens = [issuer.token(f"bench{i}") for i in range(args.users)]
+        if args.backends == "stub":
+            stub = StubBackends(args.cars, args.stub_latency_ms / 1000)
+            transport = httpx.MockTransport(stub.handle)
+            upstreams = {name: Upstream(UpstreamConfig(name, f"http://{name}.bench"), transport=transport)
+                         for _, _, _, name in BACKENDS}
+            result = await with_gateway(gateway, upstreams, UpstreamRegistry, args, stub.order, tokens)
+            result["backendState"] = stub.stats()
+        else:
+            async with ThrowawayDatabases(args.dsn_base, args.cars, args.keep_db) as urls:
+                services = [load_service(directory, f"bench_{database}", urls[database])
+                            for directory, database, _, _ in BACKENDS]
+                cars_service, rental_service, _ = services
+                rental_service.outbox_relay.transport = httpx.ASGITransport(app=cars_service.app)
+                for service in services:
+                    await service.app.router.startup()
+                try:
+                    conn = await asyncpg.connect(urls["cars"])
+                    car_uids = [str(r[0]) for r in await conn.fetch("SELECT car_uid FROM cars ORDER BY id")]
+                    await conn.close()
+                    upstreams = {
+                        name: Upstream(UpstreamConfig(name, f"http://{name}.bench"),
+                                       transport=httpx.ASGITransport(app=service.app))
+                        for (_, _, _, name), service in zip(BACKENDS, services)
+                    }
+                    result = await with_gateway(gateway, upstreams, UpstreamRegistry, args, car_uids, tokens)
+                finally:
+                    for service in services:
+                        await service.app.router.shutdown()
+        result["jwksFetches"] = issuer.fetches
+        return result
+    finally:
+        issuer.stop()
+
+
+async def with_gateway(gateway, upstreams: dict, registry, args, car_uids: list, tokens: list) -> dict:
+    await gateway.app.router.startup()
+    gateway.upstreams = registry(list(upstreams.values()))
+    for _, _, attribute, name in BACKENDS:
+        setattr(gateway, attribute, upstreams[name])
+    try:
+        result = await drive(gateway, args, car_uids, tokens)
+        result["gatewayStats"] = json.loads(gateway.stats().body)
+        return result
+    finally:
+        await gateway.app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", choices=("stub", "local"), default="stub")
+    parser.add_argument("--dsn-base", help="superuser DSN without the database name, for --backends local")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the throwaway databases")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--cars", type=int, default=200)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated op=weight pairs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stub-latency-ms", type=float, default=2.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="set a service setting before startup, e.g. CAR_CACHE_ENABLED=false")
+    parser.add_argument("--out", help="write the JSON result here instead of stdout")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="exit 1 if rps drops or a latency percentile grows by more than this percent")
+    args = parser.parse_args()
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "startedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "backends": args.backends,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "cars": args.cars,
+            "mix": parse_mix(args.mix),
+            "seed": args.seed,
+            "stubLatencyMs": args.stub_latency_ms if args.backends == "stub" else None,
+            "env": args.env,
+        },
+        **asyncio.run(run(args)),
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["comparison"] = compare(json.load(f), result, args.max_regression)
+
+    output = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if result.get("comparison", {}).get("regressions"):
+        print("Regressions: " + ", ".join(result["comparison"]["regressions"]), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
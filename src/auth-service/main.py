@@ -1,45 +1,122 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator
 from typing import Optional
-import requests
+import asyncio
+import hashlib
+import httpx
+import json
 import os
 
 app = FastAPI()
 
 class TokenRequest(BaseModel):
-    username: str
-    password: str
+    username: Optional[str] = None
+    password: Optional[str] = None
     client_id: str
     client_secret: Optional[str] = None
     grant_type: str = "password"
+    refresh_token: Optional[str] = None
+
+    @root_validator(skip_on_failure=True)
+    def check_grant(cls, values):
+        grant_type = values.get("grant_type")
+        if grant_type == "password" and not (values.get("username") and values.get("password")):
+            raise ValueError("username and password are required for the password grant")
+        if grant_type == "refresh_token" and not values.get("refresh_token"):
+            raise ValueError("refresh_token is required for the refresh_token grant")
+        if grant_type not in ("password", "refresh_token"):
+            raise ValueError(f"Unsupported grant_type: {grant_type}")
+        return values
 
 KEYCLOAK_TOKEN_URL = os.environ.get('KEYCLOAK_TOKEN_URL', 'http://keycloak.rsoi-lab4.svc.cluster.local:8080/realms/rsoi-realm/protocol/openid-connect/token')
 KEYCLOAK_CLIENT_ID = os.environ.get('KEYCLOAK_CLIENT_ID', 'lab5-client')
+KEYCLOAK_TIMEOUT = float(os.environ.get('KEYCLOAK_TIMEOUT', '10'))
+KEYCLOAK_MAX_CONNECTIONS = int(os.environ.get('KEYCLOAK_MAX_CONNECTIONS', '20'))
+KEYCLOAK_MAX_CONCURRENCY = int(os.environ.get('KEYCLOAK_MAX_CONCURRENCY', '20'))
+
+keycloak_client = None
+keycloak_semaphore = None
+in_flight = {}
+token_stats = {"requestsTotal": 0, "keycloakCallsTotal": 0, "coalescedTotal": 0, "failuresTotal": 0}
+
+def get_keycloak_client() -> httpx.AsyncClient:
+    global keycloak_client, keycloak_semaphore
+    if keycloak_client is None:
+        keycloak_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(KEYCLOAK_TIMEOUT, connect=min(KEYCLOAK_TIMEOUT, 2.0)),
+            limits=httpx.Limits(
+                max_connections=KEYCLOAK_MAX_CONNECTIONS,
+                max_keepalive_connections=KEYCLOAK_MAX_CONNECTIONS
+            )
+        )
+        keycloak_semaphore = asyncio.Semaphore(KEYCLOAK_MAX_CONCURRENCY)
+    return keycloak_client
+
+async def post_token(data: dict) -> dict:
+    client = get_keycloak_client()
+    async with keycloak_semaphore:
+        token_stats["keycloakCallsTotal"] += 1
+        response = await client.post(KEYCLOAK_TOKEN_URL, data=data)
+    response.raise_for_status()
+    return response.json()
+
+async def exchange_token(data: dict) -> dict:
+    key = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    task = in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(post_token(data))
+        in_flight[key] = task
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+    else:
+        token_stats["coalescedTotal"] += 1
+    return await asyncio.shield(task)
+
+@app.on_event("startup")
+async def startup():
+    get_keycloak_client()
+
+@app.on_event("shutdown")
+async def shutdown():
+    global keycloak_client
+    client, keycloak_client = keycloak_client, None
+    if client is not None:
+        await client.aclose()
 
 @app.post("/token")
 async def get_token(token_request: TokenRequest):
     if token_request.client_id != KEYCLOAK_CLIENT_ID:
         raise HTTPException(status_code=400, detail="Invalid client ID")
-    
+
     data = {
         "client_id": token_request.client_id,
-        "username": token_request.username,
-        "password": token_request.password,
         "grant_type": token_request.grant_type,
-        "scope": "openid profile email"
     }
-    
+    if token_request.grant_type == "refresh_token":
+        data["refresh_token"] = token_request.refresh_token
+    else:
+        data.update({
+            "username": token_request.username,
+            "password": token_request.password,
+            "scope": "openid profile email"
+        })
+    if token_request.client_secret:
+        data["client_secret"] = token_request.client_secret
+
+    token_stats["requestsTotal"] += 1
     try:
-        response = requests.post(KEYCLOAK_TOKEN_URL, data=data, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return await exchange_token(data)
+    except (httpx.HTTPError, ValueError) as e:
+        token_stats["failuresTotal"] += 1
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/stats")
+async def stats():
+    return {**token_stats, "inFlight": len(in_flight)}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8081)
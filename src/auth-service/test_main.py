@@ -40,3 +40,63 @@ def test_token_endpoint_complete_request():
         assert "expires_in" in data
         assert "refresh_token" in data
         assert "scope" in data
+
+def install_keycloak(monkeypatch, handler):
+    import asyncio
+    import httpx
+    import main
+    monkeypatch.setattr(main, "keycloak_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "keycloak_semaphore", asyncio.Semaphore(5))
+    return main
+
+def test_refresh_token_grant_is_forwarded(monkeypatch):
+    from urllib.parse import parse_qs
+    import httpx
+    seen = []
+
+    def handler(request):
+        seen.append(parse_qs(request.content.decode()))
+        return httpx.Response(200, json={"access_token": "new", "refresh_token": "next"})
+
+    install_keycloak(monkeypatch, handler)
+    response = client.post("/token", json={
+        "client_id": "lab5-client",
+        "grant_type": "refresh_token",
+        "refresh_token": "old"
+    })
+    assert response.status_code == 200
+    assert response.json()["access_token"] == "new"
+    assert seen[0]["grant_type"] == ["refresh_token"]
+    assert seen[0]["refresh_token"] == ["old"]
+    assert "password" not in seen[0]
+
+def test_refresh_token_grant_requires_token():
+    response = client.post("/token", json={"client_id": "lab5-client", "grant_type": "refresh_token"})
+    assert response.status_code == 422
+
+def test_identical_in_flight_exchanges_are_coalesced(monkeypatch):
+    import asyncio
+    import httpx
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"access_token": "shared"})
+
+    main = install_keycloak(monkeypatch, handler)
+    data = {"client_id": "lab5-client", "grant_type": "password", "username": "u", "password": "p"}
+
+    async def scenario():
+        return await asyncio.gather(*(main.exchange_token(dict(data)) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert [r["access_token"] for r in results] == ["shared"] * 5
+    assert len(calls) == 1
+    assert main.in_flight == {}
+
+def test_keycloak_rejection_is_401(monkeypatch):
+    import httpx
+    install_keycloak(monkeypatch, lambda request: httpx.Response(401, json={"error": "invalid_grant"}))
+    response = client.post("/token", json={"username": "u", "password": "bad", "client_id": "lab5-client"})
+    assert response.status_code == 401
@@ -1,43 +1,275 @@
 from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import base64
+import functools
+import hashlib
+import hmac
+import inspect
+import logging
+import threading
+import time
 import requests
 import os
+from collections import OrderedDict
 from typing import Optional, Dict
+from jose import jwk as jose_jwk
 from jose import jwt as jose_jwt
+from instrumentation.tracing import tracer
 
-security = HTTPBearer()
+security = HTTPBearer(auto_error=False)
 
 KEYCLOAK_ISSUER = os.environ.get('KEYCLOAK_ISSUER', 'http://keycloak.rsoi-lab4.svc.cluster.local:8080/realms/rsoi-realm')
 KEYCLOAK_JWKS_URI = os.environ.get('KEYCLOAK_JWKS_URI', 'http://keycloak.rsoi-lab4.svc.cluster.local:8080/realms/rsoi-realm/protocol/openid-connect/certs')
 KEYCLOAK_CLIENT_ID = os.environ.get('KEYCLOAK_CLIENT_ID', 'lab5-client')
 
-_jwks = None
+JWKS_CACHE_TTL = float(os.environ.get('JWKS_CACHE_TTL', '300'))
+JWKS_MIN_REFRESH_INTERVAL = float(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', '10'))
+TOKEN_CACHE_ENABLED = os.environ.get('TOKEN_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
 
-def get_jwks():
-    global _jwks
-    if _jwks is None:
+INTERNAL_AUTH_SECRET = os.environ.get('INTERNAL_AUTH_SECRET', '')
+INTERNAL_IDENTITY_TTL = int(os.environ.get('INTERNAL_IDENTITY_TTL', '60'))
+TRUST_INTERNAL_IDENTITY = os.environ.get('TRUST_INTERNAL_IDENTITY', 'false').lower() in ('1', 'true', 'yes', 'on')
+INTERNAL_IDENTITY_HEADER = 'X-Internal-Identity'
+
+def fetch_jwks(uri: str) -> Dict:
+    response = requests.get(uri, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+class JWKSCache:
+    def __init__(self, uri: str, ttl: float = 300, min_refresh_interval: float = 10, fetch=None):
+        self.uri = uri
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._fetch = fetch or fetch_jwks
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._last_error = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._refresh_task = None
+        self.fetches_total = 0
+
+    def expired(self) -> bool:
+        return self._fetched_at is None or time.monotonic() - self._fetched_at >= self.ttl
+
+    def get_key(self, kid: str):
+        if self.expired():
+            self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            self.refresh_for_kid(kid)
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self):
+        generation = self._generation
+        with self._lock:
+            if self._generation != generation and not self.expired():
+                return
+            if self._recently_failed():
+                if not self._keys:
+                    raise HTTPException(status_code=503, detail=f"Cannot fetch JWKs: {str(self._last_error)}")
+                return
+            self._load()
+
+    def refresh_for_kid(self, kid: str):
+        generation = self._generation
+        with self._lock:
+            if kid in self._keys or self._generation != generation:
+                return
+            if self._attempted_at is not None and time.monotonic() - self._attempted_at < self.min_refresh_interval:
+                return
+            self._load()
+
+    def _recently_failed(self) -> bool:
+        return self._last_error is not None and time.monotonic() - self._attempted_at < self.min_refresh_interval
+
+    def _load(self):
+        self.fetches_total += 1
+        self._attempted_at = time.monotonic()
+        try:
+            jwks = self._fetch(self.uri)
+        except Exception as e:
+            self._last_error = e
+            if not self._keys:
+                raise HTTPException(status_code=503, detail=f"Cannot fetch JWKs: {str(e)}")
+            logging.warning(f"JWKS refresh failed, keeping {len(self._keys)} cached keys: {e}")
+            return
+        keys = {}
+        for key in jwks.get("keys", []):
+            if key.get("kty") != "RSA" or "kid" not in key:
+                continue
+            try:
+                keys[key["kid"]] = jose_jwk.construct(key, algorithm="RS256")
+            except Exception as e:
+                logging.warning(f"Skipping unusable JWK {key.get('kid')}: {e}")
+        self._keys = keys
+        self._last_error = None
+        self._fetched_at = self._attempted_at
+        self._generation += 1
+
+    async def ensure_key(self, kid: Optional[str]):
+        if kid is None or (kid in self._keys and not self.expired()):
+            return
+        await run_in_threadpool(self.get_key, kid)
+
+    async def start(self):
         try:
-            response = requests.get(KEYCLOAK_JWKS_URI, timeout=5)
-            response.raise_for_status()
-            _jwks = response.json()
+            await run_in_threadpool(self.refresh)
         except Exception as e:
-            raise HTTPException(status_code=503, detail=f"Cannot fetch JWKs: {str(e)}")
-    return _jwks
+            logging.warning(f"Could not prewarm JWKS cache: {e}")
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        task, self._refresh_task = self._refresh_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.ttl * 0.8)
+            try:
+                await run_in_threadpool(self._refresh_now)
+            except Exception as e:
+                logging.warning(f"Background JWKS refresh failed: {e}")
+
+    def _refresh_now(self):
+        with self._lock:
+            self._load()
+
+    def stats(self) -> Dict:
+        return {
+            "keys": len(self._keys),
+            "fetchesTotal": self.fetches_total,
+            "ageSeconds": round(time.monotonic() - self._fetched_at, 3) if self._fetched_at is not None else None,
+        }
+
+jwks_cache = JWKSCache(KEYCLOAK_JWKS_URI, JWKS_CACHE_TTL, JWKS_MIN_REFRESH_INTERVAL)
+
+class TokenCache:
+    def __init__(self, max_size: int = 10000, enabled: bool = True):
+        self.max_size = max_size
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[digest]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, token: str, payload: Dict):
+        exp = payload.get("exp")
+        if not self.enabled or not isinstance(exp, (int, float)) or exp <= time.time():
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (dict(payload), exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_ENABLED)
+
+def _identity_signature(encoded_user: str, exp: int, secret: str) -> str:
+    message = f"{encoded_user}.{exp}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+def sign_identity(username: str, ttl: int = None, secret: str = None) -> str:
+    secret = secret or INTERNAL_AUTH_SECRET
+    if not secret:
+        raise ValueError("INTERNAL_AUTH_SECRET is not configured")
+    exp = int(time.time()) + (INTERNAL_IDENTITY_TTL if ttl is None else ttl)
+    encoded_user = base64.urlsafe_b64encode(username.encode()).decode().rstrip("=")
+    return f"{encoded_user}.{exp}.{_identity_signature(encoded_user, exp, secret)}"
+
+def verify_identity(assertion: str, secret: str = None) -> Optional[str]:
+    secret = secret or INTERNAL_AUTH_SECRET
+    if not secret:
+        return None
+    try:
+        encoded_user, exp, signature = assertion.split(".")
+        exp = int(exp)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _identity_signature(encoded_user, exp, secret)):
+        return None
+    if exp <= time.time():
+        return None
+    try:
+        return base64.urlsafe_b64decode(encoded_user + "=" * (-len(encoded_user) % 4)).decode()
+    except ValueError:
+        return None
+
+def forward_headers(authorization: Optional[str], username: str) -> Dict:
+    headers = {}
+    if authorization:
+        headers["Authorization"] = authorization
+    if INTERNAL_AUTH_SECRET:
+        headers[INTERNAL_IDENTITY_HEADER] = sign_identity(username)
+    return headers
+
+def token_kid(token: str) -> Optional[str]:
+    try:
+        return jose_jwt.get_unverified_header(token).get("kid")
+    except Exception:
+        return None
 
 def validate_token(token: str) -> Dict:
+    with tracer.span("validate_token") as span:
+        cached = token_cache.get(token)
+        span.set_attribute("cache.hit", cached is not None)
+        if cached is not None:
+            return cached
+        return _decode_token(token)
+
+def _decode_token(token: str) -> Dict:
     try:
-        jwks = get_jwks()
         unverified_header = jose_jwt.get_unverified_header(token)
-        
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = key
-                break
-        
-        if not rsa_key:
+        rsa_key = jwks_cache.get_key(unverified_header.get("kid"))
+        if rsa_key is None:
             raise HTTPException(status_code=401, detail="Invalid token: no matching key found")
-        
+
         payload = jose_jwt.decode(
             token,
             rsa_key,
@@ -45,7 +277,10 @@ def validate_token(token: str) -> Dict:
             audience=KEYCLOAK_CLIENT_ID,
             issuer=KEYCLOAK_ISSUER
         )
+        token_cache.put(token, payload)
         return payload
+    except HTTPException:
+        raise
     except jose_jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jose_jwt.JWTError as e:
@@ -53,12 +288,37 @@ def validate_token(token: str) -> Dict:
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Token validation failed: {str(e)}")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+async def get_current_user(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> str:
+    assertion = request.headers.get(INTERNAL_IDENTITY_HEADER)
+    if TRUST_INTERNAL_IDENTITY and assertion is not None:
+        username = verify_identity(assertion)
+        if username is None:
+            raise HTTPException(status_code=401, detail="Invalid internal identity")
+        return username
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
     token = credentials.credentials
-    payload = validate_token(token)
+    payload = token_cache.get(token)
+    if payload is None:
+        # The miss is already counted, so verify without a second cache lookup
+        await jwks_cache.ensure_key(token_kid(token))
+        with tracer.span("validate_token", **{"cache.hit": False}):
+            payload = _decode_token(token)
     return payload.get("preferred_username", payload.get("sub"))
 
 def protected_route(func):
-    async def wrapper(request: Request, current_user: str = Depends(get_current_user), *args, **kwargs):
-        return await func(request, current_user, *args, **kwargs)
+    signature = inspect.signature(func)
+    parameters = []
+    for param in signature.parameters.values():
+        if param.name == "current_user":
+            param = param.replace(default=Depends(get_current_user))
+        parameters.append(param.replace(kind=inspect.Parameter.KEYWORD_ONLY))
+
+    @functools.wraps(func)
+    async def wrapper(**kwargs):
+        if asyncio.iscoroutinefunction(func):
+            return await func(**kwargs)
+        return await run_in_threadpool(func, **kwargs)
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
     return wrapper
@@ -19,3 +19,219 @@ def test_get_current_user_missing_token():
         get_current_user(credentials)
     assert exc_info.value.status_code == 401
     assert "Invalid token" in exc_info.value.detail
+
+def test_protected_route_exposes_handler_parameters():
+    from fastapi import FastAPI, Query, Request
+    from fastapi.testclient import TestClient
+    from auth_service.auth import protected_route
+
+    app = FastAPI()
+
+    @app.get("/async/{item}")
+    @protected_route
+    async def async_handler(request: Request, current_user: str, item: str, size: int = Query(10)):
+        return {"user": current_user, "item": item, "size": size}
+
+    @app.get("/sync")
+    @protected_route
+    def sync_handler(request: Request, current_user: str):
+        return {"user": current_user}
+
+    app.dependency_overrides[get_current_user] = lambda: "testuser"
+    client = TestClient(app)
+    assert client.get("/async/car?size=5").json() == {"user": "testuser", "item": "car", "size": 5}
+    assert client.get("/sync").json() == {"user": "testuser"}
+
+def make_signing_key(kid="key-1"):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jose import jwk
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    public_jwk = jwk.construct(pem, "RS256").public_key().to_dict()
+    public_jwk["kid"] = kid
+    return pem, public_jwk
+
+def sign_token(pem, kid="key-1", **claims):
+    import time
+    from jose import jwt
+    from auth_service.auth import KEYCLOAK_CLIENT_ID, KEYCLOAK_ISSUER
+
+    payload = {
+        "preferred_username": "testuser",
+        "aud": KEYCLOAK_CLIENT_ID,
+        "iss": KEYCLOAK_ISSUER,
+        "exp": int(time.time()) + 300,
+    }
+    payload.update(claims)
+    return jwt.encode(payload, pem, algorithm="RS256", headers={"kid": kid})
+
+def test_validate_token_uses_cached_key(monkeypatch):
+    from auth_service import auth
+
+    pem, public_jwk = make_signing_key()
+    fetches = []
+    cache = auth.JWKSCache("http://jwks.test", fetch=lambda uri: fetches.append(uri) or {"keys": [public_jwk]})
+    monkeypatch.setattr(auth, "jwks_cache", cache)
+    token = sign_token(pem)
+    assert validate_token(token)["preferred_username"] == "testuser"
+    assert validate_token(token)["preferred_username"] == "testuser"
+    assert len(fetches) == 1
+
+def test_jwks_cache_refreshes_once_for_unknown_kid():
+    import threading
+    from auth_service.auth import JWKSCache
+
+    _, old_jwk = make_signing_key("old")
+    _, new_jwk = make_signing_key("new")
+    documents = [{"keys": [old_jwk]}, {"keys": [old_jwk, new_jwk]}]
+    fetches = []
+
+    def fetch(uri):
+        fetches.append(uri)
+        return documents[min(len(fetches) - 1, 1)]
+
+    cache = JWKSCache("http://jwks.test", min_refresh_interval=0, fetch=fetch)
+    assert cache.get_key("old") is not None
+    threads = [threading.Thread(target=cache.get_key, args=("new",)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.get_key("new") is not None
+    assert len(fetches) == 2
+
+def test_jwks_cache_rate_limits_unknown_kid_refresh():
+    from auth_service.auth import JWKSCache
+
+    _, public_jwk = make_signing_key()
+    fetches = []
+    cache = JWKSCache("http://jwks.test", min_refresh_interval=60, fetch=lambda uri: fetches.append(uri) or {"keys": [public_jwk]})
+    assert cache.get_key("missing") is None
+    assert cache.get_key("missing") is None
+    assert len(fetches) == 1
+
+def test_jwks_cache_keeps_keys_when_refresh_fails():
+    from auth_service.auth import JWKSCache
+
+    _, public_jwk = make_signing_key()
+    responses = [{"keys": [public_jwk]}]
+
+    def fetch(uri):
+        if not responses:
+            raise ConnectionError("keycloak down")
+        return responses.pop()
+
+    cache = JWKSCache("http://jwks.test", ttl=0, min_refresh_interval=0, fetch=fetch)
+    assert cache.get_key("key-1") is not None
+    assert cache.get_key("key-1") is not None
+
+def test_token_cache_skips_repeated_verification(monkeypatch):
+    from auth_service import auth
+
+    pem, public_jwk = make_signing_key()
+    cache = auth.JWKSCache("http://jwks.test", fetch=lambda uri: {"keys": [public_jwk]})
+    monkeypatch.setattr(auth, "jwks_cache", cache)
+    monkeypatch.setattr(auth, "token_cache", auth.TokenCache(max_size=10))
+    verifications = []
+    real_decode = auth.jose_jwt.decode
+    monkeypatch.setattr(auth.jose_jwt, "decode", lambda *a, **kw: verifications.append(1) or real_decode(*a, **kw))
+    token = sign_token(pem)
+    for _ in range(3):
+        assert validate_token(token)["preferred_username"] == "testuser"
+    assert len(verifications) == 1
+    assert auth.token_cache.stats()["hits"] == 2
+
+def test_get_current_user_counts_each_lookup_once(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from auth_service import auth
+
+    pem, public_jwk = make_signing_key()
+    monkeypatch.setattr(auth, "jwks_cache", auth.JWKSCache("http://jwks.test", fetch=lambda uri: {"keys": [public_jwk]}))
+    monkeypatch.setattr(auth, "token_cache", auth.TokenCache(max_size=10))
+    app = FastAPI()
+
+    @app.get("/me")
+    @auth.protected_route
+    async def me(current_user: str):
+        return {"user": current_user}
+
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {sign_token(pem)}"}
+    assert client.get("/me", headers=headers).json() == {"user": "testuser"}
+    assert client.get("/me", headers=headers).json() == {"user": "testuser"}
+    assert auth.token_cache.stats()["hits"] == 1
+    assert auth.token_cache.stats()["misses"] == 1
+
+def test_token_cache_expires_at_token_exp(monkeypatch):
+    import time
+    from auth_service.auth import TokenCache
+
+    cache = TokenCache(max_size=10)
+    now = time.time()
+    cache.put("token", {"sub": "testuser", "exp": now + 60})
+    assert cache.get("token") == {"sub": "testuser", "exp": now + 60}
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+def test_token_cache_evicts_least_recently_used():
+    import time
+    from auth_service.auth import TokenCache
+
+    cache = TokenCache(max_size=2)
+    exp = time.time() + 60
+    for token in ("a", "b"):
+        cache.put(token, {"sub": token, "exp": exp})
+    cache.get("a")
+    cache.put("c", {"sub": "c", "exp": exp})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+def test_token_cache_can_be_disabled():
+    import time
+    from auth_service.auth import TokenCache
+
+    cache = TokenCache(enabled=False)
+    cache.put("token", {"sub": "testuser", "exp": time.time() + 60})
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+def test_identity_assertion_round_trip():
+    from auth_service.auth import sign_identity, verify_identity
+
+    assertion = sign_identity("test.user@example", secret="s3cret")
+    assert verify_identity(assertion, secret="s3cret") == "test.user@example"
+    assert verify_identity(assertion, secret="other") is None
+    encoded_user, exp, signature = assertion.split(".")
+    assert verify_identity(f"{encoded_user}.{int(exp) + 60}.{signature}", secret="s3cret") is None
+    assert verify_identity(sign_identity("testuser", ttl=-1, secret="s3cret"), secret="s3cret") is None
+    assert verify_identity("garbage", secret="s3cret") is None
+
+def test_get_current_user_trusts_internal_identity(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from auth_service import auth
+
+    monkeypatch.setattr(auth, "INTERNAL_AUTH_SECRET", "s3cret")
+    monkeypatch.setattr(auth, "TRUST_INTERNAL_IDENTITY", True)
+    monkeypatch.setattr(auth, "validate_token", lambda token: pytest.fail("JWT should not be verified"))
+    app = FastAPI()
+
+    @app.get("/me")
+    @auth.protected_route
+    async def me(current_user: str):
+        return {"user": current_user}
+
+    client = TestClient(app)
+    headers = auth.forward_headers("Bearer ignored", "testuser")
+    assert client.get("/me", headers=headers).json() == {"user": "testuser"}
+    assert client.get("/me", headers={auth.INTERNAL_IDENTITY_HEADER: "forged.1.abc"}).status_code == 401
+    assert client.get("/me").status_code == 401
@@ -0,0 +1,13 @@
+import pytest
+
+from auth_service.auth import get_current_user
+from main import app
+
+
+@pytest.fixture
+def login():
+    def as_user(username: str = "testuser"):
+        app.dependency_overrides[get_current_user] = lambda: username
+
+    yield as_user
+    app.dependency_overrides.clear()
@@ -1,7 +1,19 @@
 from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
-import psycopg2
-from auth_service.auth import protected_route, get_current_user
+from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import base64
+import binascii
+import logging
+import os
+import time
+import uuid
+from auth_service.auth import protected_route, jwks_cache, token_cache
+from database.pool import ConnectionPool
+from database.migrations import migrate_on_startup
+from instrumentation.metrics import instrument_app, observe_query
+from instrumentation.tracing import trace_app, trace_query, tracer
 
 app = FastAPI()
 
@@ -12,124 +24,433 @@ DB_CONFIG = {
     "password": "test"
 }
 
+db_pool = ConnectionPool.from_env(query_loggers=(observe_query, trace_query), **DB_CONFIG)
+instrument_app(app, db_pool=db_pool)
+trace_app(app, "car-service")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+MAX_BATCH_UIDS = 500
+CARS_COUNT_TTL = float(os.environ.get("CARS_COUNT_TTL", "60"))
+EVENT_RETENTION = float(os.environ.get("AVAILABILITY_EVENT_RETENTION", str(7 * 86400)))
+EVENT_PURGE_INTERVAL = float(os.environ.get("AVAILABILITY_EVENT_PURGE_INTERVAL", "3600"))
+CAR_TYPES = ("SEDAN", "SUV", "MINIVAN", "ROADSTER")
+# Sort keys must match the expressions in migrations/003_cars_search_indexes.sql
+SORT_KEYS = {"price": "price", "power": "COALESCE(power, 0)"}
+# Set by the gateway saga so a compensating release only frees its own reservation
+RESERVATION_OWNER_HEADER = "X-Reservation-Owner"
+
+class CarCounts:
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self.total = None
+        self.available = None
+        self.loaded_at = None
+
+    def fresh(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    async def get(self, conn, show_all: bool) -> int:
+        if not self.fresh():
+            row = await conn.fetchrow("SELECT COUNT(*), COUNT(*) FILTER (WHERE availability) FROM cars")
+            self.total, self.available = row[0], row[1]
+            self.loaded_at = time.monotonic()
+        return self.total if show_all else self.available
+
+    def adjust_available(self, delta: int):
+        if self.available is not None:
+            self.available = max(0, min(self.total, self.available + delta))
+
+    def stats(self) -> dict:
+        return {
+            "total": self.total,
+            "available": self.available,
+            "ageSeconds": round(time.monotonic() - self.loaded_at, 3) if self.loaded_at is not None else None,
+        }
+
+car_counts = CarCounts(CARS_COUNT_TTL)
+event_purge_task = None
+
+def encode_cursor(last_id: int, value: Optional[int] = None) -> str:
+    raw = str(last_id) if value is None else f"{value}:{last_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, keyed: bool = False):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        if not keyed:
+            return int(raw)
+        value, last_id = raw.split(":")
+        return int(value), int(last_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def car_filters(show_all: bool, car_type: Optional[str], brand: Optional[str],
+                min_price: Optional[int], max_price: Optional[int], min_power: Optional[int]):
+    conditions, args = [], []
+    if not show_all:
+        conditions.append("availability = true")
+    if car_type:
+        types = list(dict.fromkeys(t.strip().upper() for t in car_type.split(",") if t.strip()))
+        if any(t not in CAR_TYPES for t in types):
+            raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(CAR_TYPES)}")
+        # A single type keeps the (type, price, id) index usable for ordered scans
+        if len(types) == 1:
+            args.append(types[0])
+            conditions.append(f"type = ${len(args)}")
+        else:
+            args.append(types)
+            conditions.append(f"type = ANY(${len(args)}::text[])")
+    if brand:
+        args.append(brand)
+        conditions.append(f"brand = ${len(args)}")
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=400, detail="minPrice must not exceed maxPrice")
+    if min_price is not None:
+        args.append(min_price)
+        conditions.append(f"price >= ${len(args)}")
+    if max_price is not None:
+        args.append(max_price)
+        conditions.append(f"price <= ${len(args)}")
+    if min_power is not None:
+        args.append(min_power)
+        conditions.append(f"{SORT_KEYS['power']} >= ${len(args)}")
+    return conditions, args
+
+def parse_uids(uids: str):
+    return normalize_uids([u.strip() for u in uids.split(",") if u.strip()])
+
+def normalize_uids(values: list):
+    if len(values) > MAX_BATCH_UIDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_UIDS} uids per request")
+    try:
+        return list(dict.fromkeys(str(uuid.UUID(u)) for u in values))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid uid in uids")
+
+def car_to_dict(r):
+    return {
+        "carUid": str(r[0]),
+        "brand": r[1],
+        "model": r[2],
+        "registrationNumber": r[3],
+        "power": r[4],
+        "price": r[5],
+        "type": r[6],
+        "available": r[7]
+    }
+
+@app.on_event("startup")
+async def startup():
+    await db_pool.start()
+    await migrate_on_startup(db_pool, MIGRATIONS_DIR)
+    await jwks_cache.start()
+    global event_purge_task
+    event_purge_task = asyncio.create_task(purge_events_loop())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if event_purge_task is not None:
+        event_purge_task.cancel()
+    await jwks_cache.stop()
+    await db_pool.close()
+
 @app.get("/manage/health")
 def health():
     return JSONResponse(content={"status": "OK"})
 
+@app.get("/manage/stats")
+def stats():
+    return JSONResponse(content={"dbPool": db_pool.stats(), "jwks": jwks_cache.stats(), "tokenCache": token_cache.stats(), "carCounts": car_counts.stats(), "tracing": tracer.stats()})
+
 @app.get("/api/v1/cars")
 @protected_route
-def get_cars(
+async def get_cars(
     request: Request,
     current_user: str,
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1),
-    showAll: bool = Query(False)
+    showAll: bool = Query(False),
+    uids: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    type: Optional[str] = Query(None),
+    brand: Optional[str] = Query(None),
+    minPrice: Optional[int] = Query(None, ge=0),
+    maxPrice: Optional[int] = Query(None, ge=0),
+    minPower: Optional[int] = Query(None, ge=0),
+    sort: Optional[str] = Query(None, regex="^-?(price|power)$")
 ):
+    if uids is not None:
+        return await get_cars_by_uids(parse_uids(uids))
+    conditions, args = car_filters(showAll, type, brand, minPrice, maxPrice, minPower)
+    filtered = len(args) > 0
+    key = SORT_KEYS[sort.lstrip("-")] if sort else "id"
+    direction = "DESC" if sort and sort.startswith("-") else "ASC"
+    after = decode_cursor(cursor, keyed=sort is not None) if cursor is not None else None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
+        async with db_pool.connection() as conn:
+            if filtered:
+                count_query = "SELECT COUNT(*) FROM cars WHERE " + " AND ".join(conditions)
+                total_elements = await conn.fetchval(count_query, *args)
+            else:
+                total_elements = await car_counts.get(conn, showAll)
 
-        count_query = "SELECT COUNT(*) FROM cars"
-        if not showAll:
-            count_query += " WHERE availability = true"
-        cur.execute(count_query)
-        total_elements = cur.fetchone()[0]
+            comparison = "<" if direction == "DESC" else ">"
+            if after is not None and sort:
+                args.extend(after)
+                conditions.append(f"({key}, id) {comparison} (${len(args) - 1}, ${len(args)})")
+            elif after is not None:
+                args.append(after)
+                conditions.append(f"id > ${len(args)}")
+            select_query = f"""
+                SELECT car_uid, brand, model, registration_number, power, price, type, availability, id, {key}
+                FROM cars
+            """
+            if conditions:
+                select_query += " WHERE " + " AND ".join(conditions)
+            order_by = f"{key} {direction}, id {direction}" if sort else "id"
+            args.append(size + 1)
+            select_query += f" ORDER BY {order_by} LIMIT ${len(args)}"
+            if after is None:
+                args.append((page - 1) * size)
+                select_query += f" OFFSET ${len(args)}"
 
-        offset = (page - 1) * size
-        select_query = """
-            SELECT car_uid, brand, model, registration_number, power, price, type, availability
-            FROM cars
-        """
-        if not showAll:
-            select_query += " WHERE availability = true"
-        select_query += " ORDER BY id LIMIT %s OFFSET %s"
-
-        cur.execute(select_query, (size, offset))
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        items = [
-            {
-                "carUid": str(r[0]),
-                "brand": r[1],
-                "model": r[2],
-                "registrationNumber": r[3],
-                "power": r[4],
-                "price": r[5],
-                "type": r[6],
-                "available": r[7]  
-            }
-            for r in rows
-        ]
+            rows = await conn.fetch(select_query, *args)
+
+        items = [car_to_dict(r) for r in rows[:size]]
+        next_cursor = None
+        if len(rows) > size:
+            last = rows[size - 1]
+            next_cursor = encode_cursor(last[8], last[9]) if sort else encode_cursor(last[8])
 
         return JSONResponse(content={
             "page": page,
             "pageSize": len(items),
             "totalElements": total_elements,
-            "items": items
+            "items": items,
+            "nextCursor": next_cursor
         })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def get_cars_by_uids(uids):
+    items = []
+    if uids:
+        try:
+            rows = await db_pool.fetch("""
+                SELECT car_uid, brand, model, registration_number, power, price, type, availability
+                FROM cars
+                WHERE car_uid = ANY($1::uuid[])
+            """, uids)
+            items = [car_to_dict(r) for r in rows]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(content={
+        "page": 1,
+        "pageSize": len(items),
+        "totalElements": len(items),
+        "items": items
+    })
+
+async def release_reservation(car_uid: str, owner: Optional[str] = None):
+    row = await db_pool.fetchrow("""
+        WITH old AS (
+            SELECT id, availability, reserved_by FROM cars WHERE car_uid = $1 FOR UPDATE
+        ), released AS (
+            UPDATE cars c SET availability = true, reserved_by = NULL
+            FROM old
+            WHERE c.id = old.id AND ($2::text IS NULL OR old.reserved_by = $2)
+            RETURNING c.id
+        )
+        SELECT old.availability, released.id IS NOT NULL FROM old LEFT JOIN released ON released.id = old.id
+    """, car_uid, owner)
+    if row is None:
+        return None
+    if row[1] and not row[0]:
+        car_counts.adjust_available(1)
+    return row[1]
+
+class CarUidsRequest(BaseModel):
+    carUids: List[str]
+
+async def set_availability_bulk(car_uids: list, available: bool) -> dict:
+    async with db_pool.connection() as conn:
+        rows = await conn.fetch("""
+            WITH locked AS (
+                SELECT id, car_uid, availability FROM cars
+                WHERE car_uid = ANY($1::uuid[])
+                ORDER BY id
+                FOR UPDATE
+            ), changed AS (
+                UPDATE cars c SET availability = $2, reserved_by = NULL
+                FROM locked
+                WHERE c.id = locked.id AND locked.availability <> $2
+                RETURNING c.id
+            )
+            SELECT locked.car_uid, changed.id IS NOT NULL
+            FROM locked LEFT JOIN changed ON changed.id = locked.id
+        """, car_uids, available)
+    changed = {str(r[0]): r[1] for r in rows}
+    car_counts.adjust_available(sum(changed.values()) * (1 if available else -1))
+    return changed
+
+@app.put("/api/v1/cars/reserve")
+@protected_route
+async def reserve_cars(request: Request, current_user: str, req: CarUidsRequest):
+    uids = normalize_uids(req.carUids)
+    try:
+        changed = await set_availability_bulk(uids, False)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    results = []
+    for uid in uids:
+        if uid not in changed:
+            status = "notFound"
+        else:
+            status = "reserved" if changed[uid] else "alreadyReserved"
+        results.append({"carUid": uid, "status": status})
+    return JSONResponse(content={"results": results})
+
+@app.put("/api/v1/cars/release")
+@protected_route
+async def release_cars(request: Request, current_user: str, req: CarUidsRequest):
+    uids = normalize_uids(req.carUids)
+    try:
+        changed = await set_availability_bulk(uids, True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(content={"results": [
+        {"carUid": uid, "status": "released" if uid in changed else "notFound"} for uid in uids
+    ]})
+
 @app.put("/api/v1/cars/{car_uid}/reserve")
 @protected_route
-def reserve_car(request: Request, current_user: str, car_uid: str):
+async def reserve_car(request: Request, current_user: str, car_uid: str):
+    owner = request.headers.get(RESERVATION_OWNER_HEADER)
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("UPDATE cars SET availability = false WHERE car_uid = %s", (car_uid,))
-        if cur.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Car not found")
-        conn.commit()
-        cur.close()
-        conn.close()
+        async with db_pool.connection() as conn:
+            reserved = await conn.fetchval("""
+                UPDATE cars SET availability = false, reserved_by = $2
+                WHERE car_uid = $1 AND availability = true
+                RETURNING id
+            """, car_uid, owner)
+            if reserved is None:
+                row = await conn.fetchrow("SELECT reserved_by FROM cars WHERE car_uid = $1", car_uid)
+                if row is None:
+                    raise HTTPException(status_code=404, detail="Car not found")
+                # A retried reserve whose first attempt already landed
+                if owner is not None and row[0] == owner:
+                    return JSONResponse(content={"status": "reserved"})
+                raise HTTPException(status_code=409, detail="Car is already reserved")
+        car_counts.adjust_available(-1)
         return JSONResponse(content={"status": "reserved"})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/v1/cars/{car_uid}/release")
 @protected_route
-def release_car(request: Request, current_user: str, car_uid: str):
+async def release_car(request: Request, current_user: str, car_uid: str):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("UPDATE cars SET availability = true WHERE car_uid = %s", (car_uid,))
-        if cur.rowcount == 0:
+        released = await release_reservation(car_uid, request.headers.get(RESERVATION_OWNER_HEADER))
+        if released is None:
             raise HTTPException(status_code=404, detail="Car not found")
-        conn.commit()
-        cur.close()
-        conn.close()
-        return JSONResponse(content={"status": "released"})
+        return JSONResponse(content={"status": "released" if released else "notReserved"})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class AvailabilityEvent(BaseModel):
+    eventId: str
+    carUid: str
+    available: bool
+
+class AvailabilityUpdate(BaseModel):
+    events: List[AvailabilityEvent]
+
+def latest_availability(events: list, fresh: set) -> dict:
+    # Events arrive in commit order, so the last new event for a car wins
+    latest = {}
+    for event in events:
+        if event.eventId in fresh:
+            latest[event.carUid] = event.available
+    return latest
+
+@app.post("/api/v1/cars/availability")
+@protected_route
+async def update_availability(request: Request, current_user: str, update: AvailabilityUpdate):
+    events = update.events
+    if len(events) > MAX_BATCH_UIDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_UIDS} events per request")
+    try:
+        for event in events:
+            event.eventId = str(uuid.UUID(event.eventId))
+            event.carUid = str(uuid.UUID(event.carUid))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid uid in events")
+    try:
+        async with db_pool.connection() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch("""
+                    INSERT INTO car_availability_events (event_id)
+                    SELECT unnest($1::uuid[])
+                    ON CONFLICT DO NOTHING
+                    RETURNING event_id
+                """, [e.eventId for e in events])
+                fresh = {str(r[0]) for r in rows}
+                latest = latest_availability(events, fresh)
+                updated = []
+                if latest:
+                    updated = await conn.fetch("""
+                        UPDATE cars c SET availability = u.available,
+                            reserved_by = CASE WHEN u.available THEN NULL ELSE c.reserved_by END
+                        FROM (SELECT id, car_uid, availability FROM cars
+                              WHERE car_uid = ANY($1::uuid[]) ORDER BY id FOR UPDATE) old
+                        JOIN unnest($1::uuid[], $2::bool[]) AS u(car_uid, available) ON u.car_uid = old.car_uid
+                        WHERE c.id = old.id
+                        RETURNING c.car_uid, old.availability, u.available
+                    """, list(latest), list(latest.values()))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    found = {str(r[0]) for r in updated}
+    car_counts.adjust_available(sum((1 if r[2] else -1) for r in updated if r[1] != r[2]))
+    results = []
+    for event in events:
+        if event.eventId not in fresh:
+            status = "duplicate"
+        elif event.carUid in found:
+            status = "applied"
+        else:
+            status = "notFound"
+        results.append({"eventId": event.eventId, "status": status})
+    return JSONResponse(content={"results": results})
+
+async def purge_events_loop():
+    while True:
+        await asyncio.sleep(EVENT_PURGE_INTERVAL)
+        try:
+            await db_pool.execute(
+                "DELETE FROM car_availability_events WHERE processed_at < now() - make_interval(secs => $1)",
+                EVENT_RETENTION
+            )
+        except Exception as e:
+            logging.warning(f"Purging availability events failed: {e}")
+
 @app.get("/api/v1/cars/{car_uid}")
 @protected_route
-def get_car_by_uid(request: Request, current_user: str, car_uid: str):
+async def get_car_by_uid(request: Request, current_user: str, car_uid: str):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("""
+        row = await db_pool.fetchrow("""
             SELECT car_uid, brand, model, registration_number, power, price, type, availability
             FROM cars
-            WHERE car_uid = %s
-        """, (car_uid,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+            WHERE car_uid = $1
+        """, car_uid)
         if not row:
             raise HTTPException(status_code=404, detail="Car not found")
-        return {
-            "carUid": str(row[0]),
-            "brand": row[1],
-            "model": row[2],
-            "registrationNumber": row[3],
-            "power": row[4],
-            "price": row[5],
-            "type": row[6],
-            "available": row[7]
-        }
+        return car_to_dict(row)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
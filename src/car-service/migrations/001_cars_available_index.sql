@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+DROP INDEX CONCURRENTLY IF EXISTS cars_available_id_idx;
+CREATE INDEX CONCURRENTLY cars_available_id_idx ON cars (id) WHERE availability = true;
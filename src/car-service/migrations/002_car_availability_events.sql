@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS car_availability_events (
+    event_id UUID PRIMARY KEY,
+    processed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS car_availability_events_processed_at_idx ON car_availability_events (processed_at);
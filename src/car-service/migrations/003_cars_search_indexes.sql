@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+DROP INDEX CONCURRENTLY IF EXISTS cars_available_type_price_idx;
+CREATE INDEX CONCURRENTLY cars_available_type_price_idx ON cars (type, price, id) WHERE availability = true;
+DROP INDEX CONCURRENTLY IF EXISTS cars_available_brand_price_idx;
+CREATE INDEX CONCURRENTLY cars_available_brand_price_idx ON cars (brand, price, id) WHERE availability = true;
+DROP INDEX CONCURRENTLY IF EXISTS cars_available_price_idx;
+CREATE INDEX CONCURRENTLY cars_available_price_idx ON cars (price, id) WHERE availability = true;
+DROP INDEX CONCURRENTLY IF EXISTS cars_available_power_idx;
+CREATE INDEX CONCURRENTLY cars_available_power_idx ON cars ((COALESCE(power, 0)), id) WHERE availability = true;
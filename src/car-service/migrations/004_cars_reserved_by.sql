@@ -0,0 +1 @@
+ALTER TABLE cars ADD COLUMN IF NOT EXISTS reserved_by TEXT;
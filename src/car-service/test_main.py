@@ -1,6 +1,9 @@
 import pytest
 from fastapi.testclient import TestClient
-from main import app
+
+from main import (
+    AvailabilityEvent, CarCounts, app, car_filters, decode_cursor, encode_cursor, latest_availability
+)
 
 client = TestClient(app)
 
@@ -14,6 +17,11 @@ def test_cars_endpoint_without_auth():
     assert response.status_code == 401
     assert "detail" in response.json()
 
+def test_cars_batch_without_auth():
+    response = client.get("/api/v1/cars?uids=test-car-uid")
+    assert response.status_code == 401
+    assert "detail" in response.json()
+
 def test_get_car_by_uid_without_auth():
     response = client.get("/api/v1/cars/test-car-uid")
     assert response.status_code == 401
@@ -28,3 +36,69 @@ def test_release_car_without_auth():
     response = client.put("/api/v1/cars/test-car-uid/release")
     assert response.status_code == 401
     assert "detail" in response.json()
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12345)) == 12345
+
+def test_invalid_cursor_is_rejected(login):
+    login()
+    response = client.get("/api/v1/cars?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+def test_available_count_is_adjusted_in_place():
+    counts = CarCounts(ttl=60)
+    counts.total, counts.available, counts.loaded_at = 10, 4, 0
+    counts.adjust_available(-1)
+    assert counts.available == 3
+    counts.adjust_available(1)
+    counts.adjust_available(100)
+    assert counts.available == 10
+
+def test_latest_new_event_per_car_wins():
+    events = [
+        AvailabilityEvent(eventId="e1", carUid="c1", available=False),
+        AvailabilityEvent(eventId="e2", carUid="c1", available=True),
+        AvailabilityEvent(eventId="e3", carUid="c2", available=True),
+        AvailabilityEvent(eventId="e4", carUid="c1", available=False),
+    ]
+    assert latest_availability(events, {"e1", "e2", "e3"}) == {"c1": True, "c2": True}
+    assert latest_availability(events, set()) == {}
+
+def test_availability_events_need_valid_uids(login):
+    login("rental-service")
+    response = client.post("/api/v1/cars/availability", json={
+        "events": [{"eventId": "not-a-uuid", "carUid": "109b42f3-198d-4c89-9276-a7520a7120ab", "available": True}]
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid uid in events"
+
+def test_bulk_reserve_validates_uids(login):
+    login()
+    invalid = client.put("/api/v1/cars/reserve", json={"carUids": ["not-a-uuid"]})
+    too_many = client.put("/api/v1/cars/release", json={"carUids": [str(i) for i in range(501)]})
+    assert invalid.status_code == 400
+    assert too_many.json()["detail"] == "At most 500 uids per request"
+
+def test_sorted_cursor_carries_the_sort_key():
+    assert decode_cursor(encode_cursor(42, 1500), keyed=True) == (1500, 42)
+    with pytest.raises(Exception):
+        decode_cursor(encode_cursor(42), keyed=True)
+
+def test_car_filters_are_validated(login):
+    login()
+    bad_type = client.get("/api/v1/cars?type=TRUCK")
+    bad_range = client.get("/api/v1/cars?minPrice=500&maxPrice=100")
+    bad_sort = client.get("/api/v1/cars?sort=brand")
+    assert bad_type.status_code == 400
+    assert bad_type.json()["detail"] == "type must be one of SEDAN, SUV, MINIVAN, ROADSTER"
+    assert bad_range.status_code == 400
+    assert bad_sort.status_code == 422
+
+def test_car_filters_build_indexable_conditions():
+    conditions, args = car_filters(False, "suv, sedan,SUV", "BMW", 100, None, 150)
+    assert conditions == [
+        "availability = true", "type = ANY($1::text[])", "brand = $2", "price >= $3", "COALESCE(power, 0) >= $4"
+    ]
+    assert args == [["SUV", "SEDAN"], "BMW", 100, 150]
+    assert car_filters(True, "suv", None, None, None, None) == (["type = $1"], ["SUV"])
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import re
+import time
+
+MIGRATIONS_TABLE = "schema_migrations"
+MIGRATIONS_LOCK_KEY = 7_262_011
+MIGRATIONS_LOCK_POLL = 0.5
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+_FILENAME = re.compile(r"^(\d+)_([\w-]+)\.sql$")
+
+
+class Migration:
+    def __init__(self, version: int, name: str, sql: str):
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.transactional = not sql.lstrip().startswith(NO_TRANSACTION)
+
+    def statements(self) -> list:
+        sql = "\n".join(line for line in self.sql.splitlines() if not line.strip().startswith("--"))
+        return [s.strip() for s in re.split(r";\s*(?:\n|$)", sql) if s.strip()]
+
+
+def load_migrations(directory: str) -> list:
+    migrations = {}
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"Duplicate migration version {version} in {directory}")
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            migrations[version] = Migration(version, match.group(2), f.read())
+    return [migrations[v] for v in sorted(migrations)]
+
+
+async def migrate(pool, directory: str) -> list:
+    migrations = load_migrations(directory)
+    applied = []
+    async with pool.connection() as conn:
+        await _lock(conn)
+        try:
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+                    version INT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            done = {r[0] for r in await conn.fetch(f"SELECT version FROM {MIGRATIONS_TABLE}")}
+            for migration in migrations:
+                if migration.version in done:
+                    continue
+                logging.info(f"Applying migration {migration.version}_{migration.name}")
+                if migration.transactional:
+                    async with conn.transaction():
+                        await conn.execute(migration.sql)
+                        await _record(conn, migration)
+                else:
+                    for statement in migration.statements():
+                        await conn.execute(statement)
+                    await _record(conn, migration)
+                applied.append(migration.version)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_KEY)
+    return applied
+
+
+async def _lock(conn):
+    # Poll rather than block in pg_advisory_lock: a replica waiting inside that
+    # statement holds a transaction which CREATE INDEX CONCURRENTLY in the lock
+    # holder's migration then waits for, and Postgres reports a deadlock
+    while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATIONS_LOCK_KEY):
+        await asyncio.sleep(MIGRATIONS_LOCK_POLL)
+
+
+async def _record(conn, migration: Migration):
+    await conn.execute(
+        f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES ($1, $2)",
+        migration.version, migration.name
+    )
+
+
+async def migrate_on_startup(pool, directory: str, timeout: float = None, max_delay: float = 10.0):
+    if os.environ.get("DB_MIGRATE_ON_STARTUP", "true").lower() not in ("1", "true", "yes", "on"):
+        return
+    if timeout is None:
+        timeout = float(os.environ.get("DB_MIGRATE_TIMEOUT", "45"))
+    # Retry until the database is reachable, then fail startup rather than
+    # serving on a partial schema
+    deadline = time.monotonic() + timeout
+    delay = min(0.5, max_delay)
+    while True:
+        try:
+            applied = await migrate(pool, directory)
+            break
+        except Exception as e:
+            if time.monotonic() + delay > deadline:
+                logging.error(f"Database migrations from {directory} failed: {e}")
+                raise
+            logging.warning(f"Database migrations from {directory} failed, retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+    if applied:
+        logging.info(f"Applied migrations {applied} from {directory}")
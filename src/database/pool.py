@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+
+RESET_QUERY_PREFIX = "SELECT pg_advisory_unlock_all()"
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        dsn: str = None,
+        min_size: int = 1,
+        max_size: int = 10,
+        acquire_timeout: float = 5.0,
+        healthcheck_interval: float = 30.0,
+        max_inactive_lifetime: float = 300.0,
+        create_pool=None,
+        query_loggers=(),
+        **conn_kwargs
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Expected 0 <= min_size <= max_size and max_size >= 1")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.max_inactive_lifetime = max_inactive_lifetime
+        self._create_pool = create_pool or asyncpg.create_pool
+        self._conn_kwargs = conn_kwargs
+        self._query_loggers = tuple(query_loggers)
+        self._pool = None
+        self._opening = None
+        self._last_used = {}
+        self._in_use = 0
+        self._waiting = 0
+        self._acquired_total = 0
+        self._timeouts_total = 0
+        self._discarded_total = 0
+        self._wait_seconds_total = 0.0
+        self._wait_seconds_max = 0.0
+
+    @classmethod
+    def from_env(cls, query_loggers=(), **conn_kwargs) -> "ConnectionPool":
+        dsn = os.environ.get("DATABASE_URL")
+        if dsn:
+            conn_kwargs = {}
+        return cls(
+            dsn=dsn,
+            min_size=int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+            max_size=int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            acquire_timeout=float(os.environ.get("DB_POOL_ACQUIRE_TIMEOUT", "5")),
+            healthcheck_interval=float(os.environ.get("DB_POOL_HEALTHCHECK_INTERVAL", "30")),
+            query_loggers=query_loggers,
+            **conn_kwargs
+        )
+
+    async def open(self):
+        if self._pool is not None:
+            return self._pool
+        if self._opening is None:
+            kwargs = dict(self._conn_kwargs)
+            if self._query_loggers:
+                kwargs["init"] = self._init_connection
+            self._opening = asyncio.ensure_future(self._create_pool(
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                max_inactive_connection_lifetime=self.max_inactive_lifetime,
+                **kwargs
+            ))
+        try:
+            self._pool = await self._opening
+        finally:
+            self._opening = None
+        return self._pool
+
+    async def _init_connection(self, conn):
+        conn.add_query_logger(self._log_query)
+
+    def _log_query(self, record):
+        if record.query.startswith(RESET_QUERY_PREFIX):
+            return
+        for logger in self._query_loggers:
+            logger(record)
+
+    async def start(self):
+        try:
+            await self.open()
+        except Exception as e:
+            logging.warning(f"Could not open database pool, will retry on first use: {e}")
+
+    async def close(self):
+        pool, self._pool = self._pool, None
+        self._last_used.clear()
+        if pool is not None:
+            await pool.close()
+
+    @asynccontextmanager
+    async def connection(self, timeout: float = None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            pool = self._pool or await self.open()
+            conn = await self._acquire(pool, timeout)
+        finally:
+            self._waiting -= 1
+        waited = time.monotonic() - started
+        self._acquired_total += 1
+        self._wait_seconds_total += waited
+        self._wait_seconds_max = max(self._wait_seconds_max, waited)
+        self._in_use += 1
+        try:
+            yield conn
+        finally:
+            self._in_use -= 1
+            if len(self._last_used) > 4 * self.max_size:
+                self._last_used.clear()
+            self._last_used[self._conn_key(conn)] = time.monotonic()
+            await pool.release(conn)
+
+    async def _acquire(self, pool, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                conn = await pool.acquire(timeout=max(remaining, 0.001))
+            except asyncio.TimeoutError:
+                self._timeouts_total += 1
+                raise PoolTimeout(f"Timed out after {timeout}s waiting for a database connection")
+            if await self._is_healthy(conn):
+                return conn
+            self._discarded_total += 1
+            self._last_used.pop(self._conn_key(conn), None)
+            conn.terminate()
+            await pool.release(conn)
+
+    async def _is_healthy(self, conn) -> bool:
+        if conn.is_closed():
+            return False
+        last_used = self._last_used.get(self._conn_key(conn))
+        if last_used is None or time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        try:
+            await conn.fetchval("SELECT 1", timeout=self.acquire_timeout)
+            return True
+        except Exception as e:
+            logging.warning(f"Discarding unhealthy database connection: {e}")
+            return False
+
+    def _conn_key(self, conn):
+        return conn.get_server_pid()
+
+    async def fetch(self, query: str, *args):
+        async with self.connection() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args):
+        async with self.connection() as conn:
+            return await conn.fetchrow(query, *args)
+
+    async def fetchval(self, query: str, *args):
+        async with self.connection() as conn:
+            return await conn.fetchval(query, *args)
+
+    async def execute(self, query: str, *args):
+        async with self.connection() as conn:
+            return await conn.execute(query, *args)
+
+    def stats(self) -> dict:
+        pool = self._pool
+        acquired = self._acquired_total
+        return {
+            "minSize": self.min_size,
+            "maxSize": self.max_size,
+            "size": pool.get_size() if pool is not None else 0,
+            "idle": pool.get_idle_size() if pool is not None else 0,
+            "inUse": self._in_use,
+            "waiting": self._waiting,
+            "acquiredTotal": acquired,
+            "timeoutsTotal": self._timeouts_total,
+            "discardedTotal": self._discarded_total,
+            "waitSecondsTotal": round(self._wait_seconds_total, 6),
+            "waitSecondsMax": round(self._wait_seconds_max, 6),
+            "waitSecondsAvg": round(self._wait_seconds_total / acquired, 6) if acquired else 0.0,
+        }
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
+from database import migrations
+from database.migrations import load_migrations, migrate, migrate_on_startup
+
+class FakeConnection:
+    def __init__(self, applied=(), lock_busy=0):
+        self.applied = set(applied)
+        self.statements = []
+        self.in_transaction = False
+        self.lock_busy = lock_busy
+
+    async def execute(self, query, *args):
+        if query.startswith("INSERT INTO schema_migrations"):
+            self.applied.add(args[0])
+        self.statements.append((query.strip(), self.in_transaction))
+
+    async def fetch(self, query, *args):
+        return [(v,) for v in self.applied]
+
+    async def fetchval(self, query, *args):
+        self.statements.append((query.strip(), self.in_transaction))
+        if self.lock_busy:
+            self.lock_busy -= 1
+            return False
+        return True
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        try:
+            yield
+        finally:
+            self.in_transaction = False
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self.conn
+
+def write(directory, name, sql):
+    (directory / name).write_text(sql)
+
+def test_migrations_are_loaded_in_version_order(tmp_path):
+    write(tmp_path, "010_later.sql", "SELECT 10;")
+    write(tmp_path, "002_second.sql", "SELECT 2;")
+    write(tmp_path, "README.md", "not a migration")
+    assert [(m.version, m.name) for m in load_migrations(tmp_path)] == [(2, "second"), (10, "later")]
+
+def test_duplicate_versions_are_rejected(tmp_path):
+    write(tmp_path, "001_a.sql", "SELECT 1;")
+    write(tmp_path, "1_b.sql", "SELECT 1;")
+    with pytest.raises(ValueError):
+        load_migrations(tmp_path)
+
+def test_only_pending_migrations_are_applied(tmp_path):
+    write(tmp_path, "001_create.sql", "CREATE TABLE t (id INT);")
+    write(tmp_path, "002_index.sql", "-- migrate: no-transaction\nCREATE INDEX CONCURRENTLY t_idx ON t (id);\nANALYZE t;\n")
+    conn = FakeConnection(applied={1})
+    assert asyncio.run(migrate(FakePool(conn), tmp_path)) == [2]
+    assert ("CREATE INDEX CONCURRENTLY t_idx ON t (id)", False) in conn.statements
+    assert ("ANALYZE t", False) in conn.statements
+    assert not any(q.startswith("CREATE TABLE t") for q, _ in conn.statements)
+    assert conn.statements[-1][0].startswith("SELECT pg_advisory_unlock")
+    assert asyncio.run(migrate(FakePool(conn), tmp_path)) == []
+
+def test_transactional_migration_records_inside_transaction(tmp_path):
+    write(tmp_path, "001_create.sql", "CREATE TABLE t (id INT);")
+    conn = FakeConnection()
+    asyncio.run(migrate(FakePool(conn), tmp_path))
+    assert ("CREATE TABLE t (id INT);", True) in conn.statements
+    assert conn.applied == {1}
+
+class FlakyPool(FakePool):
+    def __init__(self, conn, failures):
+        super().__init__(conn)
+        self.failures = failures
+
+    @asynccontextmanager
+    async def connection(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionRefusedError("database is starting up")
+        yield self.conn
+
+def test_startup_migrations_retry_until_the_database_is_up(tmp_path):
+    write(tmp_path, "001_create.sql", "CREATE TABLE t (id INT);")
+    conn = FakeConnection()
+    asyncio.run(migrate_on_startup(FlakyPool(conn, failures=2), tmp_path, timeout=5, max_delay=0.01))
+    assert conn.applied == {1}
+
+def test_startup_fails_when_migrations_cannot_be_applied(tmp_path):
+    write(tmp_path, "001_create.sql", "CREATE TABLE t (id INT);")
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(migrate_on_startup(FlakyPool(FakeConnection(), failures=100), tmp_path, timeout=0))
+
+def test_migrations_wait_for_the_lock_without_blocking_in_postgres(tmp_path, monkeypatch):
+    write(tmp_path, "001_create.sql", "CREATE TABLE t (id INT);")
+    monkeypatch.setattr(migrations, "MIGRATIONS_LOCK_POLL", 0.001)
+    conn = FakeConnection(lock_busy=2)
+    assert asyncio.run(migrate(FakePool(conn), tmp_path)) == [1]
+    locks = [q for q, _ in conn.statements if "advisory" in q and "unlock" not in q]
+    assert locks == ["SELECT pg_try_advisory_lock($1)"] * 3
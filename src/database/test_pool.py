@@ -0,0 +1,149 @@
+import asyncio
+import itertools
+import pytest
+from database.pool import ConnectionPool, PoolTimeout
+
+_pids = itertools.count(1000)
+
+class FakeConnection:
+    def __init__(self):
+        self.pid = next(_pids)
+        self.closed = False
+        self.broken = False
+        self.queries = []
+
+    def get_server_pid(self):
+        return self.pid
+
+    def is_closed(self):
+        return self.closed
+
+    def terminate(self):
+        self.closed = True
+
+    async def fetchval(self, query, *args, timeout=None):
+        if self.broken:
+            raise ConnectionError("server closed the connection unexpectedly")
+        self.queries.append(query)
+        return 1
+
+    async def execute(self, query, *args):
+        self.queries.append(query)
+        return "UPDATE 1"
+
+class FakePool:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.idle = []
+        self.created = []
+        self.in_use = 0
+        self.released = asyncio.Condition()
+
+    async def acquire(self, timeout=None):
+        async with self.released:
+            while not self.idle and len(self.created) >= self.max_size:
+                await asyncio.wait_for(self.released.wait(), timeout)
+            if self.idle:
+                conn = self.idle.pop()
+            else:
+                conn = FakeConnection()
+                self.created.append(conn)
+        if conn.closed:
+            self.created.remove(conn)
+            conn = FakeConnection()
+            self.created.append(conn)
+        self.in_use += 1
+        return conn
+
+    async def release(self, conn):
+        async with self.released:
+            self.in_use -= 1
+            self.idle.append(conn)
+            self.released.notify()
+
+    def get_size(self):
+        return len(self.created)
+
+    def get_idle_size(self):
+        return len(self.idle)
+
+    async def close(self):
+        pass
+
+def make_pool(**kwargs):
+    fake = {}
+
+    async def create_pool(dsn, min_size, max_size, **conn_kwargs):
+        fake["pool"] = FakePool(max_size)
+        return fake["pool"]
+
+    return ConnectionPool(create_pool=create_pool, **kwargs), fake
+
+def test_connections_are_reused():
+    pool, fake = make_pool(max_size=2)
+
+    async def scenario():
+        async with pool.connection() as first:
+            pass
+        async with pool.connection() as second:
+            pass
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first is second
+    assert len(fake["pool"].created) == 1
+    assert pool.stats()["acquiredTotal"] == 2
+    assert pool.stats()["inUse"] == 0
+
+def test_acquire_times_out_when_exhausted():
+    pool, _ = make_pool(max_size=1, acquire_timeout=0.05)
+
+    async def scenario():
+        async with pool.connection():
+            with pytest.raises(PoolTimeout):
+                async with pool.connection():
+                    pass
+
+    asyncio.run(scenario())
+    assert pool.stats()["timeoutsTotal"] == 1
+
+def test_waiter_gets_released_connection():
+    pool, fake = make_pool(max_size=1, acquire_timeout=1)
+
+    async def hold():
+        async with pool.connection() as conn:
+            await asyncio.sleep(0.01)
+            return conn
+
+    async def scenario():
+        return await asyncio.gather(hold(), hold())
+
+    first, second = asyncio.run(scenario())
+    assert first is second
+    assert pool.stats()["waitSecondsMax"] > 0
+
+def test_stale_idle_connection_is_replaced():
+    pool, fake = make_pool(healthcheck_interval=0)
+
+    async def scenario():
+        async with pool.connection() as conn:
+            pass
+        conn.broken = True
+        async with pool.connection() as replacement:
+            pass
+        return conn, replacement
+
+    conn, replacement = asyncio.run(scenario())
+    assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()["discardedTotal"] == 1
+
+def test_helpers_borrow_a_connection():
+    pool, fake = make_pool()
+    result = asyncio.run(pool.execute("UPDATE cars SET availability = true"))
+    assert result == "UPDATE 1"
+    assert pool.stats()["inUse"] == 0
+
+def test_invalid_sizes():
+    with pytest.raises(ValueError):
+        ConnectionPool(min_size=5, max_size=2)
@@ -0,0 +1,207 @@
+import functools
+import logging
+import time
+from collections import deque
+
+import httpx
+
+from instrumentation.metrics import watch_breaker
+from upstream import _env_float, _env_int
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit {name} is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_failure(error: BaseException) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def is_unavailable(error: BaseException) -> bool:
+    return isinstance(error, CircuitOpenError) or is_failure(error)
+
+
+class BreakerConfig:
+    def __init__(
+        self,
+        window: float = 10.0,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        open_for: float = 0.5,
+        max_open_for: float = 30.0,
+        half_open_max_calls: int = 1,
+        half_open_successes: int = 2,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_for = open_for
+        self.max_open_for = max_open_for
+        self.half_open_max_calls = half_open_max_calls
+        self.half_open_successes = half_open_successes
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "BreakerConfig":
+        return cls(
+            window=_env_float(f"{prefix}_BREAKER_WINDOW", 10.0),
+            min_calls=_env_int(f"{prefix}_BREAKER_MIN_CALLS", 5),
+            failure_rate=_env_float(f"{prefix}_BREAKER_FAILURE_RATE", 0.5),
+            open_for=_env_float(f"{prefix}_BREAKER_OPEN_SECONDS", 0.5),
+            max_open_for=_env_float(f"{prefix}_BREAKER_MAX_OPEN_SECONDS", 30.0),
+            half_open_max_calls=_env_int(f"{prefix}_BREAKER_HALF_OPEN_CALLS", 1),
+            half_open_successes=_env_int(f"{prefix}_BREAKER_HALF_OPEN_SUCCESSES", 2),
+        )
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, config: BreakerConfig = None, clock=time.monotonic):
+        self.name = name
+        self.config = config or BreakerConfig()
+        self._clock = clock
+        self._buckets = deque()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._open_for = self.config.open_for
+        self._probes = 0
+        self._probe_successes = 0
+        self.calls_total = 0
+        self.failures_total = 0
+        self.rejected_total = 0
+        self.opened_total = 0
+
+    @property
+    def current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self._open_for:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+        return self._state
+
+    def _trim(self, now: float):
+        cutoff = now - self.config.window
+        while self._buckets and self._buckets[0][0] <= cutoff:
+            self._buckets.popleft()
+
+    def window_counts(self) -> tuple:
+        self._trim(self._clock())
+        return sum(b[1] for b in self._buckets), sum(b[2] for b in self._buckets)
+
+    def _record(self, failed: bool):
+        now = self._clock()
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        self._trim(now)
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self.opened_total += 1
+        logging.warning(f"Circuit {self.name} opened for {self._open_for:.2f}s")
+
+    def _close(self):
+        self._state = CLOSED
+        self._buckets.clear()
+        self._open_for = self.config.open_for
+        logging.info(f"Circuit {self.name} closed")
+
+    def before_call(self):
+        state = self.current_state
+        if state == OPEN:
+            self.rejected_total += 1
+            raise CircuitOpenError(self.name, self._opened_at + self._open_for - self._clock())
+        if state == HALF_OPEN:
+            if self._probes >= self.config.half_open_max_calls:
+                self.rejected_total += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._probes += 1
+        self.calls_total += 1
+        return state
+
+    def after_call(self, state: str, error: BaseException = None):
+        failed = error is not None and is_failure(error)
+        self.failures_total += failed
+        if state == HALF_OPEN:
+            self._probes -= 1
+            if self._state != HALF_OPEN:
+                return
+            if failed:
+                self._open_for = min(self._open_for * 2, self.config.max_open_for)
+                self._open()
+            elif error is None:
+                self._probe_successes += 1
+                if self._probe_successes >= self.config.half_open_successes:
+                    self._close()
+            return
+        self._record(failed)
+        if failed and self._state == CLOSED:
+            calls, failures = self.window_counts()
+            if calls >= self.config.min_calls and failures / calls >= self.config.failure_rate:
+                self._open()
+
+    async def call(self, func, *args, **kwargs):
+        state = self.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            self.after_call(state, e)
+            raise
+        self.after_call(state)
+        return result
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await self.call(func, *args, **kwargs)
+        return wrapper
+
+    def stats(self) -> dict:
+        calls, failures = self.window_counts()
+        return {
+            "state": self.current_state,
+            "windowCalls": calls,
+            "windowFailures": failures,
+            "windowFailureRate": round(failures / calls, 4) if calls else 0.0,
+            "openForSeconds": self._open_for,
+            "callsTotal": self.calls_total,
+            "failuresTotal": self.failures_total,
+            "rejectedTotal": self.rejected_total,
+            "openedTotal": self.opened_total,
+        }
+
+
+class BreakerGroup:
+    def __init__(self, name: str, config: BreakerConfig = None, clock=time.monotonic):
+        self.name = name
+        self.config = config or BreakerConfig()
+        self._clock = clock
+        self.breakers = {}
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str) -> "BreakerGroup":
+        return cls(name, BreakerConfig.from_env(prefix))
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(f"{self.name}.{endpoint}", self.config, self._clock)
+            watch_breaker(breaker.name, breaker)
+        return breaker
+
+    def __call__(self, func):
+        return self.breaker(func.__name__.removeprefix("call_"))(func)
+
+    def stats(self) -> dict:
+        return {endpoint: breaker.stats() for endpoint, breaker in self.breakers.items()}
@@ -0,0 +1,28 @@
+import httpx
+import pytest
+
+import main as gateway
+from auth_service.auth import get_current_user
+from upstream import Upstream, UpstreamConfig
+
+
+@pytest.fixture
+def login():
+    def as_user(username: str = "testuser"):
+        gateway.app.dependency_overrides[get_current_user] = lambda: username
+
+    yield as_user
+    gateway.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def mock_upstreams(monkeypatch):
+    def install(handler, *names) -> dict:
+        transport = httpx.MockTransport(handler)
+        upstreams = {}
+        for name in names:
+            upstreams[name] = Upstream(UpstreamConfig(name, f"http://{name}.test"), transport=transport)
+            monkeypatch.setattr(gateway, f"{name}_upstream", upstreams[name])
+        return upstreams
+
+    return install
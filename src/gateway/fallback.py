@@ -0,0 +1,141 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+
+from upstream import _env_float, _env_int
+
+STALE_WARNING = '110 - "Response is Stale"'
+
+_staleness = contextvars.ContextVar("staleness", default=None)
+
+
+class Staleness:
+    def __init__(self):
+        self.max_age = None
+
+    def mark(self, age: float):
+        self.max_age = age if self.max_age is None else max(self.max_age, age)
+
+    def apply(self, response):
+        if self.max_age is not None:
+            response.headers["Warning"] = STALE_WARNING
+            response.headers["Age"] = str(int(self.max_age))
+        return response
+
+
+def track_staleness() -> Staleness:
+    staleness = Staleness()
+    _staleness.set(staleness)
+    return staleness
+
+
+class FallbackCache:
+    def __init__(
+        self,
+        name: str,
+        max_size: int = 10000,
+        max_age: float = 86400.0,
+        refresh_interval: float = 5.0,
+        max_pending: int = 100,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.max_size = max_size
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self.max_pending = max_pending
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._attempted = {}
+        self._pending = {}
+        self.stale_served = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.revalidation_failures = 0
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, max_size: int = 10000, max_age: float = 86400.0) -> "FallbackCache":
+        return cls(
+            name,
+            max_size=_env_int(f"{prefix}_SIZE", max_size),
+            max_age=_env_float(f"{prefix}_MAX_AGE", max_age),
+            refresh_interval=_env_float(f"{prefix}_REFRESH_INTERVAL", 5.0),
+        )
+
+    def put(self, key, value):
+        if self.max_size <= 0 or value is None:
+            return
+        self._entries[key] = (value, self._clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def update(self, key, **fields):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = ({**entry[0], **fields}, entry[1])
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = self._clock() - entry[1]
+        if age > self.max_age:
+            del self._entries[key]
+            return None
+        return entry[0], age
+
+    def serve_stale(self, key, refresh=None):
+        entry = self.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, age = entry
+        self.stale_served += 1
+        staleness = _staleness.get()
+        if staleness is not None:
+            staleness.mark(age)
+        if refresh is not None:
+            self.revalidate(key, refresh)
+        return value
+
+    def revalidate(self, key, refresh):
+        now = self._clock()
+        if key in self._pending or len(self._pending) >= self.max_pending:
+            return
+        if now - self._attempted.get(key, float("-inf")) < self.refresh_interval:
+            return
+        if len(self._attempted) > 4 * self.max_size:
+            self._attempted.clear()
+        self._attempted[key] = now
+        self.revalidations += 1
+        task = asyncio.ensure_future(self._refresh(key, refresh))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    async def _refresh(self, key, refresh):
+        try:
+            self.put(key, await refresh())
+        except Exception as e:
+            self.revalidation_failures += 1
+            logging.info(f"Revalidating {self.name} {key} failed: {e}")
+
+    async def close(self):
+        pending = list(self._pending.values())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "maxAgeSeconds": self.max_age,
+            "staleServed": self.stale_served,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "revalidationFailures": self.revalidation_failures,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,20 @@
+import asyncio
+import os
+
+FANOUT_CONCURRENCY = int(os.environ.get("FANOUT_CONCURRENCY", "10"))
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "100"))
+
+
+async def gather_bounded(coros, limit: int = FANOUT_CONCURRENCY, return_exceptions: bool = False):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros), return_exceptions=return_exceptions)
+
+
+def chunked(items, size: int = BATCH_SIZE):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -1,150 +1,615 @@
-from fastapi import FastAPI, Header, Query, Request
-from fastapi.responses import JSONResponse, Response
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
 import httpx
+import asyncio
 from datetime import datetime
 import uuid
+import json
 import logging
-import pybreaker
 from httpx import ConnectError, TimeoutException, NetworkError
 import os
-from auth_service.auth import protected_route, get_current_user
-
-payment_circuit = pybreaker.CircuitBreaker(
-    fail_max=2,
-    reset_timeout=15000
-)
-
-rental_circuit = pybreaker.CircuitBreaker(
-    fail_max=2,
-    reset_timeout=15000
-)
-
-cars_circuit = pybreaker.CircuitBreaker(
-    fail_max=2,
-    reset_timeout=15000
-)
+from auth_service.auth import protected_route, jwks_cache, token_cache, forward_headers, INTERNAL_IDENTITY_HEADER
+from upstream import Upstream, UpstreamConfig, UpstreamRegistry
+from fanout import gather_bounded, chunked
+from cache import TTLCache
+from saga import Saga, SagaFailed, Step, StepMetrics
+from saga_store import SagaClaimed, saga_store_from_env
+from breaker import BreakerGroup, CircuitOpenError, is_unavailable
+from fallback import FallbackCache, track_staleness
+from singleflight import SingleFlight
+from instrumentation.metrics import instrument_app, timed_call
+from instrumentation.tracing import trace_app, traced, tracer
+
+payment_circuit = BreakerGroup.from_env("payment", "PAYMENT_SERVICE")
+rental_circuit = BreakerGroup.from_env("rental", "RENTAL_SERVICE")
+cars_circuit = BreakerGroup.from_env("cars", "CAR_SERVICE")
 
 app = FastAPI()
-CARS_SERVICE = os.environ.get('CAR_SERVICE_URL', 'http://car-service:80')
-RENTAL_SERVICE = os.environ.get('RENTAL_SERVICE_URL', 'http://rental-service:80')
-PAYMENT_SERVICE = os.environ.get('PAYMENT_SERVICE_URL', 'http://payment-service:80')
-
-saga_log = {}
+instrument_app(app)
+trace_app(app, "gateway")
+
+upstreams = UpstreamRegistry([
+    Upstream(UpstreamConfig.from_env("cars", "CAR_SERVICE", "http://car-service:80")),
+    Upstream(UpstreamConfig.from_env("rental", "RENTAL_SERVICE", "http://rental-service:80")),
+    Upstream(UpstreamConfig.from_env("payment", "PAYMENT_SERVICE", "http://payment-service:80")),
+])
+cars_upstream = upstreams["cars"]
+rental_upstream = upstreams["rental"]
+payment_upstream = upstreams["payment"]
+
+car_cache = TTLCache.from_env("car", "CAR_CACHE", max_size=1000, ttl=60)
+cars_page_cache = TTLCache.from_env("carsPage", "CARS_PAGE_CACHE", max_size=200, ttl=5)
+car_fallback = FallbackCache.from_env("car", "CAR_FALLBACK")
+payment_fallback = FallbackCache.from_env("payment", "PAYMENT_FALLBACK")
+cars_flight = SingleFlight("cars")
+rental_flight = SingleFlight("rental", per_identity=True)
+payment_flight = SingleFlight("payment", per_identity=True)
+
+saga_store = saga_store_from_env()
+SAGA_RECOVERY_INTERVAL = float(os.environ.get("SAGA_RECOVERY_INTERVAL", "30"))
+SAGA_STUCK_AFTER = float(os.environ.get("SAGA_STUCK_AFTER", "60"))
+RENTAL_STREAM_BATCH = int(os.environ.get("RENTAL_STREAM_BATCH", "100"))
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", "5000"))
+RESERVATION_OWNER_HEADER = "X-Reservation-Owner"
+saga_recovery_task = None
+saga_metrics = StepMetrics()
 
 class RentalRequest(BaseModel):
     carUid: str
     dateFrom: str
     dateTo: str
 
+class RentalUidsRequest(BaseModel):
+    rentalUids: List[str]
+
+@timed_call
+@traced
 @payment_circuit
-async def call_create_payment(client, price: int, auth_header: str):
-    r = await client.post(
-        f"{PAYMENT_SERVICE}/api/v1/payment", 
+async def call_create_payment(price: int, auth: dict):
+    r = await payment_upstream.post(
+        "/api/v1/payment", 
         json={"price": price},
-        headers={"Authorization": auth_header}
+        headers=auth
     )
     r.raise_for_status()
     return r.json()
 
+@timed_call
+@traced
+@payment_circuit
+async def call_cancel_payment(payment_uid: str, auth: dict):
+    try:
+        r = await payment_upstream.delete(
+            f"/api/v1/payment/{payment_uid}",
+            headers=auth
+        )
+    finally:
+        payment_flight.forget()
+    r.raise_for_status()
+    return r.json()
+
+@payment_flight
+@timed_call
+@traced
+@payment_circuit
+async def call_get_payment(payment_uid: str, auth: dict):
+    r = await payment_upstream.get(
+        f"/api/v1/payment/{payment_uid}",
+        headers=auth
+    )
+    if r.status_code >= 500:
+        r.raise_for_status()
+    if r.status_code != 200:
+        return None
+    return r.json()
+
+@payment_flight
+@timed_call
+@traced
 @payment_circuit
-async def call_cancel_payment(client, payment_uid: str, auth_header: str):
-    r = await client.delete(
-        f"{PAYMENT_SERVICE}/api/v1/payment/{payment_uid}",
-        headers={"Authorization": auth_header}
+async def call_get_payments(payment_uids: list, auth: dict):
+    r = await payment_upstream.get(
+        "/api/v1/payment",
+        params={"uids": ",".join(payment_uids)},
+        headers=auth
     )
     r.raise_for_status()
     return r.json()
 
+@rental_flight
+@timed_call
+@traced
 @rental_circuit
-async def call_get_rental(client, rental_uid: str, auth_header: str):
-    r = await client.get(
-        f"{RENTAL_SERVICE}/api/v1/rental/{rental_uid}",
-        headers={"Authorization": auth_header}
+async def call_get_rental(rental_uid: str, auth: dict):
+    r = await rental_upstream.get(
+        f"/api/v1/rental/{rental_uid}",
+        headers=auth
     )
     r.raise_for_status()
     return r.json()
 
+@rental_flight
+@timed_call
+@traced
 @rental_circuit
-async def call_get_rentals(client, auth_header: str):
-    r = await client.get(
-        f"{RENTAL_SERVICE}/api/v1/rental",
-        headers={"Authorization": auth_header}
+async def call_get_rentals(auth: dict, params: dict = None):
+    r = await rental_upstream.get(
+        "/api/v1/rental",
+        params=params,
+        headers=auth
     )
     r.raise_for_status()
     return r.json()
 
+@timed_call
+@traced
 @rental_circuit
-async def call_create_rental(client, data: dict, auth_header: str):
-    r = await client.post(
-        f"{RENTAL_SERVICE}/api/v1/rental",
-        json=data,
-        headers={"Authorization": auth_header}
+async def call_stream_rentals(params: dict, auth: dict):
+    r = await rental_upstream.stream(
+        "GET",
+        "/api/v1/rental",
+        params={**params, "stream": "true"},
+        headers=auth
     )
+    if r.status_code >= 400:
+        await r.aread()
+        await r.aclose()
+        r.raise_for_status()
+    return r
+
+@timed_call
+@traced
+@rental_circuit
+async def call_create_rental(data: dict, auth: dict):
+    try:
+        r = await rental_upstream.post(
+            "/api/v1/rental",
+            json=data,
+            headers=auth
+        )
+    finally:
+        rental_flight.forget()
     r.raise_for_status()
     return r.json()
 
+@timed_call
+@traced
 @rental_circuit
-async def call_cancel_rental(client, rental_uid: str, auth_header: str):
-    r = await client.delete(
-        f"{RENTAL_SERVICE}/api/v1/rental/{rental_uid}",
-        headers={"Authorization": auth_header}
-    )
+async def call_cancel_rental(rental_uid: str, auth: dict):
+    try:
+        r = await rental_upstream.delete(
+            f"/api/v1/rental/{rental_uid}",
+            headers=auth
+        )
+    finally:
+        rental_flight.forget()
     r.raise_for_status()
     return r.json()
 
+@timed_call
+@traced
 @rental_circuit
-async def call_finish_rental(client, rental_uid: str, auth_header: str):
-    r = await client.post(
-        f"{RENTAL_SERVICE}/api/v1/rental/{rental_uid}/finish",
-        headers={"Authorization": auth_header}
-    )
+async def call_finish_rental(rental_uid: str, auth: dict):
+    try:
+        r = await rental_upstream.post(
+            f"/api/v1/rental/{rental_uid}/finish",
+            headers=auth
+        )
+    finally:
+        rental_flight.forget()
     r.raise_for_status()
     return r.json()
 
+@timed_call
+@traced
+@rental_circuit
+async def call_finish_rentals(rental_uids: list, auth: dict):
+    try:
+        r = await rental_upstream.post(
+            "/api/v1/rental/finish",
+            json={"rentalUids": rental_uids},
+            headers=auth
+        )
+    finally:
+        rental_flight.forget()
+    r.raise_for_status()
+    return r.json()["results"]
+
+@timed_call
+@traced
+@rental_circuit
+async def call_cancel_rentals(rental_uids: list, auth: dict):
+    try:
+        r = await rental_upstream.post(
+            "/api/v1/rental/cancel",
+            json={"rentalUids": rental_uids},
+            headers=auth
+        )
+    finally:
+        rental_flight.forget()
+    r.raise_for_status()
+    return r.json()["results"]
+
+@cars_flight
+@timed_call
+@traced
 @cars_circuit
-async def call_get_cars(client, page: int, size: int, showAll: bool):
-    params = {"page": page, "size": size, "showAll": str(showAll).lower()}
-    r = await client.get(f"{CARS_SERVICE}/api/v1/cars", params=params)
+async def call_get_cars(page: int, size: int, showAll: bool, auth: dict, cursor: Optional[str] = None, filters: Optional[dict] = None):
+    params = {"page": page, "size": size, "showAll": str(showAll).lower(), **(filters or {})}
+    if cursor is not None:
+        params["cursor"] = cursor
+    r = await cars_upstream.get("/api/v1/cars", params=params, headers=auth)
     r.raise_for_status()
     return r.json()
 
+@cars_flight
+@timed_call
+@traced
 @cars_circuit
-async def call_get_car(client, car_uid: str):
-    r = await client.get(f"{CARS_SERVICE}/api/v1/cars/{car_uid}")
+async def call_get_car(car_uid: str, auth: dict):
+    r = await cars_upstream.get(f"/api/v1/cars/{car_uid}", headers=auth)
     r.raise_for_status()
     return r.json()
 
+@cars_flight
+@timed_call
+@traced
 @cars_circuit
-async def call_reserve_car(client, car_uid: str, auth_header: str):
-    r = await client.put(
-        f"{CARS_SERVICE}/api/v1/cars/{car_uid}/reserve",
-        headers={"Authorization": auth_header}
+async def call_get_cars_by_uids(car_uids: list, auth: dict):
+    r = await cars_upstream.get(
+        "/api/v1/cars",
+        params={"uids": ",".join(car_uids)},
+        headers=auth
     )
     r.raise_for_status()
+    return r.json()["items"]
+
+@timed_call
+@traced
+@cars_circuit
+async def call_reserve_car(car_uid: str, auth: dict, owner: Optional[str] = None):
+    try:
+        r = await cars_upstream.put(
+            f"/api/v1/cars/{car_uid}/reserve",
+            headers=reservation_headers(auth, owner)
+        )
+    finally:
+        invalidate_car(car_uid)
+    r.raise_for_status()
     return r.json()
 
+@timed_call
+@traced
 @cars_circuit
-async def call_release_car(client, car_uid: str, auth_header: str):
-    r = await client.put(
-        f"{CARS_SERVICE}/api/v1/cars/{car_uid}/release",
-        headers={"Authorization": auth_header}
-    )
+async def call_release_car(car_uid: str, auth: dict, owner: Optional[str] = None):
+    try:
+        r = await cars_upstream.put(
+            f"/api/v1/cars/{car_uid}/release",
+            headers=reservation_headers(auth, owner)
+        )
+    finally:
+        invalidate_car(car_uid)
     r.raise_for_status()
     return r.json()
 
+def reservation_owner(username: str, request_id: str) -> str:
+    return f"{username}:{request_id}"
+
+def reservation_headers(auth: dict, owner: Optional[str]) -> dict:
+    # With an owner car-service only releases a reservation this saga made, so an
+    # unknown reserve outcome can be compensated without freeing someone else's car
+    return auth if owner is None else {**auth, RESERVATION_OWNER_HEADER: owner}
+
+def invalidate_car(car_uid: str):
+    car_cache.invalidate(car_uid)
+    cars_page_cache.clear()
+    cars_flight.forget()
+
+async def get_car(car_uid: str, auth: dict, allow_stale: bool = False):
+    car = car_cache.get(car_uid)
+    if car is not None:
+        return car
+    try:
+        car = car_details(await call_get_car(car_uid, auth))
+    except Exception as e:
+        if allow_stale and is_unavailable(e):
+            stale = car_fallback.serve_stale(car_uid, lambda: refresh_car(car_uid, auth))
+            if stale is not None:
+                return stale
+        raise
+    remember_car(car)
+    return car
+
+def car_details(car: dict) -> dict:
+    # rental-service frees cars through its outbox without passing the gateway,
+    # so availability is never cached and cannot go stale here
+    return {k: v for k, v in car.items() if k != "available"}
+
+def remember_car(car: dict):
+    car_cache.put(car["carUid"], car)
+    car_fallback.put(car["carUid"], car)
+
+async def refresh_car(car_uid: str, auth: dict):
+    car = car_details(await call_get_car(car_uid, auth))
+    car_cache.put(car_uid, car)
+    return car
+
+async def refresh_payment(payment_uid: str, auth: dict):
+    return await call_get_payment(payment_uid, auth)
+
+async def get_cars_page(page: int, size: int, showAll: bool, auth: dict, cursor: Optional[str] = None, filters: Optional[dict] = None):
+    key = (page, size, showAll, cursor, tuple(sorted((filters or {}).items())))
+    cars = cars_page_cache.get(key)
+    if cars is None:
+        cars = await call_get_cars(page, size, showAll, auth, cursor, filters)
+        cars_page_cache.put(key, cars)
+    return cars
+
+async def resolve_cars(car_uids: list, auth: dict) -> dict:
+    cars = {}
+    for uid in car_uids:
+        car = car_cache.get(uid)
+        if car is not None:
+            cars[uid] = car
+    uncached = [uid for uid in car_uids if uid not in cars]
+    unavailable = False
+    try:
+        batches = await gather_bounded(call_get_cars_by_uids(chunk, auth) for chunk in chunked(uncached))
+        for batch in batches:
+            for car in map(car_details, batch):
+                cars[car["carUid"]] = car
+                remember_car(car)
+    except Exception as e:
+        unavailable = is_unavailable(e)
+        if not unavailable and not isinstance(e, httpx.HTTPStatusError):
+            raise
+        logging.warning(f"Batch car lookup failed: {e}")
+    missing = [uid for uid in car_uids if uid not in cars]
+    if missing and unavailable:
+        for uid in missing:
+            cars[uid] = car_fallback.serve_stale(uid, lambda uid=uid: refresh_car(uid, auth)) or placeholder_car(uid)
+    elif missing:
+        results = await gather_bounded(get_car(uid, auth) for uid in missing)
+        cars.update(zip(missing, results))
+    return cars
+
+async def resolve_payments(payment_uids: list, auth: dict):
+    payments = {}
+    try:
+        batches = await gather_bounded(call_get_payments(chunk, auth) for chunk in chunked(payment_uids))
+        for batch in batches:
+            for payment in batch:
+                payments[payment["paymentUid"]] = payment
+                payment_fallback.put(payment["paymentUid"], payment)
+    except Exception as e:
+        if is_unavailable(e):
+            logging.warning(f"Payment lookup failed: {e}")
+            return stale_payments(payments, set(payment_uids) - set(payments), auth)
+        if not isinstance(e, httpx.HTTPStatusError):
+            raise
+        logging.warning(f"Batch payment lookup failed, falling back to per-payment requests: {e}")
+    missing = [uid for uid in payment_uids if uid not in payments]
+    failed = set()
+    if missing:
+        results = await gather_bounded((call_get_payment(uid, auth) for uid in missing), return_exceptions=True)
+        for uid, result in zip(missing, results):
+            if isinstance(result, Exception):
+                if not is_unavailable(result) and not isinstance(result, httpx.HTTPStatusError):
+                    raise result
+                failed.add(uid)
+            elif result is not None:
+                payments[uid] = result
+                payment_fallback.put(uid, result)
+    return stale_payments(payments, failed, auth)
+
+def stale_payments(payments: dict, failed: set, auth: dict):
+    for uid in failed:
+        stale = payment_fallback.serve_stale(uid, lambda uid=uid: refresh_payment(uid, auth))
+        if stale is not None:
+            payments[uid] = stale
+    return payments, failed
+
+def placeholder_car(car_uid: str) -> dict:
+    return {"carUid": car_uid, "brand": None, "model": None, "registrationNumber": None}
+
+def car_summary(car: dict) -> dict:
+    return {
+        "carUid": car["carUid"],
+        "brand": car["brand"],
+        "model": car["model"],
+        "registrationNumber": car["registrationNumber"]
+    }
+
+async def aggregate_rentals(rentals: list, auth: dict) -> list:
+    car_uids = list(dict.fromkeys(r["carUid"] for r in rentals))
+    payment_uids = list(dict.fromkeys(r["paymentUid"] for r in rentals))
+    cars, (payments, failed_payments) = await asyncio.gather(
+        resolve_cars(car_uids, auth),
+        resolve_payments(payment_uids, auth)
+    )
+    aggregated = []
+    for rental in rentals:
+        payment = payments.get(rental["paymentUid"])
+        if payment is None:
+            payment = {"paymentUid": rental["paymentUid"], "status": "UNKNOWN", "price": 0}
+        if rental["paymentUid"] in failed_payments and rental.get("status") == "CANCELED":
+            payment = {**payment, "status": "CANCELED"}
+        aggregated.append({
+            "rentalUid": rental["rentalUid"],
+            "status": rental["status"],
+            "dateFrom": rental["dateFrom"],
+            "dateTo": rental["dateTo"],
+            "car": car_summary(cars[rental["carUid"]]),
+            "payment": payment
+        })
+    return aggregated
+
+async def stream_aggregated_rentals(response: httpx.Response, authorization: Optional[str], username: str):
+    try:
+        batch = []
+        async for line in response.aiter_lines():
+            if line:
+                batch.append(json.loads(line))
+            if len(batch) >= RENTAL_STREAM_BATCH:
+                yield await aggregated_lines(batch, authorization, username)
+                batch = []
+        if batch:
+            yield await aggregated_lines(batch, authorization, username)
+    except Exception as e:
+        logging.warning(f"Rental stream aborted: {e}")
+        raise
+    finally:
+        await response.aclose()
+
+async def aggregated_lines(rentals: list, authorization: Optional[str], username: str) -> str:
+    # A long export outlives INTERNAL_IDENTITY_TTL, so every batch gets a fresh identity
+    auth = forward_headers(authorization, username)
+    return "".join(json.dumps(r) + "\n" for r in await aggregate_rentals(rentals, auth))
+
+def parse_rental_uids(values: list) -> list:
+    if len(values) > BULK_MAX_ITEMS:
+        raise ValueError(f"At most {BULK_MAX_ITEMS} rentalUids per request")
+    try:
+        return list(dict.fromkeys(str(uuid.UUID(u)) for u in values))
+    except ValueError:
+        raise ValueError("Invalid uid in rentalUids")
+
+async def close_rentals(call, rental_uids: list, auth: dict) -> list:
+    chunks = chunked(rental_uids)
+    outcomes = await gather_bounded((call(chunk, auth) for chunk in chunks), return_exceptions=True)
+    results = []
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, Exception):
+            if not is_unavailable(outcome):
+                raise outcome
+            logging.warning(f"Bulk {call.__name__} failed for {len(chunk)} rentals: {outcome}")
+            results.extend({"rentalUid": uid, "status": "unavailable"} for uid in chunk)
+        else:
+            results.extend(outcome)
+    return results
+
+async def cancel_payments(results: list, auth: dict):
+    canceled = [r for r in results if r["status"] == "CANCELED" and r.get("previousStatus") != "CANCELED"]
+    outcomes = await gather_bounded((call_cancel_payment(r["paymentUid"], auth) for r in canceled), return_exceptions=True)
+    for result, outcome in zip(canceled, outcomes):
+        if isinstance(outcome, Exception):
+            logging.warning(f"Failed to cancel payment {result['paymentUid']}: {outcome}")
+            result["paymentStatus"] = "failed"
+        else:
+            payment_fallback.update(result["paymentUid"], status="CANCELED")
+            result["paymentStatus"] = "CANCELED"
+
+async def compensate_rental_saga(saga: dict, auth: dict) -> bool:
+    undo = []
+    if saga.get("rentalUid"):
+        undo.append(call_cancel_rental(saga["rentalUid"], auth))
+    if saga.get("paymentUid"):
+        undo.append(call_cancel_payment(saga["paymentUid"], auth))
+    if saga.get("reserveStarted"):
+        undo.append(call_release_car(saga["carUid"], auth, reservation_owner(saga["username"], saga["requestId"])))
+    outcomes = await asyncio.gather(*undo, return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            logging.warning(f"Compensation of saga {saga['requestId']} failed: {outcome}")
+    compensated = not any(isinstance(o, Exception) for o in outcomes)
+    try:
+        # A failed compensation stays claimable by recovery and never revives the live path
+        await saga_store.update(
+            saga["username"], saga["requestId"], status="compensated" if compensated else "compensating",
+            expect_status=saga.get("status")
+        )
+    except Exception as e:
+        logging.warning(f"Could not record compensation of saga {saga['requestId']}: {e}")
+    return compensated
+
+async def recover_stuck_sagas() -> int:
+    recovered = 0
+    for saga in await saga_store.claim_stuck(SAGA_STUCK_AFTER):
+        auth = forward_headers(None, saga["username"])
+        if INTERNAL_IDENTITY_HEADER not in auth:
+            logging.warning(f"Cannot compensate saga {saga['requestId']} without INTERNAL_AUTH_SECRET")
+            continue
+        if await compensate_rental_saga(saga, auth):
+            recovered += 1
+    return recovered
+
+async def saga_recovery_loop():
+    while True:
+        await asyncio.sleep(SAGA_RECOVERY_INTERVAL)
+        try:
+            recovered = await recover_stuck_sagas()
+            if recovered:
+                logging.info(f"Compensated {recovered} stuck rental sagas")
+            await saga_store.purge()
+        except Exception as e:
+            logging.warning(f"Saga recovery failed: {e}")
+
+@app.on_event("startup")
+async def startup():
+    global saga_recovery_task
+    upstreams.start()
+    await jwks_cache.start()
+    await saga_store.start()
+    saga_recovery_task = asyncio.create_task(saga_recovery_loop())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if saga_recovery_task is not None:
+        saga_recovery_task.cancel()
+    await saga_store.close()
+    await car_fallback.close()
+    await payment_fallback.close()
+    await jwks_cache.stop()
+    await upstreams.aclose()
+
 @app.get("/manage/health")
 def health():
     return JSONResponse(content={"status": "OK"})
 
+@app.get("/manage/stats")
+def stats():
+    return JSONResponse(content={
+        "upstreams": upstreams.stats(),
+        "jwks": jwks_cache.stats(),
+        "tokenCache": token_cache.stats(),
+        "tracing": tracer.stats(),
+        "caches": {"car": car_cache.stats(), "carsPage": cars_page_cache.stats()},
+        "sagas": saga_store.stats(),
+        "sagaSteps": saga_metrics.stats(),
+        "fallbacks": {"car": car_fallback.stats(), "payment": payment_fallback.stats()},
+        "singleflight": {f.name: f.stats() for f in (cars_flight, rental_flight, payment_flight)},
+        "breakers": {"payment": payment_circuit.stats(), "rental": rental_circuit.stats(), "cars": cars_circuit.stats()}
+    })
+
 @app.get("/api/v1/cars")
 @protected_route
-async def get_cars(request: Request, current_user: str, page: int = Query(1, ge=1), size: int = Query(10, ge=1), showAll: bool = Query(False)):
+async def get_cars(
+    request: Request,
+    current_user: str,
+    page: int = Query(1, ge=1),
+    size: int = Query(10, ge=1),
+    showAll: bool = Query(False),
+    cursor: Optional[str] = Query(None),
+    type: Optional[str] = Query(None),
+    brand: Optional[str] = Query(None),
+    minPrice: Optional[int] = Query(None, ge=0),
+    maxPrice: Optional[int] = Query(None, ge=0),
+    minPower: Optional[int] = Query(None, ge=0),
+    sort: Optional[str] = Query(None, regex="^-?(price|power)$")
+):
+    auth = forward_headers(request.headers.get("Authorization"), current_user)
+    filters = {"type": type, "brand": brand, "minPrice": minPrice, "maxPrice": maxPrice, "minPower": minPower, "sort": sort}
+    filters = {k: v for k, v in filters.items() if v is not None}
     try:
-        async with httpx.AsyncClient() as client:
-            cars = await call_get_cars(client, page, size, showAll)
-            return cars
-    except pybreaker.CircuitBreakerError:
+        cars = await get_cars_page(page, size, showAll, auth, cursor, filters)
+        return cars
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code >= 500:
+            return JSONResponse(status_code=500, content={"message": str(e)})
+        return JSONResponse(status_code=e.response.status_code, content={"message": e.response.json().get("detail", str(e))})
+    except CircuitOpenError:
         return JSONResponse(status_code=503, content={"message": "Cars Service unavailable"})
     except (ConnectError, TimeoutException, NetworkError):
         return JSONResponse(status_code=503, content={"message": "Cars Service unavailable"})
@@ -153,40 +618,34 @@ async def get_cars(request: Request, current_user: str, page: int = Query(1, ge=
 
 @app.get("/api/v1/rental")
 @protected_route
-async def get_rentals(request: Request, current_user: str):
-    auth_header = request.headers.get("Authorization")
+async def get_rentals(
+    request: Request,
+    current_user: str,
+    size: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    dateFrom: Optional[str] = Query(None),
+    dateTo: Optional[str] = Query(None),
+    stream: bool = Query(False)
+):
+    auth = forward_headers(request.headers.get("Authorization"), current_user)
+    params = {"size": size, "cursor": cursor, "status": status, "dateFrom": dateFrom, "dateTo": dateTo}
+    params = {k: v for k, v in params.items() if v is not None}
+    staleness = track_staleness()
     try:
-        async with httpx.AsyncClient() as client:
-            rentals = await call_get_rentals(client, auth_header)
-            aggregated = []
-            for rental in rentals:
-                car = await call_get_car(client, rental['carUid'])
-                payment = {"paymentUid": rental['paymentUid'], "status": "UNKNOWN", "price": 0}
-                try:
-                    p_resp = await client.get(
-                        f"{PAYMENT_SERVICE}/api/v1/payment/{rental['paymentUid']}",
-                        headers={"Authorization": auth_header}
-                    )
-                    if p_resp.status_code == 200:
-                        payment = p_resp.json()
-                except:
-                    if rental.get("status") == "CANCELED":
-                        payment = {"paymentUid": rental['paymentUid'], "status": "CANCELED", "price": 0}
-                aggregated.append({
-                    "rentalUid": rental["rentalUid"],
-                    "status": rental["status"],
-                    "dateFrom": rental["dateFrom"],
-                    "dateTo": rental["dateTo"],
-                    "car": {
-                        "carUid": car["carUid"],
-                        "brand": car["brand"],
-                        "model": car["model"],
-                        "registrationNumber": car["registrationNumber"]
-                    },
-                    "payment": payment
-                })
-            return JSONResponse(content=aggregated)
-    except pybreaker.CircuitBreakerError:
+        if stream:
+            response = await call_stream_rentals(params, auth)
+            return StreamingResponse(stream_aggregated_rentals(response, request.headers.get("Authorization"), current_user), media_type="application/x-ndjson")
+        rentals = await call_get_rentals(auth, params)
+        if isinstance(rentals, list):
+            return staleness.apply(JSONResponse(content=await aggregate_rentals(rentals, auth)))
+        page = {**rentals, "items": await aggregate_rentals(rentals["items"], auth)}
+        return staleness.apply(JSONResponse(content=page))
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code >= 500:
+            return JSONResponse(status_code=500, content={"message": str(e)})
+        return JSONResponse(status_code=e.response.status_code, content={"message": e.response.json().get("detail", str(e))})
+    except CircuitOpenError:
         return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
     except (ConnectError, TimeoutException, NetworkError):
         return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
@@ -196,37 +655,39 @@ async def get_rentals(request: Request, current_user: str):
 @app.get("/api/v1/rental/{rental_uid}")
 @protected_route
 async def get_rental(request: Request, current_user: str, rental_uid: str):
-    auth_header = request.headers.get("Authorization")
+    auth = forward_headers(request.headers.get("Authorization"), current_user)
+    staleness = track_staleness()
     try:
-        async with httpx.AsyncClient() as client:
-            rental = await call_get_rental(client, rental_uid, auth_header)
-            car = await call_get_car(client, rental['carUid'])
+        rental = await call_get_rental(rental_uid, auth)
+        car, payment = await asyncio.gather(
+            get_car(rental['carUid'], auth, allow_stale=True),
+            call_get_payment(rental['paymentUid'], auth),
+            return_exceptions=True
+        )
+        if isinstance(car, Exception):
+            if not is_unavailable(car):
+                raise car
+            car = placeholder_car(rental['carUid'])
+        if isinstance(payment, Exception):
+            stale = None
+            if is_unavailable(payment):
+                stale = payment_fallback.serve_stale(rental['paymentUid'], lambda: refresh_payment(rental['paymentUid'], auth))
+            payment = stale or {}
+        elif payment is None:
             payment = {"paymentUid": rental['paymentUid'], "status": "UNKNOWN", "price": 0}
-            try:
-                p_resp = await client.get(
-                    f"{PAYMENT_SERVICE}/api/v1/payment/{rental['paymentUid']}",
-                    headers={"Authorization": auth_header}
-                )
-                if p_resp.status_code == 200:
-                    payment = p_resp.json()
-            except:
-                payment = {}
-            if rental.get("status") == "CANCELED" and payment != {}:
-                payment = {"paymentUid": rental['paymentUid'], "status": "CANCELED", "price": payment.get("price", 0)}
-            return JSONResponse(content={
-                "rentalUid": rental["rentalUid"],
-                "status": rental["status"],
-                "dateFrom": rental["dateFrom"],
-                "dateTo": rental["dateTo"],
-                "car": {
-                    "carUid": car["carUid"],
-                    "brand": car["brand"],
-                    "model": car["model"],
-                    "registrationNumber": car["registrationNumber"]
-                },
-                "payment": payment
-            })
-    except pybreaker.CircuitBreakerError:
+        else:
+            payment_fallback.put(rental['paymentUid'], payment)
+        if rental.get("status") == "CANCELED" and payment != {}:
+            payment = {"paymentUid": rental['paymentUid'], "status": "CANCELED", "price": payment.get("price", 0)}
+        return staleness.apply(JSONResponse(content={
+            "rentalUid": rental["rentalUid"],
+            "status": rental["status"],
+            "dateFrom": rental["dateFrom"],
+            "dateTo": rental["dateTo"],
+            "car": car_summary(car),
+            "payment": payment
+        }))
+    except CircuitOpenError:
         return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
     except (ConnectError, TimeoutException, NetworkError):
         return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
@@ -240,121 +701,173 @@ async def create_rental(
     current_user: str,
     req: RentalRequest
 ):
-    auth_header = request.headers.get("Authorization")
+    auth = forward_headers(request.headers.get("Authorization"), current_user)
     request_id = request.headers.get("X-Request-ID") or str(uuid.uuid4())
-    if request_id in saga_log and saga_log[request_id].get("status") == "completed":
-        log = saga_log[request_id]
-        async with httpx.AsyncClient() as client:
-            car = await call_get_car(client, log["car_uid"])
-            payment = await client.get(
-                f"{PAYMENT_SERVICE}/api/v1/payment/{log['payment_uid']}",
-                headers={"Authorization": auth_header}
-            ).json()
-            return JSONResponse(content={
-                "rentalUid": log["rental_uid"],
-                "carUid": log["car_uid"],
-                "dateFrom": req.dateFrom,
-                "dateTo": req.dateTo,
-                "status": "IN_PROGRESS",
-                "car": {
-                    "carUid": car["carUid"],
-                    "brand": car["brand"],
-                    "model": car["model"],
-                    "registrationNumber": car["registrationNumber"]
-                },
-                "payment": payment
-            })
-
-    saga_log[request_id] = {"step": "started", "car_uid": req.carUid}
-
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            car = await call_get_car(client, req.carUid)
-        except pybreaker.CircuitBreakerError:
-            return JSONResponse(status_code=503, content={"message": "Cars Service unavailable"})
-        except (ConnectError, TimeoutException, NetworkError):
-            return JSONResponse(status_code=503, content={"message": "Cars Service unavailable"})
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"message": str(e)})
+    owner = reservation_owner(current_user, request_id)
 
-        try:
-            date_from = datetime.fromisoformat(req.dateFrom)
-            date_to = datetime.fromisoformat(req.dateTo)
-        except ValueError:
-            return JSONResponse(status_code=400, content={"message": "Invalid date format"})
+    try:
+        date_from = datetime.fromisoformat(req.dateFrom)
+        date_to = datetime.fromisoformat(req.dateTo)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"message": "Invalid date format"})
 
-        days = (date_to - date_from).days
-        if days <= 0:
-            return JSONResponse(status_code=400, content={"message": "Invalid rental period"})
+    days = (date_to - date_from).days
+    if days <= 0:
+        return JSONResponse(status_code=400, content={"message": "Invalid rental period"})
 
-        total_price = car["price"] * days
-        payment_uid = None
-        rental_uid = None
+    try:
+        body = {"carUid": req.carUid, "dateFrom": req.dateFrom, "dateTo": req.dateTo}
+        existing = await saga_store.claim(current_user, request_id, body)
+    except Exception as e:
+        logging.error(f"Saga store unavailable: {e}")
+        return JSONResponse(status_code=503, content={"message": "Saga store unavailable"})
+    if existing is not None:
+        if any(k in existing and existing[k] != v for k, v in body.items()):
+            return JSONResponse(status_code=422, content={"message": "X-Request-ID was already used for a different request"})
+        if existing["status"] != "completed":
+            return JSONResponse(status_code=409, content={"message": "Request is already being processed"})
+        if "response" not in existing:
+            return JSONResponse(status_code=409, content={"message": "Request was already processed"})
+        return JSONResponse(content=existing["response"])
+
+    async def record(**fields):
+        # Recovery may have claimed a slow saga; from then on it owns the record
+        if not await saga_store.update(current_user, request_id, expect_status="started", **fields):
+            raise SagaClaimed(request_id)
+
+    async def reserve(results):
+        await record(reserveStarted=True)
+        try:
+            return await call_reserve_car(req.carUid, auth, owner)
+        except httpx.HTTPStatusError:
+            await saga_store.update(current_user, request_id, expect_status="started", reserveStarted=False)
+            raise
+
+    async def create_payment(results):
+        return await call_create_payment(results["car"]["price"] * days, auth)
+
+    async def create_rental_record(results):
+        return await call_create_rental({
+            "carUid": req.carUid,
+            "dateFrom": req.dateFrom,
+            "dateTo": req.dateTo,
+            "paymentUid": results["payment"]["paymentUid"]
+        }, auth)
+
+    saga = Saga([
+        Step("car", lambda results: get_car(req.carUid, auth)),
+        Step(
+            "reserve", reserve,
+            compensate=lambda results: call_release_car(req.carUid, auth, owner),
+            compensate_on_failure=lambda error: not isinstance(error, httpx.HTTPStatusError)
+        ),
+        Step(
+            "payment", create_payment, requires=("car", "reserve"),
+            compensate=lambda results: call_cancel_payment(results["payment"]["paymentUid"], auth),
+            record=lambda payment: record(step="payment_created", paymentUid=payment["paymentUid"])
+        ),
+        Step(
+            "rental", create_rental_record, requires=("payment",),
+            compensate=lambda results: call_cancel_rental(results["rental"]["rentalUid"], auth),
+            record=lambda rental: record(step="rental_created", rentalUid=rental["rentalUid"])
+        ),
+    ], metrics=saga_metrics)
 
+    try:
+        results = await saga.run()
+    except SagaFailed as e:
+        logging.error(f"Rental creation failed: {e}")
         try:
-            payment_data = await call_create_payment(client, total_price, auth_header)
-            payment_uid = payment_data["paymentUid"]
-            saga_log[request_id].update({"step": "payment_created", "payment_uid": payment_uid})
-
-            rental_data = await call_create_rental(client, {
-                "carUid": req.carUid,
-                "dateFrom": req.dateFrom,
-                "dateTo": req.dateTo,
-                "paymentUid": payment_uid
-            }, auth_header)
-            rental_uid = rental_data["rentalUid"]
-            saga_log[request_id].update({"step": "rental_created", "rental_uid": rental_uid})
-
-            await call_reserve_car(client, req.carUid, auth_header)
-            saga_log[request_id]["status"] = "completed"
-
-            return JSONResponse(content={
-                "rentalUid": rental_uid,
-                "carUid": req.carUid,
-                "dateFrom": req.dateFrom,
-                "dateTo": req.dateTo,
-                "status": "IN_PROGRESS",
-                "car": {
-                    "carUid": car["carUid"],
-                    "brand": car["brand"],
-                    "model": car["model"],
-                    "registrationNumber": car["registrationNumber"]
-                },
-                "payment": payment_data
-            })
-
-        except pybreaker.CircuitBreakerError:
-            logging.error("Payment service circuit breaker is OPEN")
-            return JSONResponse(status_code=503, content={"message": "Payment Service unavailable"})
-        except (ConnectError, TimeoutException, NetworkError) as e:
-            logging.error(f"Payment service unreachable: {e}")
-            return JSONResponse(status_code=503, content={"message": "Payment Service unavailable"})
-        except Exception as e:
-            logging.error(f"Rental creation failed: {e}")
-            if payment_uid:
-                try:
-                    await call_cancel_payment(client, payment_uid, auth_header)
-                except Exception:
-                    logging.warning(f"Could not cancel payment {payment_uid}")
-            if rental_uid:
-                try:
-                    await call_cancel_rental(client, rental_uid, auth_header)
-                except Exception:
-                    logging.warning(f"Could not cancel rental {rental_uid}")
-            return JSONResponse(status_code=500, content={"message": "Internal server error"})
+            await saga_store.update(
+                current_user, request_id, status="compensated" if e.compensated else "started", expect_status="started"
+            )
+        except Exception as store_error:
+            logging.warning(f"Could not record compensation of saga {request_id}: {store_error}")
+        if isinstance(e.error, SagaClaimed):
+            return JSONResponse(status_code=503, content={"message": "Rental creation timed out and was rolled back"})
+        unavailable = isinstance(e.error, (CircuitOpenError, ConnectError, TimeoutException, NetworkError))
+        if e.step == "reserve" and isinstance(e.error, httpx.HTTPStatusError) and e.error.response.status_code == 409:
+            return JSONResponse(status_code=409, content={"message": "Car is already reserved"})
+        if e.step in ("car", "reserve"):
+            if unavailable:
+                return JSONResponse(status_code=503, content={"message": "Cars Service unavailable"})
+            return JSONResponse(status_code=500, content={"message": str(e.error)})
+        if unavailable:
+            service = "Payment" if e.step == "payment" else "Rental"
+            return JSONResponse(status_code=503, content={"message": f"{service} Service unavailable"})
+        return JSONResponse(status_code=500, content={"message": "Internal server error"})
+
+    response = {
+        "rentalUid": results["rental"]["rentalUid"],
+        "carUid": req.carUid,
+        "dateFrom": req.dateFrom,
+        "dateTo": req.dateTo,
+        "status": "IN_PROGRESS",
+        "car": car_summary(results["car"]),
+        "payment": results["payment"]
+    }
+    try:
+        completed = await saga_store.update(
+            current_user, request_id, status="completed", step="completed", response=response, expect_status="started"
+        )
+    except Exception as e:
+        logging.error(f"Could not record completion of saga {request_id}, compensating: {e}")
+        await compensate_rental_saga({
+            "username": current_user,
+            "requestId": request_id,
+            "carUid": req.carUid,
+            "reserveStarted": True,
+            "paymentUid": results["payment"]["paymentUid"],
+            "rentalUid": results["rental"]["rentalUid"],
+        }, auth)
+        return JSONResponse(status_code=503, content={"message": "Saga store unavailable"})
+    if not completed:
+        # Every step was recorded before the claim, so recovery undoes all of them
+        return JSONResponse(status_code=503, content={"message": "Rental creation timed out and was rolled back"})
+    return JSONResponse(content=response)
+
+@app.post("/api/v1/rental/finish")
+@protected_route
+async def finish_rentals(request: Request, current_user: str, req: RentalUidsRequest):
+    return await bulk_close_rentals(request, current_user, req, call_finish_rentals)
+
+@app.post("/api/v1/rental/cancel")
+@protected_route
+async def cancel_rentals(request: Request, current_user: str, req: RentalUidsRequest):
+    return await bulk_close_rentals(request, current_user, req, call_cancel_rentals)
+
+async def bulk_close_rentals(request: Request, current_user: str, req: RentalUidsRequest, call):
+    auth = forward_headers(request.headers.get("Authorization"), current_user)
+    try:
+        rental_uids = parse_rental_uids(req.rentalUids)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    try:
+        results = await close_rentals(call, rental_uids, auth)
+        if results and all(r["status"] == "unavailable" for r in results):
+            return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
+        if call is call_cancel_rentals:
+            await cancel_payments(results, auth)
+        return JSONResponse(content={"results": results})
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code >= 500:
+            return JSONResponse(status_code=500, content={"message": str(e)})
+        return JSONResponse(status_code=e.response.status_code, content={"message": e.response.json().get("detail", str(e))})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"message": str(e)})
 
 @app.post("/api/v1/rental/{rental_uid}/finish")
 @protected_route
 async def finish_rental(request: Request, current_user: str, rental_uid: str):
-    auth_header = request.headers.get("Authorization")
+    auth = forward_headers(request.headers.get("Authorization"), current_user)
     try:
-        async with httpx.AsyncClient() as client:
-            rental = await call_get_rental(client, rental_uid, auth_header)
-            car_uid = rental["carUid"]
-            await call_release_car(client, car_uid, auth_header)
-            await call_finish_rental(client, rental_uid, auth_header)
-            return Response(status_code=204)
-    except pybreaker.CircuitBreakerError:
+        await call_finish_rental(rental_uid, auth)
+        return Response(status_code=204)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            return JSONResponse(status_code=404, content={"message": "Rental not found"})
+        return JSONResponse(status_code=500, content={"message": str(e)})
+    except CircuitOpenError:
         return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
     except (ConnectError, TimeoutException, NetworkError):
         return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
@@ -364,24 +877,22 @@ async def finish_rental(request: Request, current_user: str, rental_uid: str):
 @app.delete("/api/v1/rental/{rental_uid}")
 @protected_route
 async def cancel_rental(request: Request, current_user: str, rental_uid: str):
-    auth_header = request.headers.get("Authorization")
+    auth = forward_headers(request.headers.get("Authorization"), current_user)
     try:
-        async with httpx.AsyncClient() as client:
-            rental = await call_get_rental(client, rental_uid, auth_header)
-            car_uid = rental["carUid"]
-            payment_uid = rental["paymentUid"]
-
-            try:
-                await call_cancel_payment(client, payment_uid, auth_header)
-            except (pybreaker.CircuitBreakerError, ConnectError, TimeoutException, NetworkError):
-                logging.warning(f"Payment service unavailable, cannot cancel {payment_uid}")
-            except Exception as e:
-                logging.warning(f"Failed to cancel payment: {e}")
-
-            await call_release_car(client, car_uid, auth_header)
-            await call_cancel_rental(client, rental_uid, auth_header)
-            return Response(status_code=204)
-    except pybreaker.CircuitBreakerError:
+        rental = await call_get_rental(rental_uid, auth)
+        payment_uid = rental["paymentUid"]
+
+        try:
+            await call_cancel_payment(payment_uid, auth)
+            payment_fallback.update(payment_uid, status="CANCELED")
+        except (CircuitOpenError, ConnectError, TimeoutException, NetworkError):
+            logging.warning(f"Payment service unavailable, cannot cancel {payment_uid}")
+        except Exception as e:
+            logging.warning(f"Failed to cancel payment: {e}")
+
+        await call_cancel_rental(rental_uid, auth)
+        return Response(status_code=204)
+    except CircuitOpenError:
         return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
     except (ConnectError, TimeoutException, NetworkError):
         return JSONResponse(status_code=503, content={"message": "Rental Service unavailable"})
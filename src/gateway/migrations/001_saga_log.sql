@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS saga_log (
+    username VARCHAR(80) NOT NULL,
+    request_id VARCHAR(128) NOT NULL,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('started', 'compensating', 'completed', 'compensated')),
+    step VARCHAR(40) NOT NULL,
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (username, request_id)
+);
+
+CREATE INDEX IF NOT EXISTS saga_log_in_progress_idx ON saga_log (updated_at)
+    WHERE status IN ('started', 'compensating');
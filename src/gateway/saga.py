@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+
+
+class Step:
+    def __init__(self, name: str, action, compensate=None, requires=(), record=None, compensate_on_failure: bool = False):
+        self.name = name
+        self.action = action
+        self.compensate = compensate
+        self.requires = tuple(requires)
+        self.record = record
+        self.compensate_on_failure = compensate_on_failure
+
+
+class SagaFailed(Exception):
+    def __init__(self, step: str, error: Exception, compensated: bool):
+        super().__init__(f"Step {step} failed: {error}")
+        self.step = step
+        self.error = error
+        self.compensated = compensated
+
+
+class StepMetrics:
+    def __init__(self):
+        self._steps = {}
+
+    def observe(self, name: str, seconds: float, outcome: str):
+        step = self._steps.setdefault(name, {"count": 0, "secondsTotal": 0.0, "secondsMax": 0.0})
+        step["count"] += 1
+        step[outcome] = step.get(outcome, 0) + 1
+        step["secondsTotal"] += seconds
+        step["secondsMax"] = max(step["secondsMax"], seconds)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                **step,
+                "secondsTotal": round(step["secondsTotal"], 6),
+                "secondsMax": round(step["secondsMax"], 6),
+                "secondsAvg": round(step["secondsTotal"] / step["count"], 6),
+            }
+            for name, step in self._steps.items()
+        }
+
+
+class Saga:
+    def __init__(self, steps: list, metrics: StepMetrics = None):
+        names = {s.name for s in steps}
+        for step in steps:
+            missing = set(step.requires) - names
+            if missing:
+                raise ValueError(f"Step {step.name} requires unknown steps {sorted(missing)}")
+        self.steps = steps
+        self.metrics = metrics
+        self.results = {}
+        self.errors = {}
+        self.timings = {}
+
+    async def run(self) -> dict:
+        tasks = {}
+        started = set()
+        failure = asyncio.Event()
+        failures = []
+
+        async def run_step(step: Step):
+            for name in step.requires:
+                await tasks[name]
+            if failure.is_set():
+                return
+            started.add(step.name)
+            begin = time.perf_counter()
+            outcome = "failed"
+            try:
+                result = await step.action(self.results)
+                self.results[step.name] = result
+                if step.record is not None:
+                    await step.record(result)
+                outcome = "succeeded"
+            except Exception as e:
+                self.errors[step.name] = e
+                failures.append((step.name, e))
+                failure.set()
+                raise
+            finally:
+                self._observe(step.name, time.perf_counter() - begin, outcome)
+
+        for step in self.steps:
+            tasks[step.name] = asyncio.ensure_future(run_step(step))
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        if not failures:
+            return self.results
+        name, error = failures[0]
+        compensated = await self.compensate(started)
+        raise SagaFailed(name, error, compensated)
+
+    async def compensate(self, started: set) -> bool:
+        pending = [
+            step for step in self.steps
+            if step.compensate is not None and step.name in started
+            and (step.name in self.results or self._compensate_failed(step))
+        ]
+
+        async def undo(step: Step):
+            begin = time.perf_counter()
+            try:
+                await step.compensate(self.results)
+                self._observe(f"{step.name}.compensate", time.perf_counter() - begin, "succeeded")
+                return True
+            except Exception as e:
+                self._observe(f"{step.name}.compensate", time.perf_counter() - begin, "failed")
+                logging.warning(f"Compensation of step {step.name} failed: {e}")
+                return False
+
+        outcomes = await asyncio.gather(*(undo(step) for step in pending))
+        return all(outcomes)
+
+    def _compensate_failed(self, step: Step) -> bool:
+        if callable(step.compensate_on_failure):
+            return step.compensate_on_failure(self.errors.get(step.name))
+        return bool(step.compensate_on_failure)
+
+    def _observe(self, name: str, seconds: float, outcome: str):
+        self.timings[name] = seconds
+        if self.metrics is not None:
+            self.metrics.observe(name, seconds, outcome)
@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database.migrations import migrate_on_startup
+from database.pool import ConnectionPool
+from instrumentation.metrics import observe_query
+from instrumentation.tracing import trace_query
+from upstream import _env_float, _env_int
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+IN_PROGRESS = ("started", "compensating")
+FINISHED = ("completed", "compensated")
+
+
+class SagaClaimed(Exception):
+    def __init__(self, request_id: str):
+        super().__init__(f"Saga {request_id} was claimed for compensation")
+        self.request_id = request_id
+
+
+class MemorySagaStore:
+    def __init__(self, max_size: int = 10000, ttl: float = 86400.0, max_bytes: int = 64 * 1024 * 1024, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._records = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _get(self, key):
+        record = self._records.get(key)
+        if record is not None and record["updatedAt"] <= self._clock() - self.ttl:
+            self._remove(key)
+            return None
+        return record
+
+    def _remove(self, key):
+        del self._records[key]
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def _evict(self):
+        while len(self._records) > self.max_size or (self._bytes > self.max_bytes and len(self._records) > 1):
+            self._remove(next(iter(self._records)))
+            self.evictions += 1
+
+    async def claim(self, username: str, request_id: str, data: dict):
+        key = (username, request_id)
+        with self._lock:
+            existing = self._get(key)
+            if existing is not None and existing["status"] != "compensated":
+                self._records.move_to_end(key)
+                return dict(existing)
+            self._records[key] = {
+                "requestId": request_id,
+                "username": username,
+                "status": "started",
+                "step": "started",
+                **data,
+                "updatedAt": self._clock(),
+            }
+            self._bytes -= self._sizes.pop(key, 0)
+            self._records.move_to_end(key)
+            self._evict()
+        return None
+
+    async def get(self, username: str, request_id: str):
+        with self._lock:
+            record = self._get((username, request_id))
+            return dict(record) if record is not None else None
+
+    async def update(self, username: str, request_id: str, status: str = None, step: str = None,
+                     expect_status: str = None, **data) -> bool:
+        with self._lock:
+            key = (username, request_id)
+            record = self._records.get(key)
+            if record is None or (expect_status is not None and record["status"] != expect_status):
+                return False
+            if status is not None:
+                record["status"] = status
+            if step is not None:
+                record["step"] = step
+            record.update(data)
+            record["updatedAt"] = self._clock()
+            if "response" in data:
+                size = len(json.dumps(data["response"]))
+                self._bytes += size - self._sizes.get(key, 0)
+                self._sizes[key] = size
+                self._evict()
+        return True
+
+    async def claim_stuck(self, older_than: float, limit: int = 100) -> list:
+        cutoff = self._clock() - older_than
+        claimed = []
+        with self._lock:
+            for record in self._records.values():
+                if len(claimed) >= limit:
+                    break
+                if record["status"] in IN_PROGRESS and record["updatedAt"] < cutoff:
+                    record["status"] = "compensating"
+                    record["updatedAt"] = self._clock()
+                    claimed.append(dict(record))
+        return claimed
+
+    async def purge(self) -> int:
+        cutoff = self._clock() - self.ttl
+        with self._lock:
+            expired = [k for k, r in self._records.items() if r["status"] in FINISHED and r["updatedAt"] <= cutoff]
+            for key in expired:
+                self._remove(key)
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_progress = sum(1 for r in self._records.values() if r["status"] in IN_PROGRESS)
+        return {
+            "backend": "memory",
+            "size": len(self._records),
+            "maxSize": self.max_size,
+            "bytes": self._bytes,
+            "maxBytes": self.max_bytes,
+            "ttlSeconds": self.ttl,
+            "inProgress": in_progress,
+            "evictions": self.evictions,
+        }
+
+
+class PostgresSagaStore:
+    def __init__(self, pool: ConnectionPool, ttl: float = 86400.0):
+        self.pool = pool
+        self.ttl = ttl
+
+    async def start(self):
+        await self.pool.start()
+        await migrate_on_startup(self.pool, MIGRATIONS_DIR)
+
+    async def close(self):
+        await self.pool.close()
+
+    @staticmethod
+    def _to_record(row) -> dict:
+        return {
+            "requestId": row["request_id"],
+            "username": row["username"],
+            "status": row["status"],
+            "step": row["step"],
+            **json.loads(row["data"]),
+            "updatedAt": row["updated_at"].timestamp(),
+        }
+
+    async def claim(self, username: str, request_id: str, data: dict):
+        async with self.pool.connection() as conn:
+            claimed = await conn.fetchval("""
+                INSERT INTO saga_log (username, request_id, status, step, data)
+                VALUES ($1, $2, 'started', 'started', $3::jsonb)
+                ON CONFLICT (username, request_id) DO UPDATE
+                SET status = 'started', step = 'started', data = EXCLUDED.data, updated_at = now()
+                WHERE saga_log.status = 'compensated' OR saga_log.updated_at < now() - make_interval(secs => $4)
+                RETURNING request_id
+            """, username, request_id, json.dumps(data), self.ttl)
+            if claimed is not None:
+                return None
+            row = await conn.fetchrow(
+                "SELECT * FROM saga_log WHERE username = $1 AND request_id = $2", username, request_id
+            )
+        return self._to_record(row) if row is not None else None
+
+    async def get(self, username: str, request_id: str):
+        row = await self.pool.fetchrow("""
+            SELECT * FROM saga_log
+            WHERE username = $1 AND request_id = $2 AND updated_at >= now() - make_interval(secs => $3)
+        """, username, request_id, self.ttl)
+        return self._to_record(row) if row is not None else None
+
+    async def update(self, username: str, request_id: str, status: str = None, step: str = None,
+                     expect_status: str = None, **data) -> bool:
+        updated = await self.pool.fetchval("""
+            UPDATE saga_log
+            SET status = COALESCE($3, status), step = COALESCE($4, step), data = data || $5::jsonb, updated_at = now()
+            WHERE username = $1 AND request_id = $2 AND ($6::text IS NULL OR status = $6)
+            RETURNING true
+        """, username, request_id, status, step, json.dumps(data), expect_status)
+        return updated is not None
+
+    async def claim_stuck(self, older_than: float, limit: int = 100) -> list:
+        rows = await self.pool.fetch("""
+            UPDATE saga_log SET status = 'compensating', updated_at = now()
+            WHERE (username, request_id) IN (
+                SELECT username, request_id FROM saga_log
+                WHERE status IN ('started', 'compensating') AND updated_at < now() - make_interval(secs => $1)
+                ORDER BY updated_at
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+        """, older_than, limit)
+        return [self._to_record(r) for r in rows]
+
+    async def purge(self) -> int:
+        result = await self.pool.execute("""
+            DELETE FROM saga_log
+            WHERE status IN ('completed', 'compensated') AND updated_at < now() - make_interval(secs => $1)
+        """, self.ttl)
+        return int(result.split()[-1])
+
+    def stats(self) -> dict:
+        return {"backend": "postgres", "ttlSeconds": self.ttl, "dbPool": self.pool.stats()}
+
+
+def saga_store_from_env():
+    backend = os.environ.get("SAGA_STORE", "memory")
+    ttl = _env_float("SAGA_STORE_TTL", 86400.0)
+    if backend == "memory":
+        return MemorySagaStore(_env_int("SAGA_STORE_MAX_SIZE", 10000), ttl, _env_int("SAGA_STORE_MAX_BYTES", 64 * 1024 * 1024))
+    if backend == "postgres":
+        pool = ConnectionPool(
+            dsn=os.environ.get("SAGA_DATABASE_URL"),
+            min_size=_env_int("SAGA_DB_POOL_MIN_SIZE", 1),
+            max_size=_env_int("SAGA_DB_POOL_MAX_SIZE", 5),
+            query_loggers=(observe_query, trace_query),
+        )
+        return PostgresSagaStore(pool, ttl)
+    raise ValueError(f"Unknown SAGA_STORE backend: {backend}")
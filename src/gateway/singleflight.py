@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import inspect
+
+import httpx
+
+from auth_service.auth import INTERNAL_IDENTITY_HEADER, verify_identity
+from instrumentation.metrics import singleflight_calls
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def auth_identity(auth: dict):
+    if not auth:
+        return None
+    assertion = auth.get(INTERNAL_IDENTITY_HEADER)
+    if assertion is not None:
+        # Assertions are re-signed with a fresh expiry, so key on the user they name
+        username = verify_identity(assertion)
+        if username is not None:
+            return "user", username
+    return "credential", assertion or auth.get("Authorization")
+
+
+def auth_rejected(error: BaseException) -> bool:
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code in (401, 403)
+
+
+class SingleFlight:
+    def __init__(self, name: str, per_identity: bool = False):
+        self.name = name
+        self.per_identity = per_identity
+        self._flights = {}
+        self.leaders_total = 0
+        self.collapsed_total = 0
+
+    def key(self, signature: inspect.Signature, name: str, args: tuple, kwargs: dict) -> tuple:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        auth = arguments.pop("auth", None)
+        identity = auth_identity(auth) if self.per_identity else None
+        return name, _freeze(arguments), identity
+
+    async def do(self, key: tuple, func, *args, **kwargs):
+        future = self._flights.get(key)
+        call = key[0]
+        if future is None:
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self._flights[key] = future
+            future.add_done_callback(lambda f: self._land(key, f))
+            self.leaders_total += 1
+            singleflight_calls.labels(call=call, role="leader").inc()
+            # A caller that goes away must not cancel the call for everyone else
+            return await asyncio.shield(future)
+        self.collapsed_total += 1
+        singleflight_calls.labels(call=call, role="collapsed").inc()
+        try:
+            return await asyncio.shield(future)
+        except Exception as e:
+            # The leader's credentials were rejected, not necessarily ours
+            if self.per_identity or not auth_rejected(e):
+                raise
+        return await func(*args, **kwargs)
+
+    def _land(self, key: tuple, future):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        if not future.cancelled():
+            future.exception()
+
+    def forget(self):
+        # Calls already in flight finish for their callers; new callers start fresh
+        self._flights.clear()
+
+    def __call__(self, func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = self.key(signature, func.__name__, args, kwargs)
+            return await self.do(key, func, *args, **kwargs)
+        return wrapper
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self._flights),
+            "leadersTotal": self.leaders_total,
+            "collapsedTotal": self.collapsed_total,
+        }
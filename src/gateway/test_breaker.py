@@ -0,0 +1,165 @@
+import asyncio
+
+import httpx
+import pytest
+
+from breaker import BreakerConfig, BreakerGroup, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "http://cars/api/v1/cars/x")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+async def fail_with(error):
+    raise error
+
+
+async def succeed():
+    return "ok"
+
+
+def run(breaker, coro_fn, *args):
+    return asyncio.run(breaker.call(coro_fn, *args))
+
+
+def make(clock, **overrides):
+    config = BreakerConfig(**{"window": 10, "min_calls": 4, "failure_rate": 0.5, "open_for": 0.5, **overrides})
+    return CircuitBreaker("cars.get_car", config, clock)
+
+
+def test_client_errors_never_trip():
+    breaker = make(Clock())
+    for _ in range(20):
+        with pytest.raises(httpx.HTTPStatusError):
+            run(breaker, fail_with, status_error(404))
+    assert breaker.current_state == "closed"
+    assert breaker.stats()["windowFailures"] == 0
+
+
+def test_opens_on_failure_rate_after_min_calls():
+    clock = Clock()
+    breaker = make(clock)
+    with pytest.raises(httpx.ConnectError):
+        run(breaker, fail_with, httpx.ConnectError("down"))
+    assert breaker.current_state == "closed"
+    run(breaker, succeed)
+    with pytest.raises(httpx.HTTPStatusError):
+        run(breaker, fail_with, status_error(503))
+    with pytest.raises(httpx.ReadTimeout):
+        run(breaker, fail_with, httpx.ReadTimeout("slow"))
+
+    assert breaker.current_state == "open"
+    with pytest.raises(CircuitOpenError):
+        run(breaker, succeed)
+    assert breaker.stats()["rejectedTotal"] == 1
+
+
+def test_window_slides():
+    clock = Clock()
+    breaker = make(clock)
+    for _ in range(3):
+        with pytest.raises(httpx.ConnectError):
+            run(breaker, fail_with, httpx.ConnectError("down"))
+    clock.now += 11
+    with pytest.raises(httpx.ConnectError):
+        run(breaker, fail_with, httpx.ConnectError("down"))
+    assert breaker.current_state == "closed"
+    assert breaker.window_counts() == (1, 1)
+
+
+def trip(breaker):
+    for _ in range(4):
+        with pytest.raises(httpx.ConnectError):
+            run(breaker, fail_with, httpx.ConnectError("down"))
+
+
+def test_half_open_probes_close_after_successes():
+    clock = Clock()
+    breaker = make(clock, half_open_successes=2)
+    trip(breaker)
+    clock.now += 0.5
+    assert breaker.current_state == "half-open"
+    run(breaker, succeed)
+    assert breaker.current_state == "half-open"
+    run(breaker, succeed)
+    assert breaker.current_state == "closed"
+
+
+def test_failed_probe_backs_off():
+    clock = Clock()
+    breaker = make(clock, max_open_for=1.5)
+    trip(breaker)
+    for expected in (1.0, 1.5, 1.5):
+        clock.now += breaker.stats()["openForSeconds"]
+        with pytest.raises(httpx.ConnectError):
+            run(breaker, fail_with, httpx.ConnectError("down"))
+        assert breaker.current_state == "open"
+        assert breaker.stats()["openForSeconds"] == expected
+
+
+def test_cancelled_probe_is_not_a_success():
+    clock = Clock()
+    breaker = make(clock, half_open_successes=1)
+    trip(breaker)
+    clock.now += 0.5
+    with pytest.raises(asyncio.CancelledError):
+        run(breaker, fail_with, asyncio.CancelledError())
+    assert breaker.current_state == "half-open"
+    run(breaker, succeed)
+    assert breaker.current_state == "closed"
+
+
+def test_half_open_limits_concurrent_probes():
+    clock = Clock()
+    breaker = make(clock, half_open_max_calls=1)
+    trip(breaker)
+    clock.now += 0.5
+
+    async def main():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "ok"
+
+        probe = asyncio.ensure_future(breaker.call(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(succeed)
+        release.set()
+        return await probe
+
+    assert asyncio.run(main()) == "ok"
+
+
+def test_group_keeps_endpoints_independent():
+    clock = Clock()
+    group = BreakerGroup("cars", BreakerConfig(min_calls=2, failure_rate=0.5), clock)
+
+    @group
+    async def call_get_car(fail: bool):
+        if fail:
+            raise httpx.ConnectError("down")
+        return "car"
+
+    @group
+    async def call_reserve_car():
+        return "reserved"
+
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(call_get_car(True))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_get_car(False))
+    assert asyncio.run(call_reserve_car()) == "reserved"
+    assert group.stats()["get_car"]["state"] == "open"
+    assert group.stats()["reserve_car"]["state"] == "closed"
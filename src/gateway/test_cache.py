@@ -0,0 +1,69 @@
+import asyncio
+import httpx
+import main as gateway
+from cache import TTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache("car", ttl=10, clock=clock)
+    cache.put("a", {"carUid": "a"})
+    assert cache.get("a") == {"carUid": "a"}
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hitRatio"] == 0.5
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache("car", max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+def test_disabled_from_env(monkeypatch):
+    monkeypatch.setenv("CAR_CACHE_ENABLED", "false")
+    cache = TTLCache.from_env("car", "CAR_CACHE")
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["enabled"] is False
+
+def test_reserve_invalidates_cached_car(monkeypatch, mock_upstreams):
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append((request.method, request.url.path))
+        if request.method == "PUT":
+            return httpx.Response(200, json={"carUid": "car-1", "available": False})
+        return httpx.Response(200, json={"carUid": "car-1", "available": True})
+
+    upstream = mock_upstreams(handler, "cars")["cars"]
+    monkeypatch.setattr(gateway, "car_cache", TTLCache("car"))
+    monkeypatch.setattr(gateway, "cars_page_cache", TTLCache("carsPage"))
+
+    async def scenario():
+        await gateway.get_car("car-1", {})
+        await gateway.get_car("car-1", {})
+        await gateway.call_reserve_car("car-1", {})
+        await gateway.get_car("car-1", {})
+        await upstream.aclose()
+
+    asyncio.run(scenario())
+    assert calls == [
+        ("GET", "/api/v1/cars/car-1"),
+        ("PUT", "/api/v1/cars/car-1/reserve"),
+        ("GET", "/api/v1/cars/car-1"),
+    ]
+    # Released cars become available through the rental outbox, so the cache
+    # never holds availability that could outlive it
+    assert gateway.car_cache.get("car-1") == {"carUid": "car-1"}
@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.responses import JSONResponse
+
+import main as gateway
+from cache import TTLCache
+from fallback import STALE_WARNING, FallbackCache, track_staleness
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_max_age():
+    clock = Clock()
+    cache = FallbackCache("car", max_age=60, clock=clock)
+    cache.put("a", {"carUid": "a"})
+    clock.now += 30
+    assert cache.get("a") == ({"carUid": "a"}, 30)
+    clock.now += 31
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_update_keeps_original_age():
+    clock = Clock()
+    cache = FallbackCache("payment", clock=clock)
+    cache.put("p", {"paymentUid": "p", "status": "PAID", "price": 10})
+    clock.now += 5
+    cache.update("p", status="CANCELED")
+    cache.update("missing", status="CANCELED")
+    assert cache.get("p") == ({"paymentUid": "p", "status": "CANCELED", "price": 10}, 5)
+    assert cache.get("missing") is None
+
+
+def test_revalidation_is_deduplicated_and_rate_limited():
+    clock = Clock()
+    cache = FallbackCache("car", refresh_interval=5, clock=clock)
+    cache.put("a", {"v": 1})
+    calls = []
+
+    async def refresh():
+        calls.append(clock.now)
+        await asyncio.sleep(0)
+        return {"v": len(calls) + 1}
+
+    async def scenario():
+        staleness = track_staleness()
+        assert cache.serve_stale("a", refresh) == {"v": 1}
+        assert cache.serve_stale("a", refresh) == {"v": 1}
+        await asyncio.sleep(0.01)
+        assert cache.serve_stale("a", refresh) == {"v": 2}
+        clock.now += 5
+        cache.serve_stale("a", refresh)
+        await asyncio.sleep(0.01)
+        return staleness
+
+    staleness = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert cache.get("a")[0] == {"v": 3}
+    response = staleness.apply(JSONResponse(content={}))
+    assert response.headers["Warning"] == STALE_WARNING
+    assert response.headers["Age"] == "5"
+
+
+def test_fresh_responses_are_not_marked():
+    response = track_staleness().apply(JSONResponse(content={}))
+    assert "Warning" not in response.headers
+
+
+def test_rentals_fall_back_to_last_known_cars_and_payments(monkeypatch, mock_upstreams):
+    healthy = True
+
+    def handler(request: httpx.Request):
+        if not healthy:
+            return httpx.Response(503)
+        if request.url.path == "/api/v1/cars":
+            return httpx.Response(200, json={"items": [
+                {"carUid": "car-1", "brand": "Mercedes", "model": "GLA", "registrationNumber": "A001AA"}
+            ]})
+        return httpx.Response(200, json=[{"paymentUid": "pay-1", "status": "PAID", "price": 100}])
+
+    upstreams = mock_upstreams(handler, "cars", "payment")
+    monkeypatch.setattr(gateway, "car_cache", TTLCache("car", max_size=0))
+    monkeypatch.setattr(gateway, "car_fallback", FallbackCache("car", refresh_interval=60))
+    monkeypatch.setattr(gateway, "payment_fallback", FallbackCache("payment", refresh_interval=60))
+    rentals = [
+        {"rentalUid": "r-1", "status": "IN_PROGRESS", "dateFrom": "2024-01-01", "dateTo": "2024-01-02",
+         "carUid": "car-1", "paymentUid": "pay-1"},
+        {"rentalUid": "r-2", "status": "CANCELED", "dateFrom": "2024-01-01", "dateTo": "2024-01-02",
+         "carUid": "car-2", "paymentUid": "pay-2"},
+    ]
+
+    async def scenario():
+        nonlocal healthy
+        fresh = await gateway.aggregate_rentals(rentals[:1], {})
+        healthy = False
+        staleness = track_staleness()
+        stale = await gateway.aggregate_rentals(rentals, {})
+        await asyncio.sleep(0)
+        await gateway.car_fallback.close()
+        await gateway.payment_fallback.close()
+        for upstream in upstreams.values():
+            await upstream.aclose()
+        return fresh, stale, staleness
+
+    fresh, stale, staleness = asyncio.run(scenario())
+    assert stale[0] == fresh[0]
+    assert stale[1]["car"] == {"carUid": "car-2", "brand": None, "model": None, "registrationNumber": None}
+    assert stale[1]["payment"] == {"paymentUid": "pay-2", "status": "CANCELED", "price": 0}
+    assert staleness.max_age is not None
+    assert gateway.car_fallback.stats()["staleServed"] == 1
+    assert gateway.car_fallback.stats()["misses"] == 1
+
+def test_payment_parsing_errors_are_not_hidden_behind_fallback(monkeypatch, mock_upstreams):
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json=[{"uid": "pay-1", "status": "PAID"}])
+
+    mock_upstreams(handler, "payment")
+    monkeypatch.setattr(gateway, "payment_fallback", FallbackCache("payment", refresh_interval=60))
+
+    with pytest.raises(KeyError):
+        asyncio.run(gateway.resolve_payments(["pay-1"], {}))
+    assert gateway.payment_fallback.stats()["staleServed"] == 0
@@ -0,0 +1,33 @@
+import asyncio
+from fanout import gather_bounded, chunked
+
+def test_gather_bounded_limits_concurrency():
+    running = 0
+    peak = 0
+
+    async def task(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return i
+
+    results = asyncio.run(gather_bounded((task(i) for i in range(20)), limit=3))
+    assert results == list(range(20))
+    assert peak == 3
+
+def test_gather_bounded_return_exceptions():
+    async def fail():
+        raise ValueError("boom")
+
+    async def ok():
+        return 1
+
+    results = asyncio.run(gather_bounded([ok(), fail()], limit=2, return_exceptions=True))
+    assert results[0] == 1
+    assert isinstance(results[1], ValueError)
+
+def test_chunked():
+    assert chunked(range(5), 2) == [[0, 1], [2, 3], [4]]
+    assert chunked([], 2) == []
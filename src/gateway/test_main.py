@@ -1,5 +1,13 @@
+import asyncio
+import json
+import uuid
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
+
+import main as gateway
+from cache import TTLCache
 from main import app
 
 client = TestClient(app)
@@ -42,3 +50,98 @@ def test_cancel_rental_without_auth():
     response = client.delete("/api/v1/rental/test-rental-uid")
     assert response.status_code == 401
     assert "detail" in response.json()
+
+def test_rentals_stream_is_enriched_in_batches(monkeypatch, mock_upstreams):
+    rentals = [
+        {"rentalUid": f"r-{i}", "status": "FINISHED", "dateFrom": "2024-01-01", "dateTo": "2024-01-02",
+         "carUid": f"car-{i}", "paymentUid": f"pay-{i}"}
+        for i in range(5)
+    ]
+    lookups = []
+
+    def handler(request: httpx.Request):
+        uids = request.url.params.get("uids", "")
+        if request.url.host == "rental.test":
+            assert request.url.params["stream"] == "true"
+            assert request.url.params["status"] == "FINISHED"
+            return httpx.Response(200, content="".join(json.dumps(r) + "\n" for r in rentals))
+        lookups.append(len(uids.split(",")))
+        if request.url.host == "cars.test":
+            return httpx.Response(200, json={"items": [
+                {"carUid": u, "brand": "B", "model": "M", "registrationNumber": "R"} for u in uids.split(",")
+            ]})
+        return httpx.Response(200, json=[{"paymentUid": u, "status": "PAID", "price": 1} for u in uids.split(",")])
+
+    mock_upstreams(handler, "rental", "cars", "payment")
+    monkeypatch.setattr(gateway, "car_cache", TTLCache("car", max_size=0))
+    monkeypatch.setattr(gateway, "RENTAL_STREAM_BATCH", 2)
+    signed = []
+    monkeypatch.setattr(gateway, "forward_headers", lambda authorization, username: signed.append(username) or {})
+
+    async def scenario():
+        response = await gateway.call_stream_rentals({"status": "FINISHED"}, {})
+        return [chunk async for chunk in gateway.stream_aggregated_rentals(response, None, "testuser")]
+
+    chunks = asyncio.run(scenario())
+    assert [chunk.count("\n") for chunk in chunks] == [2, 2, 1]
+    streamed = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert [r["rentalUid"] for r in streamed] == [r["rentalUid"] for r in rentals]
+    assert streamed[4]["car"]["carUid"] == "car-4" and streamed[4]["payment"]["status"] == "PAID"
+    assert sorted(lookups) == [1, 1, 2, 2, 2, 2]
+    assert signed == ["testuser"] * 3
+
+def test_bulk_cancel_fans_out_in_chunks_and_reports_unavailable_chunks(monkeypatch, mock_upstreams):
+    uids = [str(uuid.UUID(int=i)) for i in range(1, 6)]
+    chunks, payment_cancels = [], []
+
+    def handler(request: httpx.Request):
+        if request.url.host == "payment.test":
+            payment_cancels.append(request.url.path.rsplit("/", 1)[1])
+            return httpx.Response(200, json={"status": "CANCELED"})
+        chunk = json.loads(request.content)["rentalUids"]
+        chunks.append(chunk)
+        if uids[4] in chunk:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"results": [
+            {"rentalUid": u, "status": "CANCELED", "previousStatus": "IN_PROGRESS", "carUid": f"car-{u[-1]}",
+             "paymentUid": f"pay-{u[-1]}"}
+            for u in chunk
+        ]})
+
+    mock_upstreams(handler, "rental", "payment")
+    monkeypatch.setattr(gateway, "chunked", lambda items: [list(items)[i:i + 2] for i in range(0, len(items), 2)])
+
+    async def scenario():
+        results = await gateway.close_rentals(gateway.call_cancel_rentals, uids, {})
+        await gateway.cancel_payments(results, {})
+        return results
+
+    results = asyncio.run(scenario())
+    assert sorted(map(len, chunks)) == [1, 2, 2]
+    assert [r["rentalUid"] for r in results] == uids
+    assert [r["status"] for r in results] == ["CANCELED"] * 4 + ["unavailable"]
+    assert sorted(payment_cancels) == ["pay-1", "pay-2", "pay-3", "pay-4"]
+    assert all(r["paymentStatus"] == "CANCELED" for r in results[:4])
+
+def test_car_filters_are_passed_through_and_cached_separately(monkeypatch, login, mock_upstreams):
+    seen = []
+
+    def handler(request: httpx.Request):
+        seen.append(dict(request.url.params))
+        if request.url.params.get("type") == "TRUCK":
+            return httpx.Response(400, json={"detail": "type must be one of SEDAN, SUV, MINIVAN, ROADSTER"})
+        return httpx.Response(200, json={"page": 1, "pageSize": 0, "totalElements": 0, "items": [], "nextCursor": None})
+
+    mock_upstreams(handler, "cars")
+    monkeypatch.setattr(gateway, "cars_page_cache", TTLCache("carsPage", max_size=10, ttl=60))
+    login()
+    first = client.get("/api/v1/cars?type=SUV&minPrice=100&sort=-price")
+    cached = client.get("/api/v1/cars?type=SUV&minPrice=100&sort=-price")
+    other = client.get("/api/v1/cars?type=SEDAN")
+    invalid = client.get("/api/v1/cars?type=TRUCK")
+    assert first.status_code == cached.status_code == other.status_code == 200
+    assert len(seen) == 3
+    assert seen[0] == {"page": "1", "size": "10", "showAll": "false", "type": "SUV", "minPrice": "100", "sort": "-price"}
+    assert seen[1]["type"] == "SEDAN" and "sort" not in seen[1]
+    assert invalid.status_code == 400
+    assert invalid.json() == {"message": "type must be one of SEDAN, SUV, MINIVAN, ROADSTER"}
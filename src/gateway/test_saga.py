@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+from saga import Saga, SagaFailed, Step, StepMetrics
+
+def action(log, name, result=None, delay=0.01, error=None):
+    async def run(results):
+        log.append(f"start {name}")
+        await asyncio.sleep(delay)
+        log.append(f"end {name}")
+        if error is not None:
+            raise error
+        return result if result is not None else name
+    return run
+
+def undo(log, name):
+    async def run(results):
+        log.append(f"undo {name}")
+    return run
+
+def test_independent_steps_run_concurrently_and_dependencies_wait():
+    log = []
+    saga = Saga([
+        Step("car", action(log, "car")),
+        Step("reserve", action(log, "reserve")),
+        Step("payment", action(log, "payment"), requires=("car",)),
+    ])
+    results = asyncio.run(saga.run())
+    assert results == {"car": "car", "reserve": "reserve", "payment": "payment"}
+    assert log[:2] == ["start car", "start reserve"]
+    assert log.index("start payment") > log.index("end car")
+
+def test_failure_compensates_completed_steps_only():
+    log = []
+    saga = Saga([
+        Step("car", action(log, "car")),
+        Step("reserve", action(log, "reserve", delay=0.03), compensate=undo(log, "reserve")),
+        Step("payment", action(log, "payment"), requires=("car",), compensate=undo(log, "payment")),
+        Step("rental", action(log, "rental", error=RuntimeError("boom")), requires=("payment",), compensate=undo(log, "rental")),
+    ])
+    with pytest.raises(SagaFailed) as exc_info:
+        asyncio.run(saga.run())
+    assert exc_info.value.step == "rental"
+    assert exc_info.value.compensated is True
+    assert "undo reserve" in log and "undo payment" in log
+    assert "undo rental" not in log
+
+def test_steps_after_a_failure_are_skipped():
+    log = []
+    saga = Saga([
+        Step("car", action(log, "car", error=RuntimeError("down"))),
+        Step("payment", action(log, "payment"), requires=("car",), compensate=undo(log, "payment")),
+    ])
+    with pytest.raises(SagaFailed):
+        asyncio.run(saga.run())
+    assert "start payment" not in log
+
+def test_ambiguous_failure_can_be_compensated():
+    log = []
+    saga = Saga([
+        Step("reserve", action(log, "reserve", error=TimeoutError()), compensate=undo(log, "reserve"), compensate_on_failure=True),
+    ])
+    with pytest.raises(SagaFailed):
+        asyncio.run(saga.run())
+    assert log[-1] == "undo reserve"
+
+def test_failed_compensation_is_reported():
+    async def broken(results):
+        raise ConnectionError("payment down")
+
+    log = []
+    saga = Saga([
+        Step("payment", action(log, "payment"), compensate=broken),
+        Step("rental", action(log, "rental", error=RuntimeError("boom")), requires=("payment",)),
+    ])
+    with pytest.raises(SagaFailed) as exc_info:
+        asyncio.run(saga.run())
+    assert exc_info.value.compensated is False
+
+def test_step_timings_are_recorded():
+    metrics = StepMetrics()
+    saga = Saga([Step("car", action([], "car"))], metrics=metrics)
+    asyncio.run(saga.run())
+    assert saga.timings["car"] > 0
+    assert metrics.stats()["car"]["count"] == 1
+    assert metrics.stats()["car"]["succeeded"] == 1
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError):
+        Saga([Step("payment", action([], "payment"), requires=("car",))])
+
+def test_failure_compensation_can_depend_on_the_error():
+    log = []
+    saga = Saga([
+        Step(
+            "reserve", action(log, "reserve", error=LookupError("conflict")),
+            compensate=undo(log, "reserve"),
+            compensate_on_failure=lambda error: not isinstance(error, LookupError)
+        ),
+    ])
+    with pytest.raises(SagaFailed) as exc_info:
+        asyncio.run(saga.run())
+    assert isinstance(exc_info.value.error, LookupError)
+    assert "undo reserve" not in log
@@ -0,0 +1,206 @@
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+
+import main as gateway
+from auth_service import auth
+from cache import TTLCache
+from saga_store import MemorySagaStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_second_claim_returns_existing_record():
+    store = MemorySagaStore()
+
+    async def scenario():
+        assert await store.claim("alice", "req-1", {"carUid": "car-1"}) is None
+        await store.update("alice", "req-1", step="payment_created", paymentUid="pay-1")
+        return await store.claim("alice", "req-1", {"carUid": "car-1"})
+
+    existing = asyncio.run(scenario())
+    assert existing["status"] == "started"
+    assert existing["paymentUid"] == "pay-1"
+
+def test_request_ids_are_scoped_per_user():
+    store = MemorySagaStore()
+
+    async def scenario():
+        await store.claim("alice", "req-1", {})
+        return await store.claim("bob", "req-1", {})
+
+    assert asyncio.run(scenario()) is None
+
+def test_compensated_saga_can_be_retried():
+    store = MemorySagaStore()
+
+    async def scenario():
+        await store.claim("alice", "req-1", {"carUid": "car-1"})
+        await store.update("alice", "req-1", status="compensated")
+        return await store.claim("alice", "req-1", {"carUid": "car-2"}), await store.get("alice", "req-1")
+
+    existing, record = asyncio.run(scenario())
+    assert existing is None
+    assert record["carUid"] == "car-2"
+    assert record["status"] == "started"
+
+def test_stuck_sagas_are_claimed_once():
+    clock = FakeClock()
+    store = MemorySagaStore(clock=clock)
+
+    async def scenario():
+        await store.claim("alice", "stuck", {})
+        await store.claim("alice", "done", {})
+        await store.update("alice", "done", status="completed")
+        clock.now += 120
+        await store.claim("alice", "fresh", {})
+        return await store.claim_stuck(older_than=60), await store.claim_stuck(older_than=60)
+
+    first, second = asyncio.run(scenario())
+    assert [s["requestId"] for s in first] == ["stuck"]
+    assert first[0]["status"] == "compensating"
+    assert second == []
+
+def test_finished_sagas_expire_and_store_is_bounded():
+    clock = FakeClock()
+    store = MemorySagaStore(max_size=2, ttl=60, clock=clock)
+
+    async def scenario():
+        for request_id in ("a", "b", "c"):
+            await store.claim("alice", request_id, {})
+        await store.update("alice", "c", status="completed")
+        clock.now += 61
+        return await store.purge()
+
+    assert asyncio.run(scenario()) == 1
+    assert store.stats()["size"] == 1
+    assert store.stats()["evictions"] == 1
+
+def test_recovery_compensates_stuck_saga(monkeypatch, mock_upstreams):
+    calls, owners = [], []
+
+    def handler(request: httpx.Request):
+        calls.append((request.method, request.url.path, auth.INTERNAL_IDENTITY_HEADER in request.headers))
+        owners.append(request.headers.get(gateway.RESERVATION_OWNER_HEADER))
+        return httpx.Response(200, json={})
+
+    clock = FakeClock()
+    store = MemorySagaStore(clock=clock)
+    monkeypatch.setattr(auth, "INTERNAL_AUTH_SECRET", "s3cret")
+    monkeypatch.setattr(gateway, "saga_store", store)
+    mock_upstreams(handler, "cars", "rental", "payment")
+
+    async def scenario():
+        await store.claim("alice", "req-1", {"carUid": "car-1"})
+        await store.update("alice", "req-1", reserveStarted=True)
+        await store.update("alice", "req-1", step="rental_created", paymentUid="pay-1", rentalUid="rent-1")
+        clock.now += 120
+        recovered = await gateway.recover_stuck_sagas()
+        return recovered, await store.get("alice", "req-1")
+
+    recovered, record = asyncio.run(scenario())
+    assert recovered == 1
+    assert record["status"] == "compensated"
+    assert calls == [
+        ("DELETE", "/api/v1/rental/rent-1", True),
+        ("DELETE", "/api/v1/payment/pay-1", True),
+        ("PUT", "/api/v1/cars/car-1/release", True),
+    ]
+    # Only the reservation this saga made may be released
+    assert owners == [None, None, "alice:req-1"]
+
+def test_stored_responses_are_bounded_by_bytes():
+    store = MemorySagaStore(max_bytes=150)
+
+    async def scenario():
+        for request_id in ("a", "b"):
+            await store.claim("alice", request_id, {})
+            await store.update("alice", request_id, status="completed", response={"payload": "x" * 100})
+        return await store.get("alice", "a"), await store.get("alice", "b")
+
+    first, second = asyncio.run(scenario())
+    assert first is None
+    assert second["response"] == {"payload": "x" * 100}
+    assert store.stats()["bytes"] < 150
+
+def test_completed_request_is_replayed_without_upstream_calls(monkeypatch, login, mock_upstreams):
+    def handler(request: httpx.Request):
+        raise AssertionError(f"unexpected upstream call {request.url}")
+
+    store = MemorySagaStore()
+    response = {"rentalUid": "rent-1", "carUid": "car-1", "status": "IN_PROGRESS"}
+    monkeypatch.setattr(gateway, "saga_store", store)
+    mock_upstreams(handler, "cars", "rental", "payment")
+
+    async def prepare():
+        await store.claim("testuser", "req-1", {"carUid": "car-1", "dateFrom": "2024-01-01", "dateTo": "2024-01-03"})
+        await store.update("testuser", "req-1", status="completed", response=response)
+
+    asyncio.run(prepare())
+    login()
+    client = TestClient(gateway.app)
+    replay = client.post(
+        "/api/v1/rental",
+        json={"carUid": "car-1", "dateFrom": "2024-01-01", "dateTo": "2024-01-03"},
+        headers={"X-Request-ID": "req-1"}
+    )
+    reused = client.post(
+        "/api/v1/rental",
+        json={"carUid": "car-1", "dateFrom": "2024-02-01", "dateTo": "2024-02-03"},
+        headers={"X-Request-ID": "req-1"}
+    )
+    assert replay.status_code == 200
+    assert replay.json() == response
+    assert reused.status_code == 422
+
+def test_live_saga_stops_once_recovery_claims_it(monkeypatch, login, mock_upstreams):
+    clock = FakeClock()
+    store = MemorySagaStore(clock=clock)
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append((request.method, request.url.path))
+        if request.url.path == "/api/v1/payment" and request.method == "POST":
+            # The payment step outlives SAGA_STUCK_AFTER and recovery takes over
+            clock.now += 120
+            await gateway.recover_stuck_sagas()
+            return httpx.Response(200, json={"paymentUid": "pay-1", "status": "PAID", "price": 200})
+        if request.url.path.endswith("/reserve"):
+            return httpx.Response(200, json={"status": "reserved"})
+        if request.method == "GET":
+            return httpx.Response(200, json={"carUid": "car-1", "brand": "B", "model": "M", "registrationNumber": "R", "price": 100})
+        return httpx.Response(200, json={"status": "released"})
+
+    monkeypatch.setattr(auth, "INTERNAL_AUTH_SECRET", "s3cret")
+    monkeypatch.setattr(gateway, "saga_store", store)
+    monkeypatch.setattr(gateway, "car_cache", TTLCache("car", max_size=0))
+    mock_upstreams(handler, "cars", "rental", "payment")
+    login()
+    response = TestClient(gateway.app).post(
+        "/api/v1/rental",
+        json={"carUid": "car-1", "dateFrom": "2024-01-01", "dateTo": "2024-01-03"},
+        headers={"X-Request-ID": "req-1"}
+    )
+    record = asyncio.run(store.get("testuser", "req-1"))
+    assert response.status_code == 503
+    # Recovery's outcome is kept, and the live path undoes the payment recovery never saw
+    assert record["status"] == "compensated"
+    assert "paymentUid" not in record
+    assert ("DELETE", "/api/v1/payment/pay-1") in calls
+    assert not any(path.startswith("/api/v1/rental") for _, path in calls)
+
+def test_conditional_update_is_refused_after_a_claim():
+    clock = FakeClock()
+    store = MemorySagaStore(clock=clock)
+
+    async def scenario():
+        await store.claim("alice", "req-1", {})
+        clock.now += 120
+        await store.claim_stuck(older_than=60)
+        return await store.update("alice", "req-1", status="completed", expect_status="started")
+
+    assert asyncio.run(scenario()) is False
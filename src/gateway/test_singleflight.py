@@ -0,0 +1,148 @@
+import asyncio
+
+import httpx
+import pytest
+
+from auth_service import auth
+from singleflight import SingleFlight
+
+
+def counting_call(flight: SingleFlight):
+    calls = []
+    release = asyncio.Event()
+
+    @flight
+    async def call_get_car(car_uid: str, auth: dict):
+        calls.append((car_uid, auth))
+        await release.wait()
+        if car_uid == "broken":
+            raise RuntimeError("upstream failed")
+        return {"carUid": car_uid}
+
+    return call_get_car, calls, release
+
+
+def test_concurrent_identical_reads_share_one_call():
+    flight = SingleFlight("cars")
+
+    async def scenario():
+        call_get_car, calls, release = counting_call(flight)
+        tasks = [asyncio.ensure_future(call_get_car("car-1", {"Authorization": f"Bearer {i}"})) for i in range(5)]
+        tasks.append(asyncio.ensure_future(call_get_car("car-2", {})))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks), calls
+
+    results, calls = asyncio.run(scenario())
+    assert [r["carUid"] for r in results] == ["car-1"] * 5 + ["car-2"]
+    assert len(calls) == 2
+    assert flight.stats() == {"inFlight": 0, "leadersTotal": 2, "collapsedTotal": 4}
+
+
+def test_identity_is_part_of_the_key_when_requested():
+    flight = SingleFlight("rental", per_identity=True)
+
+    async def scenario():
+        call_get_car, calls, release = counting_call(flight)
+        tasks = [asyncio.ensure_future(call_get_car("car-1", {"X-Internal-Identity": user})) for user in "aab"]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return calls
+
+    assert len(asyncio.run(scenario())) == 2
+    assert flight.stats()["collapsedTotal"] == 1
+
+
+def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight("cars")
+
+    async def scenario():
+        call_get_car, calls, release = counting_call(flight)
+        tasks = [asyncio.ensure_future(call_get_car("broken", {})) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await call_get_car("broken", {})
+        return results, calls
+
+    results, calls = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_flight():
+    flight = SingleFlight("cars")
+
+    async def scenario():
+        call_get_car, calls, release = counting_call(flight)
+        leader = asyncio.ensure_future(call_get_car("car-1", {}))
+        follower = asyncio.ensure_future(call_get_car("car-1", {}))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await follower
+
+    assert asyncio.run(scenario()) == {"carUid": "car-1"}
+
+
+def test_forget_starts_fresh_calls_after_a_write():
+    flight = SingleFlight("cars")
+
+    async def scenario():
+        call_get_car, calls, release = counting_call(flight)
+        before = asyncio.ensure_future(call_get_car("car-1", {}))
+        await asyncio.sleep(0)
+        flight.forget()
+        after = asyncio.ensure_future(call_get_car("car-1", {}))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(before, after)
+        return calls
+
+    assert len(asyncio.run(scenario())) == 2
+
+
+def test_identities_are_keyed_on_the_signed_user(monkeypatch):
+    monkeypatch.setattr(auth, "INTERNAL_AUTH_SECRET", "s3cret")
+    flight = SingleFlight("rental", per_identity=True)
+    # Assertions signed a second apart differ but name the same user
+    identities = [auth.sign_identity("alice", ttl=60), auth.sign_identity("alice", ttl=61), auth.sign_identity("bob")]
+
+    async def scenario():
+        call_get_car, calls, release = counting_call(flight)
+        tasks = [asyncio.ensure_future(call_get_car("car-1", {"X-Internal-Identity": i})) for i in identities]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return calls
+
+    assert len(asyncio.run(scenario())) == 2
+
+
+def test_followers_retry_when_the_leader_is_rejected():
+    flight = SingleFlight("cars")
+    calls = []
+    release = asyncio.Event()
+
+    @flight
+    async def call_get_car(car_uid: str, auth: dict):
+        calls.append(auth["Authorization"])
+        await release.wait()
+        if auth["Authorization"] == "Bearer expired":
+            request = httpx.Request("GET", "http://cars.test")
+            raise httpx.HTTPStatusError("401", request=request, response=httpx.Response(401, request=request))
+        return {"carUid": car_uid}
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(call_get_car("car-1", {"Authorization": t})) for t in ("Bearer expired", "Bearer ok")]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    leader, follower = asyncio.run(scenario())
+    assert isinstance(leader, httpx.HTTPStatusError)
+    assert follower == {"carUid": "car-1"}
+    assert calls == ["Bearer expired", "Bearer ok"]
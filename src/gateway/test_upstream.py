@@ -0,0 +1,56 @@
+import asyncio
+import httpx
+from upstream import Upstream, UpstreamConfig, UpstreamRegistry
+
+def make_upstream(handler, **kwargs):
+    config = UpstreamConfig("cars", "http://cars.test", **kwargs)
+    return Upstream(config, transport=httpx.MockTransport(handler))
+
+def test_config_from_env(monkeypatch):
+    monkeypatch.setenv("CAR_SERVICE_URL", "http://cars.local:8070")
+    monkeypatch.setenv("CAR_SERVICE_TIMEOUT", "2.5")
+    monkeypatch.setenv("CAR_SERVICE_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("CAR_SERVICE_HTTP2", "true")
+    config = UpstreamConfig.from_env("cars", "CAR_SERVICE", "http://car-service:80")
+    assert config.base_url == "http://cars.local:8070"
+    assert config.timeout == 2.5
+    assert config.max_connections == 7
+    assert config.http2 is True
+
+def test_client_is_reused_between_requests():
+    upstream = make_upstream(lambda request: httpx.Response(200, json={"path": request.url.path}))
+
+    async def scenario():
+        first = await upstream.get("/api/v1/cars")
+        client = upstream.open()
+        second = await upstream.get("/api/v1/cars/1")
+        assert upstream.open() is client
+        await upstream.aclose()
+        return first.json(), second.json()
+
+    first, second = asyncio.run(scenario())
+    assert first == {"path": "/api/v1/cars"}
+    assert second == {"path": "/api/v1/cars/1"}
+    assert upstream.stats()["requestsTotal"] == 2
+    assert upstream.stats()["inFlight"] == 0
+
+def test_saturation_is_reported():
+    async def handler(request):
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={})
+
+    upstream = make_upstream(handler, max_connections=2)
+
+    async def scenario():
+        await asyncio.gather(*(upstream.get("/") for _ in range(5)))
+        await upstream.aclose()
+
+    asyncio.run(scenario())
+    stats = upstream.stats()
+    assert stats["peakInFlight"] == 5
+    assert stats["saturatedTotal"] == 3
+
+def test_registry_stats_by_name():
+    registry = UpstreamRegistry([make_upstream(lambda request: httpx.Response(200))])
+    assert list(registry.stats()) == ["cars"]
+    assert registry["cars"].name == "cars"
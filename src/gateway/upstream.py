@@ -0,0 +1,183 @@
+import importlib.util
+import logging
+import os
+import httpx
+
+from instrumentation.tracing import inject
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class UpstreamConfig:
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        timeout: float = 5.0,
+        connect_timeout: float = 1.0,
+        pool_timeout: float = 1.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_timeout = pool_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, default_url: str) -> "UpstreamConfig":
+        return cls(
+            name=name,
+            base_url=os.environ.get(f"{prefix}_URL", default_url),
+            timeout=_env_float(f"{prefix}_TIMEOUT", 5.0),
+            connect_timeout=_env_float(f"{prefix}_CONNECT_TIMEOUT", 1.0),
+            pool_timeout=_env_float(f"{prefix}_POOL_TIMEOUT", 1.0),
+            max_connections=_env_int(f"{prefix}_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_env_int(f"{prefix}_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float(f"{prefix}_KEEPALIVE_EXPIRY", 30.0),
+            http2=_env_bool(f"{prefix}_HTTP2", False),
+        )
+
+
+class Upstream:
+    def __init__(self, config: UpstreamConfig, transport: httpx.AsyncBaseTransport = None):
+        self.config = config
+        self._transport = transport
+        self._client = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.saturated_total = 0
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    @property
+    def base_url(self) -> str:
+        return self.config.base_url
+
+    def open(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    def _build_client(self) -> httpx.AsyncClient:
+        config = self.config
+        http2 = config.http2
+        if http2 and not HTTP2_AVAILABLE:
+            logging.warning(f"HTTP/2 requested for {config.name} but 'h2' is not installed, using HTTP/1.1")
+            http2 = False
+        limits = httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        )
+        timeout = httpx.Timeout(
+            config.timeout,
+            connect=config.connect_timeout,
+            pool=config.pool_timeout,
+        )
+        return httpx.AsyncClient(
+            base_url=config.base_url,
+            limits=limits,
+            timeout=timeout,
+            http2=http2,
+            transport=self._transport,
+        )
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        client = self.open()
+        self.requests_total += 1
+        if self.in_flight >= self.config.max_connections:
+            self.saturated_total += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        kwargs["headers"] = inject(dict(kwargs.get("headers") or {}))
+        try:
+            return await client.request(method, path, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, method: str, path: str, **kwargs) -> httpx.Response:
+        # The caller owns the response and must aclose() it
+        client = self.open()
+        self.requests_total += 1
+        kwargs["headers"] = inject(dict(kwargs.get("headers") or {}))
+        return await client.send(client.build_request(method, path, **kwargs), stream=True)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        max_connections = self.config.max_connections
+        return {
+            "baseUrl": self.config.base_url,
+            "maxConnections": max_connections,
+            "inFlight": self.in_flight,
+            "peakInFlight": self.peak_in_flight,
+            "saturation": round(self.in_flight / max_connections, 3) if max_connections else 0.0,
+            "requestsTotal": self.requests_total,
+            "saturatedTotal": self.saturated_total,
+        }
+
+
+class UpstreamRegistry:
+    def __init__(self, upstreams):
+        self._upstreams = {u.name: u for u in upstreams}
+
+    def __getitem__(self, name: str) -> Upstream:
+        return self._upstreams[name]
+
+    def __iter__(self):
+        return iter(self._upstreams.values())
+
+    def start(self):
+        for upstream in self:
+            upstream.open()
+
+    async def aclose(self):
+        for upstream in self:
+            await upstream.aclose()
+
+    def stats(self) -> dict:
+        return {u.name: u.stats() for u in self}
@@ -0,0 +1,103 @@
+import functools
+import time
+
+from fastapi import Request
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+
+registry = REGISTRY
+
+http_request_seconds = Histogram(
+    "http_server_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"),
+    registry=registry
+)
+http_requests_in_flight = Gauge(
+    "http_server_requests_in_flight", "HTTP requests currently being served.", ("method",), registry=registry
+)
+upstream_call_seconds = Histogram(
+    "upstream_call_duration_seconds", "Latency of calls to other services.", ("call", "outcome"), registry=registry
+)
+db_query_seconds = Histogram(
+    "db_query_duration_seconds", "Database query latency by statement type.", ("operation", "outcome"),
+    registry=registry
+)
+db_pool_connections = Gauge(
+    "db_pool_connections", "Database pool connections by state.", ("state",), registry=registry
+)
+circuit_breaker_state = Gauge(
+    "circuit_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open.", ("breaker",), registry=registry
+)
+singleflight_calls = Counter(
+    "singleflight_calls", "Upstream reads that started a call (leader) or joined one in flight (collapsed).",
+    ("call", "role"), registry=registry
+)
+
+BREAKER_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+
+def _route_of(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def instrument_app(app, db_pool=None):
+    @app.middleware("http")
+    async def record_request(request: Request, call_next):
+        if request.url.path == "/manage/metrics":
+            return await call_next(request)
+        started = time.perf_counter()
+        method = request.method
+        in_flight = http_requests_in_flight.labels(method=method)
+        in_flight.inc()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            in_flight.dec()
+            http_request_seconds.labels(method=method, route=_route_of(request), status=status).observe(
+                time.perf_counter() - started
+            )
+
+    @app.get("/manage/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    if db_pool is not None:
+        instrument_pool(db_pool)
+    return app
+
+
+def instrument_pool(pool):
+    db_pool_connections.labels(state="in_use").set_function(lambda: pool.stats()["inUse"])
+    db_pool_connections.labels(state="idle").set_function(lambda: pool.stats()["idle"])
+    db_pool_connections.labels(state="waiting").set_function(lambda: pool.stats()["waiting"])
+
+
+def observe_query(record):
+    operation = record.query.lstrip().split(None, 1)[0].upper() if record.query.strip() else "UNKNOWN"
+    db_query_seconds.labels(operation=operation, outcome="error" if record.exception is not None else "ok").observe(
+        record.elapsed
+    )
+
+
+def timed_call(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await func(*args, **kwargs)
+            outcome = "ok"
+            return result
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            upstream_call_seconds.labels(call=func.__name__, outcome=outcome).observe(time.perf_counter() - started)
+    return wrapper
+
+
+def watch_breaker(name: str, breaker):
+    circuit_breaker_state.labels(breaker=name).set_function(lambda: BREAKER_STATES.get(breaker.current_state, -1))
@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import generate_latest
+
+from instrumentation import metrics
+from instrumentation.metrics import instrument_app, observe_query, timed_call, watch_breaker
+
+
+def test_app_exposes_route_latency():
+    app = FastAPI()
+    instrument_app(app)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    response = client.get("/manage/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_server_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="200"} 2.0' in response.text
+    assert 'http_server_requests_in_flight{method="GET"} 0.0' in response.text
+
+
+def test_upstream_calls_and_breakers_are_recorded():
+    @timed_call
+    async def call_flaky(fail: bool):
+        if fail:
+            raise ConnectionError("down")
+        return "ok"
+
+    asyncio.run(call_flaky(False))
+    with pytest.raises(ConnectionError):
+        asyncio.run(call_flaky(True))
+    breaker = SimpleNamespace(current_state="open")
+    watch_breaker("flaky", breaker)
+    observe_query(SimpleNamespace(query="  select 1", elapsed=0.002, exception=None))
+
+    text = generate_latest(metrics.registry).decode()
+
+    assert 'upstream_call_duration_seconds_count{call="call_flaky",outcome="ok"} 1.0' in text
+    assert 'upstream_call_duration_seconds_count{call="call_flaky",outcome="ConnectionError"} 1.0' in text
+    assert 'circuit_breaker_state{breaker="flaky"} 2.0' in text
+    breaker.current_state = "closed"
+    assert 'circuit_breaker_state{breaker="flaky"} 0.0' in generate_latest(metrics.registry).decode()
+    assert 'db_query_duration_seconds_count{operation="SELECT",outcome="ok"}' in text
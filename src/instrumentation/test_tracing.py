@@ -0,0 +1,123 @@
+import json
+from types import SimpleNamespace
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from instrumentation import tracing
+from instrumentation.tracing import (
+    BatchProcessor, FileExporter, NoopExporter, OtlpExporter, Tracer, inject, parse_traceparent, trace_query
+)
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+def make_tracer(ratio=1.0, exporter=None):
+    exporter = exporter or ListExporter()
+    return Tracer(BatchProcessor(exporter), sample_ratio=ratio, service="test"), exporter
+
+
+def test_parse_traceparent():
+    ctx = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+    assert (ctx.trace_id, ctx.span_id, ctx.sampled) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    assert parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00").sampled is False
+    assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+
+def test_child_spans_share_trace_and_are_exported(monkeypatch):
+    tracer, exporter = make_tracer()
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    with tracer.span("parent") as parent:
+        with tracer.span("child", db="x") as child:
+            headers = inject({})
+        trace_query(SimpleNamespace(query="SELECT *\n  FROM cars", elapsed=0.01, exception=None))
+    tracer.processor.flush()
+
+    assert headers["traceparent"] == f"00-{parent.trace_id}-{child.span_id}-01"
+    names = {s.name: s for s in exporter.spans}
+    assert set(names) == {"parent", "child", "db.query"}
+    assert names["child"].parent_id == parent.span_id
+    assert names["db.query"].parent_id == parent.span_id
+    assert names["db.query"].attributes["db.statement"] == "SELECT * FROM cars"
+    assert names["db.query"].end_ns - names["db.query"].start_ns == 10_000_000
+
+
+def test_unsampled_traces_propagate_without_exporting():
+    tracer, exporter = make_tracer(ratio=0.0)
+    with tracer.span("root") as root:
+        headers = inject({})
+    tracer.processor.flush()
+
+    assert headers["traceparent"].endswith("-00")
+    assert root.trace_id in headers["traceparent"]
+    assert exporter.spans == []
+
+    incoming = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+    with tracer.span("server", parent=incoming) as span:
+        pass
+    tracer.processor.flush()
+    assert span.sampled and exporter.spans[0].parent_id == "00f067aa0ba902b7"
+
+
+def test_noop_exporter_never_samples():
+    tracer = Tracer(BatchProcessor(NoopExporter()), sample_ratio=1.0)
+    incoming = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+    with tracer.span("server", parent=incoming) as span:
+        pass
+    assert not span.sampled
+    assert tracer.processor.stats()["queued"] == 0
+
+
+def test_queue_is_bounded():
+    tracer = Tracer(BatchProcessor(ListExporter(), max_queue=2), sample_ratio=1.0)
+    for _ in range(5):
+        with tracer.span("s"):
+            pass
+    assert tracer.processor.stats()["dropped"] == 3
+
+
+def test_app_continues_incoming_trace(monkeypatch, tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer, _ = make_tracer(exporter=FileExporter(str(path)))
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    app = FastAPI()
+    tracing.trace_app(app, "svc")
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int, request: Request):
+        return inject({})
+
+    with TestClient(app) as client:
+        response = client.get("/items/7", headers={"traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"})
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(spans) == 1
+    assert spans[0]["name"] == "GET /items/{item_id}"
+    assert spans[0]["service"] == "svc"
+    assert spans[0]["parentSpanId"] == "00f067aa0ba902b7"
+    assert response.json()["traceparent"] == f"00-4bf92f3577b34da6a3ce929d0e0e4736-{spans[0]['spanId']}-01"
+
+
+def test_otlp_encoding():
+    tracer, _ = make_tracer()
+    with tracer.span("call", "client", retries=2, cached=False):
+        pass
+    span = tracer.processor._queue[0]
+    span.error = "ConnectError: down"
+
+    body = OtlpExporter("http://collector/v1/traces").encode([span])
+
+    encoded = body["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert body["resourceSpans"][0]["resource"]["attributes"][0]["value"] == {"stringValue": "test"}
+    assert encoded["kind"] == 3 and encoded["parentSpanId"] == ""
+    assert {"key": "retries", "value": {"intValue": "2"}} in encoded["attributes"]
+    assert {"key": "cached", "value": {"boolValue": False}} in encoded["attributes"]
+    assert encoded["status"] == {"code": 2, "message": "ConnectError: down"}
@@ -0,0 +1,337 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+
+from fastapi import Request
+
+TRACEPARENT_HEADER = "traceparent"
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+MAX_STATEMENT_LENGTH = 200
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+def parse_traceparent(header: str):
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    if match is None or match.group(1) == "ff":
+        return None
+    _, trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "sampled", "attributes",
+                 "start_ns", "end_ns", "error", "_tracer")
+
+    def __init__(self, tracer, name: str, kind: str, trace_id: str, parent_id, sampled: bool, attributes: dict):
+        self._tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def end(self, error: BaseException = None, end_ns: int = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.sampled:
+            self._tracer.processor.submit(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": self._tracer.service,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class NoopExporter:
+    def export(self, spans: list):
+        pass
+
+
+class FileExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()]
+
+
+class OtlpExporter:
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def encode(self, spans: list) -> dict:
+        by_service = {}
+        for span in spans:
+            by_service.setdefault(span._tracer.service, []).append({
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": SPAN_KINDS.get(span.kind, 1),
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": _otlp_attributes(span.attributes),
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            })
+        return {"resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes({"service.name": service})},
+                "scopeSpans": [{"scope": {"name": "instrumentation.tracing"}, "spans": encoded}],
+            }
+            for service, encoded in by_service.items()
+        ]}
+
+    def export(self, spans: list):
+        body = json.dumps(self.encode(spans)).encode()
+        request = urllib.request.Request(
+            self.endpoint, data=body, method="POST", headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class BatchProcessor:
+    def __init__(self, exporter, max_queue: int = 2048, batch_size: int = 256, interval: float = 5.0):
+        self.exporter = exporter
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, span: Span):
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._queue.append(span)
+            queued = len(self._queue)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+        if queued >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._export_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    return
+                try:
+                    self.exporter.export(batch)
+                    self.exported += len(batch)
+                except Exception as e:
+                    self.failed += len(batch)
+                    logging.warning(f"Exporting {len(batch)} spans failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+class Tracer:
+    def __init__(self, processor: BatchProcessor, sample_ratio: float = 0.0, service: str = "unknown"):
+        self.processor = processor
+        self.sample_ratio = sample_ratio
+        self.service = service
+        self.enabled = not isinstance(processor.exporter, NoopExporter)
+        self.started = 0
+        self.sampled = 0
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        backend = os.environ.get("TRACE_EXPORTER", "none")
+        if backend == "none":
+            exporter = NoopExporter()
+        elif backend == "file":
+            exporter = FileExporter(os.environ.get("TRACE_FILE", "traces.jsonl"))
+        elif backend == "otlp":
+            exporter = OtlpExporter(
+                os.environ.get("TRACE_OTLP_ENDPOINT", "http://otel-collector:4318/v1/traces"),
+                float(os.environ.get("TRACE_OTLP_TIMEOUT", "5")),
+            )
+        else:
+            raise ValueError(f"Unknown TRACE_EXPORTER: {backend}")
+        processor = BatchProcessor(
+            exporter,
+            max_queue=int(os.environ.get("TRACE_MAX_QUEUE", "2048")),
+            batch_size=int(os.environ.get("TRACE_BATCH_SIZE", "256")),
+            interval=float(os.environ.get("TRACE_EXPORT_INTERVAL", "5")),
+        )
+        return cls(processor, float(os.environ.get("TRACE_SAMPLE_RATIO", "0.01")))
+
+    def start_span(self, name: str, kind: str = "internal", parent=None, **attributes) -> Span:
+        parent = parent if parent is not None else _current.get()
+        self.started += 1
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled and self.enabled
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = self.enabled and random.random() < self.sample_ratio
+        if sampled:
+            self.sampled += 1
+        return Span(self, name, kind, trace_id, parent_id, sampled, attributes if sampled else {})
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", parent=None, **attributes):
+        span = self.start_span(name, kind, parent, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sampleRatio": self.sample_ratio,
+            "spansStarted": self.started,
+            "spansSampled": self.sampled,
+            **self.processor.stats(),
+        }
+
+
+tracer = Tracer.from_env()
+
+
+def current_span():
+    return _current.get()
+
+
+def inject(headers: dict) -> dict:
+    span = _current.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.traceparent()
+    return headers
+
+
+def traced(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with tracer.span(func.__name__, "client"):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def trace_query(record):
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        return
+    end_ns = time.time_ns()
+    statement = " ".join(record.query.split())
+    span = tracer.start_span(
+        "db.query", "client", parent,
+        **{"db.system": "postgresql", "db.statement": statement[:MAX_STATEMENT_LENGTH]}
+    )
+    span.start_ns = end_ns - int(record.elapsed * 1e9)
+    span.end(error=record.exception, end_ns=end_ns)
+
+
+def trace_app(app, service: str):
+    tracer.service = service
+
+    @app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        if request.url.path.startswith("/manage/"):
+            return await call_next(request)
+        parent = parse_traceparent(request.headers.get(TRACEPARENT_HEADER))
+        with tracer.span(f"{request.method} {request.url.path}", "server", parent) as span:
+            span.set_attribute("http.method", request.method)
+            span.set_attribute("http.target", request.url.path)
+            response = await call_next(request)
+            route = request.scope.get("route")
+            if route is not None:
+                span.name = f"{request.method} {route.path}"
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.error = f"HTTP {response.status_code}"
+            return response
+
+    app.add_event_handler("shutdown", tracer.processor.flush)
+    return app
@@ -1,9 +1,13 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import psycopg2
+import os
 import uuid
-from auth_service.auth import protected_route, get_current_user
+from auth_service.auth import protected_route, jwks_cache, token_cache
+from database.pool import ConnectionPool
+from database.migrations import migrate_on_startup
+from instrumentation.metrics import instrument_app, observe_query
+from instrumentation.tracing import trace_app, trace_query, tracer
 
 app = FastAPI()
 
@@ -14,59 +18,97 @@ DB_CONFIG = {
     "password": "test"
 }
 
+db_pool = ConnectionPool.from_env(query_loggers=(observe_query, trace_query), **DB_CONFIG)
+instrument_app(app, db_pool=db_pool)
+trace_app(app, "payment-service")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+MAX_BATCH_UIDS = 500
+
+def parse_uids(uids: str):
+    values = [u.strip() for u in uids.split(",") if u.strip()]
+    if len(values) > MAX_BATCH_UIDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_UIDS} uids per request")
+    try:
+        return list(dict.fromkeys(str(uuid.UUID(u)) for u in values))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid uid in uids")
+
+@app.on_event("startup")
+async def startup():
+    await db_pool.start()
+    await migrate_on_startup(db_pool, MIGRATIONS_DIR)
+    await jwks_cache.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await jwks_cache.stop()
+    await db_pool.close()
+
 @app.get("/manage/health")
 def health():
     return JSONResponse(content={"status": "OK"})
 
+@app.get("/manage/stats")
+def stats():
+    return JSONResponse(content={"dbPool": db_pool.stats(), "jwks": jwks_cache.stats(), "tokenCache": token_cache.stats(), "tracing": tracer.stats()})
+
 class CreatePaymentRequest(BaseModel):
     price: int
 
 @app.post("/api/v1/payment")
 @protected_route
-def create_payment(request: Request, current_user: str, req: CreatePaymentRequest):
+async def create_payment(request: Request, current_user: str, req: CreatePaymentRequest):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
         payment_uid = str(uuid.uuid4())
-        cur.execute(
-            "INSERT INTO payment (payment_uid, status, price) VALUES (%s, %s, %s)",
-            (payment_uid, "PAID", req.price)
+        await db_pool.execute(
+            "INSERT INTO payment (payment_uid, status, price) VALUES ($1, $2, $3)",
+            payment_uid, "PAID", req.price
         )
-        conn.commit()
-        cur.close()
-        conn.close()
         return JSONResponse(content={"paymentUid": payment_uid, "status": "PAID", "price": req.price})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/payment")
+@protected_route
+async def get_payments(request: Request, current_user: str, uids: str = Query(...)):
+    payment_uids = parse_uids(uids)
+    if not payment_uids:
+        return JSONResponse(content=[])
+    try:
+        rows = await db_pool.fetch(
+            "SELECT payment_uid, status, price FROM payment WHERE payment_uid = ANY($1::uuid[])",
+            payment_uids
+        )
+        return JSONResponse(content=[
+            {"paymentUid": str(r[0]), "status": r[1], "price": r[2]}
+            for r in rows
+        ])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/v1/payment/{payment_uid}")
 @protected_route
-def get_payment(request: Request, current_user: str, payment_uid: str):
+async def get_payment(request: Request, current_user: str, payment_uid: str):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("SELECT payment_uid, status, price FROM payment WHERE payment_uid = %s", (payment_uid,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        row = await db_pool.fetchrow("SELECT payment_uid, status, price FROM payment WHERE payment_uid = $1", payment_uid)
         if not row:
             raise HTTPException(status_code=404, detail="Payment not found")
         return JSONResponse(content={"paymentUid": str(row[0]), "status": row[1], "price": row[2]})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/v1/payment/{payment_uid}")
 @protected_route
-def cancel_payment(request: Request, current_user: str, payment_uid: str):
+async def cancel_payment(request: Request, current_user: str, payment_uid: str):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("UPDATE payment SET status = 'CANCELED' WHERE payment_uid = %s", (payment_uid,))
-        if cur.rowcount == 0:
+        result = await db_pool.execute("UPDATE payment SET status = 'CANCELED' WHERE payment_uid = $1", payment_uid)
+        if result == "UPDATE 0":
             raise HTTPException(status_code=404, detail="Payment not found")
-        conn.commit()
-        cur.close()
-        conn.close()
         return JSONResponse(content={"status": "CANCELED"})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
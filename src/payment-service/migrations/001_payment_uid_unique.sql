@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+DROP INDEX CONCURRENTLY IF EXISTS payment_payment_uid_key;
+CREATE UNIQUE INDEX CONCURRENTLY payment_payment_uid_key ON payment (payment_uid);
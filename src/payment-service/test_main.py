@@ -19,6 +19,11 @@ def test_get_payment_without_auth():
     assert response.status_code == 401
     assert "detail" in response.json()
 
+def test_get_payments_batch_without_auth():
+    response = client.get("/api/v1/payment?uids=test-uuid")
+    assert response.status_code == 401
+    assert "detail" in response.json()
+
 def test_cancel_payment_without_auth():
     response = client.delete("/api/v1/payment/test-uuid")
     assert response.status_code == 401
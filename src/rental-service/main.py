@@ -1,9 +1,20 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-import psycopg2
+from typing import List, Optional
+import base64
+import binascii
+import json
+import logging
+import os
 import uuid
-from auth_service.auth import protected_route, get_current_user
+from datetime import date
+from auth_service.auth import protected_route, jwks_cache, token_cache
+from database.pool import ConnectionPool
+from database.migrations import migrate_on_startup
+from instrumentation.metrics import instrument_app, observe_query
+from instrumentation.tracing import trace_app, trace_query, tracer
+from outbox import OutboxRelay, enqueue_availability
 
 app = FastAPI()
 
@@ -14,119 +25,266 @@ DB_CONFIG = {
     "password": "test"
 }
 
+db_pool = ConnectionPool.from_env(query_loggers=(observe_query, trace_query), **DB_CONFIG)
+instrument_app(app, db_pool=db_pool)
+trace_app(app, "rental-service")
+outbox_relay = OutboxRelay.from_env(db_pool)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+RENTAL_STATUSES = ("IN_PROGRESS", "FINISHED", "CANCELED")
+MAX_PAGE_SIZE = int(os.environ.get("RENTAL_MAX_PAGE_SIZE", "100"))
+STREAM_PREFETCH = int(os.environ.get("RENTAL_STREAM_PREFETCH", "500"))
+STREAM_CHUNK_ROWS = 100
+MAX_BATCH_UIDS = 500
+
+@app.on_event("startup")
+async def startup():
+    await db_pool.start()
+    await migrate_on_startup(db_pool, MIGRATIONS_DIR)
+    await jwks_cache.start()
+    await outbox_relay.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await outbox_relay.stop()
+    await jwks_cache.stop()
+    await db_pool.close()
+
 @app.get("/manage/health")
 def health():
     return JSONResponse(content={"status": "OK"})
 
+@app.get("/manage/stats")
+def stats():
+    return JSONResponse(content={"dbPool": db_pool.stats(), "jwks": jwks_cache.stats(), "tokenCache": token_cache.stats(), "tracing": tracer.stats(), "outbox": outbox_relay.stats()})
+
 class RentalCreateRequest(BaseModel):
     carUid: str
     dateFrom: str
     dateTo: str
     paymentUid: str
 
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_date(name: str, value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}")
+
+def rental_filters(username: str, status: Optional[str], date_from: Optional[str], date_to: Optional[str]):
+    conditions, args = ["username = $1"], [username]
+    if status:
+        statuses = list(dict.fromkeys(s.strip().upper() for s in status.split(",") if s.strip()))
+        if any(s not in RENTAL_STATUSES for s in statuses):
+            raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(RENTAL_STATUSES)}")
+        args.append(statuses)
+        conditions.append(f"status = ANY(${len(args)}::text[])")
+    # A rental matches the range when it overlaps it
+    if date_from:
+        args.append(parse_date("dateFrom", date_from))
+        conditions.append(f"date_to >= ${len(args)}")
+    if date_to:
+        args.append(parse_date("dateTo", date_to))
+        conditions.append(f"date_from <= ${len(args)}")
+    return conditions, args
+
+def rental_to_dict(r):
+    return {
+        "rentalUid": str(r[0]),
+        "paymentUid": str(r[1]),
+        "carUid": str(r[2]),
+        "dateFrom": r[3].isoformat(),
+        "dateTo": r[4].isoformat(),
+        "status": r[5]
+    }
+
 @app.post("/api/v1/rental")
 @protected_route
-def create_rental(
+async def create_rental(
     request: Request,
     current_user: str,
     req: RentalCreateRequest
 ):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
         rental_uid = str(uuid.uuid4())
-        cur.execute("""
+        await db_pool.execute("""
             INSERT INTO rental (rental_uid, username, payment_uid, car_uid, date_from, date_to, status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (rental_uid, current_user, req.paymentUid, req.carUid, req.dateFrom, req.dateTo, "IN_PROGRESS"))
-        conn.commit()
-        cur.close()
-        conn.close()
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+        """, rental_uid, current_user, req.paymentUid, req.carUid,
+            date.fromisoformat(req.dateFrom), date.fromisoformat(req.dateTo), "IN_PROGRESS")
         return JSONResponse(content={"rentalUid": rental_uid})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/rental")
 @protected_route
-def get_user_rentals(request: Request, current_user: str):
+async def get_user_rentals(
+    request: Request,
+    current_user: str,
+    size: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    dateFrom: Optional[str] = Query(None),
+    dateTo: Optional[str] = Query(None),
+    stream: bool = Query(False)
+):
+    conditions, args = rental_filters(current_user, status, dateFrom, dateTo)
+    if cursor is not None:
+        args.append(decode_cursor(cursor))
+        conditions.append(f"id > ${len(args)}")
+    select_query = f"""
+        SELECT rental_uid, payment_uid, car_uid, date_from, date_to, status, id
+        FROM rental WHERE {" AND ".join(conditions)}
+        ORDER BY id
+    """
+    if stream:
+        return StreamingResponse(stream_rentals(select_query, args), media_type="application/x-ndjson")
+    paged = size is not None or cursor is not None
+    if paged:
+        size = min(size or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+        args.append(size + 1)
+        select_query += f" LIMIT ${len(args)}"
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT rental_uid, payment_uid, car_uid, date_from, date_to, status
-            FROM rental WHERE username = %s
-        """, (current_user,))
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        return JSONResponse(content=[
-            {
-                "rentalUid": str(r[0]),
-                "paymentUid": str(r[1]),
-                "carUid": str(r[2]),
-                "dateFrom": r[3].isoformat(),
-                "dateTo": r[4].isoformat(),
-                "status": r[5]
-            }
-            for r in rows
-        ])
+        rows = await db_pool.fetch(select_query, *args)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not paged:
+        return JSONResponse(content=[rental_to_dict(r) for r in rows])
+    items = [rental_to_dict(r) for r in rows[:size]]
+    return JSONResponse(content={
+        "pageSize": len(items),
+        "items": items,
+        "nextCursor": encode_cursor(rows[size - 1][6]) if len(rows) > size else None
+    })
+
+async def stream_rentals(select_query: str, args: list):
+    lines = []
+    try:
+        async with db_pool.connection() as conn:
+            async with conn.transaction(readonly=True):
+                async for row in conn.cursor(select_query, *args, prefetch=STREAM_PREFETCH):
+                    lines.append(json.dumps(rental_to_dict(row)))
+                    if len(lines) >= STREAM_CHUNK_ROWS:
+                        yield "\n".join(lines) + "\n"
+                        lines = []
+    except Exception as e:
+        logging.warning(f"Rental stream aborted: {e}")
+        raise
+    if lines:
+        yield "\n".join(lines) + "\n"
 
 @app.get("/api/v1/rental/{rental_uid}")
 @protected_route
-def get_rental(request: Request, current_user: str, rental_uid: str):
+async def get_rental(request: Request, current_user: str, rental_uid: str):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("""
+        row = await db_pool.fetchrow("""
             SELECT rental_uid, payment_uid, car_uid, date_from, date_to, status
-            FROM rental WHERE rental_uid = %s AND username = %s
-        """, (rental_uid, current_user))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+            FROM rental WHERE rental_uid = $1 AND username = $2
+        """, rental_uid, current_user)
         if not row:
             raise HTTPException(status_code=404, detail="Rental not found or access denied")
-        return JSONResponse(content={
-            "rentalUid": str(row[0]),
-            "paymentUid": str(row[1]),
-            "carUid": str(row[2]),
-            "dateFrom": row[3].isoformat(),
-            "dateTo": row[4].isoformat(),
-            "status": row[5]
-        })
+        return JSONResponse(content=rental_to_dict(row))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class RentalUidsRequest(BaseModel):
+    rentalUids: List[str]
+
+def normalize_uids(values: list):
+    if len(values) > MAX_BATCH_UIDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_UIDS} uids per request")
+    try:
+        return list(dict.fromkeys(str(uuid.UUID(u)) for u in values))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid uid in rentalUids")
+
+async def close_rentals(rental_uids: list, username: str, status: str) -> dict:
+    async with db_pool.connection() as conn:
+        async with conn.transaction():
+            rows = await conn.fetch("""
+                UPDATE rental r SET status = $3
+                FROM (SELECT id, rental_uid, status, car_uid, payment_uid FROM rental
+                      WHERE rental_uid = ANY($1::uuid[]) AND username = $2
+                      ORDER BY id
+                      FOR UPDATE) old
+                WHERE r.id = old.id
+                RETURNING old.rental_uid, old.status, old.car_uid, old.payment_uid
+            """, rental_uids, username, status)
+            # Only a rental that still holds its car may give it back
+            released = [r[2] for r in rows if r[1] == "IN_PROGRESS"]
+            if released:
+                await enqueue_availability(conn, released, True)
+    if released:
+        outbox_relay.wake()
+    return {str(r[0]): r for r in rows}
+
+def closed_to_dict(rental_uid: str, status: str, row):
+    return {
+        "rentalUid": rental_uid,
+        "status": status,
+        "previousStatus": row[1],
+        "carUid": str(row[2]),
+        "paymentUid": str(row[3])
+    }
+
+async def close_rentals_bulk(req: RentalUidsRequest, username: str, status: str):
+    uids = normalize_uids(req.rentalUids)
+    try:
+        closed = await close_rentals(uids, username, status)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    results = []
+    for uid in uids:
+        row = closed.get(uid)
+        if row is None:
+            results.append({"rentalUid": uid, "status": "notFound"})
+        else:
+            results.append(closed_to_dict(uid, status, row))
+    return JSONResponse(content={"results": results})
+
+@app.post("/api/v1/rental/finish")
+@protected_route
+async def finish_rentals(request: Request, current_user: str, req: RentalUidsRequest):
+    return await close_rentals_bulk(req, current_user, "FINISHED")
+
+@app.post("/api/v1/rental/cancel")
+@protected_route
+async def cancel_rentals(request: Request, current_user: str, req: RentalUidsRequest):
+    return await close_rentals_bulk(req, current_user, "CANCELED")
+
 @app.post("/api/v1/rental/{rental_uid}/finish")
 @protected_route
-def finish_rental(request: Request, current_user: str, rental_uid: str):
+async def finish_rental(request: Request, current_user: str, rental_uid: str):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("UPDATE rental SET status = 'FINISHED' WHERE rental_uid = %s AND username = %s", (rental_uid, current_user))
-        if cur.rowcount == 0:
+        closed = await close_rentals([rental_uid], current_user, "FINISHED")
+        if not closed:
             raise HTTPException(status_code=404, detail="Rental not found or access denied")
-        conn.commit()
-        cur.close()
-        conn.close()
-        return JSONResponse(content={"status": "FINISHED"})
+        uid, row = next(iter(closed.items()))
+        return JSONResponse(content=closed_to_dict(uid, "FINISHED", row))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/v1/rental/{rental_uid}")
 @protected_route
-def cancel_rental(request: Request, current_user: str, rental_uid: str):
+async def cancel_rental(request: Request, current_user: str, rental_uid: str):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("UPDATE rental SET status = 'CANCELED' WHERE rental_uid = %s AND username = %s", (rental_uid, current_user))
-        if cur.rowcount == 0:
+        closed = await close_rentals([rental_uid], current_user, "CANCELED")
+        if not closed:
             raise HTTPException(status_code=404, detail="Rental not found or access denied")
-        conn.commit()
-        cur.close()
-        conn.close()
-        return JSONResponse(content={"status": "CANCELED"})
+        uid, row = next(iter(closed.items()))
+        return JSONResponse(content=closed_to_dict(uid, "CANCELED", row))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
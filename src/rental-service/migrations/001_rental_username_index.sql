@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+DROP INDEX CONCURRENTLY IF EXISTS rental_username_id_idx;
+CREATE INDEX CONCURRENTLY rental_username_id_idx ON rental (username, id);
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS rental_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    event_id UUID NOT NULL UNIQUE,
+    car_uid UUID NOT NULL,
+    available BOOLEAN NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS rental_outbox_next_attempt_idx ON rental_outbox (next_attempt_at, id);
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import uuid
+
+import httpx
+
+from auth_service.auth import INTERNAL_AUTH_SECRET, forward_headers
+from instrumentation.tracing import inject, tracer
+
+RELAY_IDENTITY = "rental-service"
+AVAILABILITY_PATH = "/api/v1/cars/availability"
+
+
+async def enqueue_availability(conn, car_uids: list, available: bool):
+    await conn.execute("""
+        INSERT INTO rental_outbox (event_id, car_uid, available)
+        SELECT event_id, car_uid, $3 FROM unnest($1::uuid[], $2::uuid[]) AS u(event_id, car_uid)
+    """, [uuid.uuid4() for _ in car_uids], car_uids, available)
+
+
+class OutboxRelay:
+    def __init__(
+        self,
+        db_pool,
+        car_service_url: str,
+        batch_size: int = 100,
+        interval: float = 1.0,
+        max_backoff: float = 60.0,
+        timeout: float = 5.0,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.db_pool = db_pool
+        self.car_service_url = car_service_url
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.transport = transport
+        # A claimed batch is hidden from other relays until delivery has had time to finish
+        self.lease = 2 * timeout + interval
+        self._client = None
+        self._task = None
+        self._wake = asyncio.Event()
+        self.delivered_total = 0
+        self.duplicates_total = 0
+        self.not_found_total = 0
+        self.failed_batches_total = 0
+        self.last_error = None
+
+    @classmethod
+    def from_env(cls, db_pool) -> "OutboxRelay":
+        return cls(
+            db_pool,
+            os.environ.get("CAR_SERVICE_URL", "http://car-service:8070"),
+            batch_size=int(os.environ.get("OUTBOX_BATCH_SIZE", "100")),
+            interval=float(os.environ.get("OUTBOX_POLL_INTERVAL", "1")),
+            max_backoff=float(os.environ.get("OUTBOX_MAX_BACKOFF", "60")),
+            timeout=float(os.environ.get("OUTBOX_TIMEOUT", "5")),
+        )
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.car_service_url, timeout=self.timeout, transport=self.transport
+            )
+        return self._client
+
+    def wake(self):
+        self._wake.set()
+
+    async def start(self):
+        if not INTERNAL_AUTH_SECRET:
+            logging.warning("INTERNAL_AUTH_SECRET is not set, car-service will reject outbox deliveries")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                sent = await self.relay_once()
+            except Exception as e:
+                logging.warning(f"Outbox relay failed: {e}")
+                sent = 0
+            if sent >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def relay_once(self) -> int:
+        rows = await self.claim()
+        if not rows:
+            return 0
+        ids = [r[0] for r in rows]
+        # Delivery runs outside any transaction; the lease keeps other relays off the rows
+        try:
+            results = await self.deliver(rows)
+        except Exception as e:
+            self.failed_batches_total += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            logging.warning(f"Delivering {len(rows)} outbox events failed: {e}")
+            await self.db_pool.execute("""
+                UPDATE rental_outbox
+                SET attempts = attempts + 1,
+                    next_attempt_at = now() + make_interval(secs => least($2 * power(2, attempts), $3))
+                WHERE id = ANY($1::bigint[])
+            """, ids, self.interval, self.max_backoff)
+            return 0
+        await self.db_pool.execute("DELETE FROM rental_outbox WHERE id = ANY($1::bigint[])", ids)
+        for result in results:
+            if result["status"] == "duplicate":
+                self.duplicates_total += 1
+            elif result["status"] == "notFound":
+                self.not_found_total += 1
+                logging.warning(f"Outbox event {result['eventId']} refers to an unknown car")
+        self.delivered_total += len(rows)
+        return len(rows)
+
+    async def claim(self) -> list:
+        rows = await self.db_pool.fetch("""
+            UPDATE rental_outbox SET next_attempt_at = now() + make_interval(secs => $2)
+            WHERE id IN (
+                SELECT id FROM rental_outbox
+                WHERE next_attempt_at <= now()
+                ORDER BY id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, event_id, car_uid, available
+        """, self.batch_size, self.lease)
+        return sorted(rows, key=lambda r: r[0])
+
+    async def deliver(self, rows) -> list:
+        events = [{"eventId": str(r[1]), "carUid": str(r[2]), "available": r[3]} for r in rows]
+        with tracer.span("outbox.deliver", "client", events=len(events)):
+            response = await self.client().post(
+                AVAILABILITY_PATH,
+                json={"events": events},
+                headers=inject(forward_headers(None, RELAY_IDENTITY))
+            )
+            response.raise_for_status()
+            return response.json()["results"]
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "deliveredTotal": self.delivered_total,
+            "duplicatesTotal": self.duplicates_total,
+            "notFoundTotal": self.not_found_total,
+            "failedBatchesTotal": self.failed_batches_total,
+            "lastError": self.last_error,
+        }
@@ -1,6 +1,13 @@
+import asyncio
+import json
+import uuid
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
-from main import app
+
+from main import app, rental_filters
+from outbox import OutboxRelay
 
 client = TestClient(app)
 
@@ -38,3 +45,80 @@ def test_cancel_rental_without_auth():
     response = client.delete("/api/v1/rental/test-uuid")
     assert response.status_code == 401
     assert "detail" in response.json()
+
+def test_rental_filters():
+    conditions, args = rental_filters("alice", "finished, canceled", "2024-01-01", None)
+    assert conditions == ["username = $1", "status = ANY($2::text[])", "date_to >= $3"]
+    assert args[:2] == ["alice", ["FINISHED", "CANCELED"]]
+    assert str(args[2]) == "2024-01-01"
+
+def test_invalid_filters_are_rejected(login):
+    login()
+    status = client.get("/api/v1/rental?status=LOST")
+    date_to = client.get("/api/v1/rental?dateTo=tomorrow")
+    cursor = client.get("/api/v1/rental?cursor=not-a-cursor")
+    assert status.status_code == 400
+    assert date_to.json()["detail"] == "Invalid dateTo"
+    assert cursor.json()["detail"] == "Invalid cursor"
+
+def test_outbox_delivers_events_as_one_batch():
+
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        events = json.loads(request.content)["events"]
+        return httpx.Response(200, json={"results": [{"eventId": e["eventId"], "status": "applied"} for e in events]})
+
+    relay = OutboxRelay(None, "http://cars.test", transport=httpx.MockTransport(handler))
+    rows = [(1, uuid.uuid4(), uuid.uuid4(), True), (2, uuid.uuid4(), uuid.uuid4(), True)]
+
+    async def scenario():
+        try:
+            return await relay.deliver(rows)
+        finally:
+            await relay.stop()
+
+    results = asyncio.run(scenario())
+    assert len(requests) == 1
+    assert requests[0].url.path == "/api/v1/cars/availability"
+    assert json.loads(requests[0].content)["events"][1] == {
+        "eventId": str(rows[1][1]), "carUid": str(rows[1][2]), "available": True
+    }
+    assert [r["status"] for r in results] == ["applied", "applied"]
+
+def test_outbox_delivers_without_holding_a_database_transaction():
+
+    calls = []
+    rows = [(2, uuid.uuid4(), uuid.uuid4(), False), (1, uuid.uuid4(), uuid.uuid4(), True)]
+
+    class Pool:
+        async def fetch(self, query, *args):
+            calls.append("claim")
+            return rows
+
+        async def execute(self, query, *args):
+            calls.append(query.split()[0])
+            assert args[0] == [1, 2]
+
+    def handler(request: httpx.Request):
+        calls.append("deliver")
+        return httpx.Response(503) if len(calls) > 3 else httpx.Response(200, json={"results": []})
+
+    relay = OutboxRelay(Pool(), "http://cars.test", transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        try:
+            return await relay.relay_once(), await relay.relay_once()
+        finally:
+            await relay.stop()
+
+    assert asyncio.run(scenario()) == (2, 0)
+    assert calls == ["claim", "deliver", "DELETE", "claim", "deliver", "UPDATE"]
+    assert relay.failed_batches_total == 1
+
+def test_bulk_close_validates_uids(login):
+    login()
+    response = client.post("/api/v1/rental/finish", json={"rentalUids": ["not-a-uuid"]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid uid in rentalUids"